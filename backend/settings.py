@@ -102,6 +102,72 @@ REST_FRAMEWORK = {
     },
 }
 
+# Индекс рейтинга (leaderboard)
+# При нескольких воркерах gunicorn нужен общий sorted set на Redis
+# (RANK_INDEX_REDIS_URL, по умолчанию REDIS_URL). Skip-list в памяти процесса -
+# только для одного процесса (runserver, тесты): копии в разных воркерах
+# расходятся до перечитывания из БД раз в RANK_INDEX_MAX_AGE секунд
+RANK_INDEX = {
+    'BACKEND': 'core.rank_index.SkipListRankIndex',
+    'OPTIONS': {
+        'max_age': int(os.getenv('RANK_INDEX_MAX_AGE', '60')),
+    },
+}
+
+if os.getenv('RANK_INDEX_REDIS_URL') or os.getenv('REDIS_URL'):
+    RANK_INDEX = {
+        'BACKEND': 'core.rank_index.RedisRankIndex',
+        'OPTIONS': {
+            'url': os.getenv('RANK_INDEX_REDIS_URL') or os.getenv('REDIS_URL'),
+        },
+    }
+
+# Пул запросов к AI (core.ai_executor)
+# MODEL_FACTORY - функция model_name -> модель с generate_content(prompt);
+# для локальной разработки и тестов ее можно заменить заглушкой
+AI_EXECUTOR = {
+    'MODEL_FACTORY': os.getenv('AI_MODEL_FACTORY', 'core.ai_helper.gemini_model'),
+    'MAX_WORKERS': int(os.getenv('AI_MAX_WORKERS', '4')),
+    'MAX_PENDING': int(os.getenv('AI_MAX_PENDING', '32')),
+    'TIMEOUT': float(os.getenv('AI_TIMEOUT', '25')),
+}
+
+# Постоянное хранилище ответов AI (core.ai_store)
+# Вытеснение из БД - командой prune_ai_responses (например, раз в сутки по cron)
+AI_STORE = {
+    'MEMORY_MAX_BYTES': int(os.getenv('AI_STORE_MEMORY_MAX_BYTES', str(8 * 1024 * 1024))),
+    'MAX_AGE_DAYS': int(os.getenv('AI_STORE_MAX_AGE_DAYS', '90')),
+    'MAX_BYTES': int(os.getenv('AI_STORE_MAX_BYTES', str(512 * 1024 * 1024))),
+}
+
+# Дельта-синхронизация мобильного приложения (core.sync)
+# Записи об удалениях старше DELETION_RETENTION_DAYS удаляет команда
+# prune_catalog_deletions; клиенты с более старым токеном получают полный снимок
+SYNC = {
+    'DELETION_RETENTION_DAYS': int(os.getenv('SYNC_DELETION_RETENTION_DAYS', '90')),
+}
+
+# Офлайн-пакеты тем для мобильного приложения (core.topic_packs)
+TOPIC_PACK_DIR = os.getenv('TOPIC_PACK_DIR', os.path.join(BASE_DIR, 'var', 'packs'))
+
+# Отрендеренные OG-картинки задач (core.og_images)
+OG_IMAGE_DIR = os.getenv('OG_IMAGE_DIR', os.path.join(BASE_DIR, 'var', 'og'))
+
+# Собранные sitemap (core.sitemap)
+SITEMAP_DIR = os.getenv('SITEMAP_DIR', os.path.join(BASE_DIR, 'var', 'sitemaps'))
+
+# Журнал ответов (core.answer_events). При ASYNC отправка ответа - одна
+# вставка в AnswerEvent, а попытки, XP и рейтинг обновляет фоновый
+# процесс: python manage.py fold_answer_events --watch 5
+ANSWER_EVENTS = {
+    'ASYNC': os.getenv('ANSWER_EVENTS_ASYNC', '0') == '1',
+    'FOLD_BATCH': int(os.getenv('ANSWER_EVENTS_FOLD_BATCH', '1000')),
+}
+
+# Версия кода для ETag страниц и API (core.conditional): после деплоя с
+# новыми шаблонами клиенты не должны получать 304 на старые ответы
+RELEASE_VERSION = os.getenv('RELEASE_VERSION') or os.getenv('RAILWAY_GIT_COMMIT_SHA', '')
+
 # JWT Settings
 from datetime import timedelta
 
@@ -202,6 +268,39 @@ DATABASES = {
 }
 
 
+# Cache
+# Общий кэш для всех воркеров gunicorn: Redis (если задан REDIS_URL),
+# иначе файловый кэш на локальном диске
+CACHE_VERSION = int(os.getenv('CACHE_VERSION', '1'))
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+            'KEY_PREFIX': 'hushyor',
+            'VERSION': CACHE_VERSION,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR', os.path.join(BASE_DIR, 'var', 'cache')),
+            'KEY_PREFIX': 'hushyor',
+            'VERSION': CACHE_VERSION,
+            'TIMEOUT': 300,
+            'OPTIONS': {
+                'MAX_ENTRIES': 20000,
+            },
+        }
+    }
+
+# Кэш для счетчиков rate limiting (core.ratelimit); должен быть общим для
+# воркеров, поэтому не LocMemCache
+RATELIMIT_CACHE = 'default'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
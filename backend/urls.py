@@ -35,11 +35,13 @@ urlpatterns = [
     
     # ==================== SEO ====================
     path('sitemap.xml', views.sitemap_view, name='sitemap'),
+    path('sitemap-<int:number>.xml', views.sitemap_section_view, name='sitemap_section'),
     path('robots.txt', views.robots_txt_view, name='robots'),
     path('yandex_f58006ecd2f5e538.html', views.yandex_verification_view, name='yandex_verification'),
     
     # ==================== i18n ====================
     path('i18n/', include('django.conf.urls.i18n')),
+    path('language/<str:language>/', views.language_view, name='language'),
     
     # ==================== HTML Views (существующий сайт) ====================
     path('', views.main_view, name='main'),
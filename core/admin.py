@@ -4,7 +4,12 @@ from django.contrib.auth.models import User
 from django.urls import path
 from django.shortcuts import render, redirect
 from django.contrib import messages
-from .models import Subject, Topic, Task, UserProfile, Leaderboard, UserProgress, TaskAttempt
+from django.utils import timezone
+from .models import Subject, Topic, Task, UserProfile, Leaderboard, UserProgress, UserTopicProgress, TaskAttempt, TaskAIContent, AIResponse, AnswerEvent
+from .caching import invalidate_catalog
+from .navigation import invalidate_topic_navigation
+from .progress import reconciling
+from .sync import next_sequence
 
 # Расширяем стандартную админку пользователей
 class CustomUserAdmin(BaseUserAdmin):
@@ -64,6 +69,15 @@ class TopicAdmin(admin.ModelAdmin):
     def task_count(self, obj):
         return obj.tasks.count()
     task_count.short_description = 'Количество задач'
+    
+    # Задачи темы удаляются каскадом: счетчики предметов у решивших их пересчитываются
+    def delete_model(self, request, obj):
+        with reconciling(Task.objects.filter(topic=obj)):
+            super().delete_model(request, obj)
+    
+    def delete_queryset(self, request, queryset):
+        with reconciling(Task.objects.filter(topic__in=queryset)):
+            super().delete_queryset(request, queryset)
 
 @admin.register(Task)
 class TaskAdmin(admin.ModelAdmin):
@@ -78,6 +92,14 @@ class TaskAdmin(admin.ModelAdmin):
         return obj.question[:50] + '...' if len(obj.question) > 50 else obj.question
     question_preview.short_description = 'Вопрос'
     
+    def delete_model(self, request, obj):
+        with reconciling(Task.objects.filter(pk=obj.pk)):
+            super().delete_model(request, obj)
+    
+    def delete_queryset(self, request, queryset):
+        with reconciling(queryset):
+            super().delete_queryset(request, queryset)
+    
     def change_subject_action(self, request, queryset):
         """Массовое изменение предмета для выбранных задач"""
         if 'apply' in request.POST:
@@ -89,7 +111,10 @@ class TaskAdmin(admin.ModelAdmin):
             
             try:
                 new_subject = Subject.objects.get(pk=subject_id)
-                count = queryset.update(subject=new_subject)
+                # update() не вызывает save(): без sync_seq перенос не попадет в дельту синхронизации
+                with reconciling(queryset):
+                    count = queryset.update(subject=new_subject, updated_at=timezone.now(), sync_seq=next_sequence())
+                invalidate_catalog()
                 
                 self.message_user(
                     request, 
@@ -121,7 +146,11 @@ class TaskAdmin(admin.ModelAdmin):
             
             try:
                 new_topic = Topic.objects.get(pk=topic_id)
-                count = queryset.update(topic=new_topic)
+                old_topic_ids = set(queryset.values_list('topic_id', flat=True))
+                with reconciling(queryset):
+                    count = queryset.update(topic=new_topic, updated_at=timezone.now(), sync_seq=next_sequence())
+                invalidate_topic_navigation(new_topic.id, *old_topic_ids)
+                invalidate_catalog()
                 
                 self.message_user(
                     request, 
@@ -168,6 +197,12 @@ class UserProgressAdmin(admin.ModelAdmin):
         return f"{obj.progress_percentage}%"
     progress_percentage.short_description = 'Прогресс'
 
+@admin.register(UserTopicProgress)
+class UserTopicProgressAdmin(admin.ModelAdmin):
+    list_display = ('user', 'topic', 'completed_tasks')
+    list_filter = ('topic__subject',)
+    search_fields = ('user__username', 'topic__title')
+
 @admin.register(TaskAttempt)
 class TaskAttemptAdmin(admin.ModelAdmin):
     list_display = ('user', 'task_preview', 'attempts', 'is_solved', 'points_earned', 'updated_at')
@@ -178,3 +213,28 @@ class TaskAttemptAdmin(admin.ModelAdmin):
     def task_preview(self, obj):
         return obj.task.question[:50] + '...' if len(obj.task.question) > 50 else obj.task.question
     task_preview.short_description = 'Задача'
+
+@admin.register(TaskAIContent)
+class TaskAIContentAdmin(admin.ModelAdmin):
+    list_display = ('task', 'kind', 'language', 'updated_at')
+    list_filter = ('kind', 'language')
+    search_fields = ('task__question', 'text')
+    raw_id_fields = ('task',)
+
+@admin.register(AIResponse)
+class AIResponseAdmin(admin.ModelAdmin):
+    list_display = ('key', 'kind', 'size', 'hits', 'last_used_at')
+    list_filter = ('kind',)
+    search_fields = ('key', 'text')
+    ordering = ('-last_used_at',)
+
+@admin.register(AnswerEvent)
+class AnswerEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'task', 'is_correct', 'folded', 'created_at')
+    list_filter = ('is_correct', 'folded')
+    raw_id_fields = ('user', 'task')
+    ordering = ('-id',)
+    
+    # Журнал только дополняется
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,166 @@
+"""
+Заранее сгенерированные теория и подсказки к задачам
+
+Тексты хранятся в TaskAIContent по (задача, вид, язык) вместе с хэшем
+входных данных промпта. Если задача или промпт изменились, хэш не совпадет
+и запись будет сгенерирована заново командой pregenerate_ai_content.
+
+На странице задачи текст берется из БД, и запрос никогда не ждет модель:
+если текста еще нет, генерация ставится в пул AI (core.ai_executor), ее
+результат сохраняется в фоне, а пользователь сразу получает сообщение,
+что материал готовится.
+"""
+import hashlib
+import logging
+
+from . import ai_helper
+
+logger = logging.getLogger(__name__)
+
+THEORY = 'theory'
+HINT = 'hint'
+KINDS = (THEORY, HINT)
+LANGUAGES = ('ru', 'tg')
+
+# Увеличить при изменении промптов в ai_helper - все записи станут устаревшими
+PROMPT_VERSION = 1
+
+PROMPTS = {
+    THEORY: ai_helper.theory_prompt,
+    HINT: ai_helper.hint_prompt,
+}
+
+
+def normalize_language(language):
+    """Язык интерфейса -> язык контента ('ru' или 'tg')"""
+    return language if language in LANGUAGES else 'ru'
+
+
+def content_hash(kind, task_question, task_subject, language):
+    """
+    Хэш входных данных промпта
+
+    Returns:
+        str: sha256 в hex
+    """
+    raw = '\0'.join([str(PROMPT_VERSION), kind, language, task_subject, task_question])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def build_prompt(kind, task_question, task_subject, language):
+    return PROMPTS[kind](task_question, task_subject, language)
+
+
+def get_stored(task, kind, language):
+    """
+    Актуальный сохраненный текст
+
+    Args:
+        task: Task (нужны question и subject.title)
+        kind: THEORY или HINT
+        language: 'ru' или 'tg'
+
+    Returns:
+        str | None: Текст или None, если записи нет или она устарела
+    """
+    from .models import TaskAIContent
+
+    row = (
+        TaskAIContent.objects
+        .filter(task_id=task.id, kind=kind, language=language)
+        .values_list('content_hash', 'text')
+        .first()
+    )
+    if row and row[0] == content_hash(kind, task.question, task.subject.title, language):
+        return row[1]
+    return None
+
+
+def store(task_id, kind, language, digest, text):
+    """Сохранение сгенерированного текста (перезаписывает устаревший)"""
+    from .models import TaskAIContent
+
+    TaskAIContent.objects.update_or_create(
+        task_id=task_id, kind=kind, language=language,
+        defaults={'content_hash': digest, 'text': text},
+    )
+
+
+def get_content(task, kind, language):
+    """
+    Теория или подсказка для страницы задачи
+
+    Сначала БД, затем хранилище ответов AI (core.ai_store). Если текста
+    нет нигде, генерация ставится в пул без ожидания и сохранится в БД,
+    когда модель ответит.
+
+    Returns:
+        str: Текст, ai_helper.PREPARING_MESSAGE или сообщение об ошибке
+    """
+    from . import ai_store
+    from .ai_executor import DEFAULT_MODEL, AIBusyError, get_executor
+
+    language = normalize_language(language)
+    text = get_stored(task, kind, language)
+    if text is not None:
+        return text
+
+    digest = content_hash(kind, task.question, task.subject.title, language)
+    task_id = task.id
+
+    def persist(generated):
+        try:
+            store(task_id, kind, language, digest, generated)
+        except Exception as e:
+            logger.error(f"Failed to store AI {kind} for task {task_id}: {e}", exc_info=True)
+
+    if not ai_helper.is_configured():
+        return ai_helper.NOT_CONFIGURED_MESSAGE
+
+    # Тот же ключ, что у ai_helper.get_theory_lesson / get_hint
+    store_key = ai_store.make_key(kind, DEFAULT_MODEL, task.question, task.subject.title, language)
+    text = ai_store.get(store_key)
+    if text:
+        persist(text)
+        return text
+
+    def remember(generated):
+        ai_store.put(store_key, kind, generated)
+        persist(generated)
+
+    logger.info(f"AI {kind} for task {task_id} ({language}) is not pregenerated yet, queued")
+    try:
+        get_executor().generate_later(build_prompt(kind, task.question, task.subject.title, language), on_result=remember)
+    except AIBusyError:
+        logger.warning("AI executor queue is full")
+        return ai_helper.BUSY_MESSAGE
+    return ai_helper.PREPARING_MESSAGE
+
+
+def iter_pending(tasks, kinds=KINDS, languages=LANGUAGES):
+    """
+    Задания на генерацию: отсутствующие и устаревшие тексты
+
+    Args:
+        tasks: Итерируемое Task с загруженным subject
+        kinds: Виды контента
+        languages: Языки
+
+    Yields:
+        tuple: (task_id, kind, language, content_hash, prompt)
+    """
+    from .models import TaskAIContent
+
+    existing = {
+        (task_id, kind, language): digest
+        for task_id, kind, language, digest in TaskAIContent.objects.filter(
+            kind__in=kinds, language__in=languages,
+        ).values_list('task_id', 'kind', 'language', 'content_hash').iterator()
+    }
+
+    for task in tasks:
+        for kind in kinds:
+            for language in languages:
+                digest = content_hash(kind, task.question, task.subject.title, language)
+                if existing.get((task.id, kind, language)) != digest:
+                    yield task.id, kind, language, digest, build_prompt(kind, task.question, task.subject.title, language)
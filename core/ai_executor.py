@@ -0,0 +1,229 @@
+"""
+Выполнение запросов к AI вне потока запроса
+
+- Генерация идет в ограниченном пуле потоков: медленный ответ Gemini
+  не может занять больше MAX_WORKERS потоков, а запрос пользователя
+  ждет не дольше TIMEOUT секунд.
+- Одинаковые запросы, которые уже выполняются, объединяются: если
+  несколько учеников одновременно открыли теорию к одной задаче,
+  в Gemini уйдет один запрос, а результат получат все.
+- Если очередь переполнена (MAX_PENDING), запрос сразу отклоняется
+  с AIBusyError вместо того, чтобы копиться в памяти.
+- Соединения Django с БД привязаны к потоку, а потоки пула живут долго,
+  поэтому после каждого задания (on_result пишет в БД) соединения потока
+  закрываются, как в конце HTTP-запроса.
+
+Модель создается фабрикой из settings.AI_EXECUTOR['MODEL_FACTORY'],
+поэтому в тестах и локально Gemini подменяется заглушкой.
+"""
+import concurrent.futures
+import hashlib
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = 'gemini-2.5-flash'
+
+DEFAULT_AI_EXECUTOR = {
+    'MODEL_FACTORY': 'core.ai_helper.gemini_model',
+    'MAX_WORKERS': 4,
+    'MAX_PENDING': 32,
+    'TIMEOUT': 25,
+}
+
+
+class AIExecutorError(Exception):
+    """Базовая ошибка выполнения запроса к AI"""
+
+
+class AIBusyError(AIExecutorError):
+    """Очередь запросов к AI переполнена"""
+
+
+class AITimeoutError(AIExecutorError):
+    """AI не ответил за отведенное время"""
+
+
+def get_config():
+    """Настройки исполнителя с учетом значений по умолчанию"""
+    return {**DEFAULT_AI_EXECUTOR, **getattr(settings, 'AI_EXECUTOR', {})}
+
+
+def get_model(model_name=DEFAULT_MODEL):
+    """
+    Модель, созданная фабрикой из настроек
+
+    Args:
+        model_name: Имя модели
+
+    Returns:
+        Объект с методом generate_content(prompt), ответ которого имеет .text
+    """
+    return import_string(get_config()['MODEL_FACTORY'])(model_name)
+
+
+def prompt_key(prompt, model_name=DEFAULT_MODEL):
+    """Ключ для объединения одинаковых запросов"""
+    return hashlib.sha256(f'{model_name}\0{prompt}'.encode()).hexdigest()
+
+
+def _generation(prompt, model_name, on_result):
+    def call():
+        text = get_model(model_name).generate_content(prompt).text
+        if on_result is not None:
+            on_result(text)
+        return text
+
+    return call
+
+
+def _run_job(func):
+    try:
+        return func()
+    finally:
+        connections.close_all()
+
+
+class AIExecutor:
+    """
+    Ограниченный пул потоков с объединением одинаковых запросов
+
+    Args:
+        max_workers: Максимум одновременных запросов к модели
+        max_pending: Максимум запросов в работе и в очереди
+        timeout: Сколько секунд вызывающий поток ждет результат
+    """
+
+    def __init__(self, max_workers=4, max_pending=32, timeout=25):
+        self.timeout = timeout
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ai')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, func):
+        """
+        Запуск func в пуле или присоединение к уже выполняющемуся запросу
+
+        Args:
+            key: Ключ запроса (одинаковые ключи объединяются)
+            func: Функция без аргументов
+
+        Returns:
+            concurrent.futures.Future
+
+        Raises:
+            AIBusyError: Если очередь переполнена
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                logger.debug(f"Coalesced AI request {key[:12]}")
+                return future
+
+            if not self._slots.acquire(blocking=False):
+                raise AIBusyError('AI queue is full')
+            try:
+                future = self._pool.submit(_run_job, func)
+            except Exception:
+                self._slots.release()
+                raise
+            self._inflight[key] = future
+
+        future.add_done_callback(lambda done: self._finish(key, done))
+        return future
+
+    def _finish(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        self._slots.release()
+
+    def run(self, key, func, timeout=None):
+        """
+        Выполнение func в пуле с ожиданием результата
+
+        При таймауте запрос продолжает выполняться в пуле, так что
+        следующий вызов с тем же ключом присоединится к нему.
+
+        Raises:
+            AIBusyError: Если очередь переполнена
+            AITimeoutError: Если результат не получен за timeout секунд
+        """
+        future = self.submit(key, func)
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError as e:
+            raise AITimeoutError(f'AI request timed out after {timeout}s') from e
+
+    def generate(self, prompt, model_name=DEFAULT_MODEL, on_result=None, timeout=None):
+        """
+        Генерация текста моделью
+
+        Args:
+            prompt: Текст запроса
+            model_name: Имя модели
+            on_result: Функция text -> None, вызывается в пуле после успешной
+                генерации (например, для кэширования). Для объединенных
+                запросов вызывается один раз
+            timeout: Время ожидания (по умолчанию self.timeout)
+
+        Returns:
+            str: Ответ модели
+        """
+        return self.run(prompt_key(prompt, model_name), _generation(prompt, model_name, on_result), timeout=timeout)
+
+    def generate_later(self, prompt, model_name=DEFAULT_MODEL, on_result=None):
+        """
+        Постановка генерации в пул без ожидания результата
+
+        Args:
+            prompt: Текст запроса
+            model_name: Имя модели
+            on_result: Функция text -> None, вызывается в пуле после успешной генерации
+
+        Returns:
+            concurrent.futures.Future
+
+        Raises:
+            AIBusyError: Если очередь переполнена
+        """
+        return self.submit(prompt_key(prompt, model_name), _generation(prompt, model_name, on_result))
+
+    def inflight_count(self):
+        """Количество выполняющихся запросов"""
+        with self._lock:
+            return len(self._inflight)
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Исполнитель, настроенный в settings.AI_EXECUTOR (один на процесс)
+
+    Returns:
+        AIExecutor
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                config = get_config()
+                _executor = AIExecutor(
+                    max_workers=config['MAX_WORKERS'],
+                    max_pending=config['MAX_PENDING'],
+                    timeout=config['TIMEOUT'],
+                )
+    return _executor
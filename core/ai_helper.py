@@ -10,35 +10,66 @@ GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 if GEMINI_API_KEY and GEMINI_API_KEY != 'your-gemini-api-key-here':
     genai.configure(api_key=GEMINI_API_KEY)
 
-def get_theory_lesson(task_question, task_subject, language='ru'):
+NOT_CONFIGURED_MESSAGE = "⚠️ API ключ Gemini не настроен. Добавьте GEMINI_API_KEY в файл .env"
+BUSY_MESSAGE = "⚠️ AI помощник сейчас перегружен. Попробуйте через минуту."
+TIMEOUT_MESSAGE = "⚠️ AI помощник не успел ответить. Попробуйте еще раз через минуту."
+PREPARING_MESSAGE = "⏳ Материал к этой задаче еще готовится. Откройте его снова через минуту."
+
+
+def gemini_model(model_name):
+    """Фабрика моделей по умолчанию (settings.AI_EXECUTOR['MODEL_FACTORY'])"""
+    return genai.GenerativeModel(model_name)
+
+
+def is_configured():
+    """Можно ли обращаться к модели: задан ключ Gemini или подменена фабрика"""
+    from .ai_executor import DEFAULT_AI_EXECUTOR, get_config
+    
+    if get_config()['MODEL_FACTORY'] != DEFAULT_AI_EXECUTOR['MODEL_FACTORY']:
+        return True
+    return bool(GEMINI_API_KEY) and GEMINI_API_KEY != 'your-gemini-api-key-here'
+
+
+def _generate(prompt, store_key=None, kind=None, on_result=None):
     """
-    Генерирует короткий урок с теорией и примерами для задачи
-    language: 'ru' для русского, 'tg' для таджикского
+    Генерация через пул AI (core.ai_executor) с объединением одинаковых запросов
+    
+    Args:
+        prompt: Текст запроса
+        store_key: Ключ в хранилище ответов (core.ai_store); ответ сохраняется
+            в пуле, даже если пользователь не дождался результата
+        kind: Вид ответа для хранилища
+        on_result: Дополнительная функция text -> None после успешной генерации
+    
+    Returns:
+        str: Ответ модели или сообщение о перегрузке/таймауте
     """
     import logging
-    import hashlib
-    from django.core.cache import cache
+    from . import ai_store
+    from .ai_executor import AIBusyError, AITimeoutError, get_executor
     
     logger = logging.getLogger(__name__)
     
-    if not GEMINI_API_KEY or GEMINI_API_KEY == 'your-gemini-api-key-here':
-        logger.warning("Gemini API key not configured")
-        return "⚠️ API ключ Gemini не настроен. Добавьте GEMINI_API_KEY в файл .env"
-    
-    # Кэширование ответов с учетом языка
-    cache_key = hashlib.md5(f"theory_{task_question}_{task_subject}_{language}".encode()).hexdigest()
-    cached = cache.get(cache_key)
-    if cached:
-        logger.debug(f"Returning cached theory for {task_subject} in {language}")
-        return cached
+    def remember(text):
+        if store_key:
+            ai_store.put(store_key, kind, text)
+        if on_result is not None:
+            on_result(text)
     
     try:
-        logger.info(f"Generating theory lesson for subject: {task_subject} in language: {language}")
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
-        # Выбираем язык для промпта
-        if language == 'tg':
-            prompt = f"""Шумо омӯзгори ботаҷриба аз фанни "{task_subject}" ҳастед. Хонанда барои имтиҳон омода мешавад ва вақти зиёд надорад.
+        return get_executor().generate(prompt, on_result=remember)
+    except AIBusyError:
+        logger.warning("AI executor queue is full")
+        return BUSY_MESSAGE
+    except AITimeoutError as e:
+        logger.warning(f"AI request timed out: {e}")
+        return TIMEOUT_MESSAGE
+
+
+def theory_prompt(task_question, task_subject, language='ru'):
+    """Промпт для короткого урока с теорией (language: 'ru' или 'tg')"""
+    if language == 'tg':
+        return f"""Шумо омӯзгори ботаҷриба аз фанни "{task_subject}" ҳастед. Хонанда барои имтиҳон омода мешавад ва вақти зиёд надорад.
 
 Масъала: {task_question}
 
@@ -51,8 +82,8 @@ def get_theory_lesson(task_question, task_subject, language='ru'):
 ✅ Тарзи ҳал: [1-2 ҷумла - қадамҳои асосӣ]
 
 МУҲИМ: Кӯтоҳ ва равшан нависед! Хонанда вақт надорад."""
-        else:
-            prompt = f"""Ты - преподаватель по предмету "{task_subject}". Ученик готовится к экзамену и у него мало времени.
+
+    return f"""Ты - преподаватель по предмету "{task_subject}". Ученик готовится к экзамену и у него мало времени.
 
 Задача: {task_question}
 
@@ -66,11 +97,62 @@ def get_theory_lesson(task_question, task_subject, language='ru'):
 
 ВАЖНО: Пиши кратко и понятно! У ученика нет времени на длинные тексты."""
 
-        response = model.generate_content(prompt)
-        result = response.text
-        
-        # Кэшируем на 24 часа
-        cache.set(cache_key, result, 86400)
+
+def hint_prompt(task_question, task_subject, language='ru'):
+    """Промпт для подсказки - первого шага решения (language: 'ru' или 'tg')"""
+    if language == 'tg':
+        return f"""Шумо омӯзгори ботаҷриба аз фанни "{task_subject}" ҳастед.
+
+Масъалаи хонанда: {task_question}
+
+ТАНҲО қадами аввали ҳалли ин масъаларо диҳед. Масъаларо пурра ҳал накунед, балки маслиҳат диҳед:
+- Аз чӣ оғоз кардан лозим аст
+- Кадом формула ё усулро истифода бурдан лозим аст
+- Ба чӣ диққат додан лозим аст
+
+Ҷавоб бояд кӯтоҳ (2-3 ҷумла) ва ба забони тоҷикӣ бошад."""
+
+    return f"""Ты - опытный преподаватель по предмету "{task_subject}".
+
+Задача ученика: {task_question}
+
+Дай ТОЛЬКО первый шаг решения этой задачи. Не решай полностью, а подскажи:
+- С чего начать
+- Какую формулу или метод использовать
+- На что обратить внимание
+
+Ответ должен быть кратким (2-3 предложения) и на русском языке."""
+
+
+def get_theory_lesson(task_question, task_subject, language='ru', on_result=None):
+    """
+    Генерирует короткий урок с теорией и примерами для задачи
+    language: 'ru' для русского, 'tg' для таджикского
+    on_result: функция text -> None, вызывается после успешной генерации
+    """
+    import logging
+    from . import ai_store
+    from .ai_executor import DEFAULT_MODEL
+    
+    logger = logging.getLogger(__name__)
+    
+    if not is_configured():
+        logger.warning("Gemini API key not configured")
+        return NOT_CONFIGURED_MESSAGE
+    
+    # Постоянное хранилище ответов с учетом языка
+    store_key = ai_store.make_key(ai_store.THEORY, DEFAULT_MODEL, task_question, task_subject, language)
+    cached = ai_store.get(store_key)
+    if cached:
+        logger.debug(f"Returning cached theory for {task_subject} in {language}")
+        return cached
+    
+    try:
+        logger.info(f"Generating theory lesson for subject: {task_subject} in language: {language}")
+        prompt = theory_prompt(task_question, task_subject, language)
+
+        # Сохраняется в хранилище прямо в пуле
+        result = _generate(prompt, store_key, ai_store.THEORY, on_result)
         logger.info("Theory lesson generated successfully")
         return result
     
@@ -79,46 +161,34 @@ def get_theory_lesson(task_question, task_subject, language='ru'):
         return f"⚠️ Ошибка при генерации теории. Попробуйте позже."
 
 
-def get_hint(task_question, task_subject):
+def get_hint(task_question, task_subject, language='ru', on_result=None):
     """
     Генерирует подсказку - первый шаг решения задачи
+    language: 'ru' для русского, 'tg' для таджикского
+    on_result: функция text -> None, вызывается после успешной генерации
     """
     import logging
-    import hashlib
-    from django.core.cache import cache
+    from . import ai_store
+    from .ai_executor import DEFAULT_MODEL
     
     logger = logging.getLogger(__name__)
     
-    if not GEMINI_API_KEY or GEMINI_API_KEY == 'your-gemini-api-key-here':
+    if not is_configured():
         logger.warning("Gemini API key not configured")
-        return "⚠️ API ключ Gemini не настроен. Добавьте GEMINI_API_KEY в файл .env"
+        return NOT_CONFIGURED_MESSAGE
     
-    # Кэширование
-    cache_key = hashlib.md5(f"hint_{task_question}_{task_subject}".encode()).hexdigest()
-    cached = cache.get(cache_key)
+    # Постоянное хранилище ответов
+    store_key = ai_store.make_key(ai_store.HINT, DEFAULT_MODEL, task_question, task_subject, language)
+    cached = ai_store.get(store_key)
     if cached:
         logger.debug(f"Returning cached hint for {task_subject}")
         return cached
     
     try:
-        logger.info(f"Generating hint for subject: {task_subject}")
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
-        prompt = f"""Ты - опытный преподаватель по предмету "{task_subject}".
-
-Задача ученика: {task_question}
-
-Дай ТОЛЬКО первый шаг решения этой задачи. Не решай полностью, а подскажи:
-- С чего начать
-- Какую формулу или метод использовать
-- На что обратить внимание
-
-Ответ должен быть кратким (2-3 предложения) и на русском языке."""
+        logger.info(f"Generating hint for subject: {task_subject} in language: {language}")
+        prompt = hint_prompt(task_question, task_subject, language)
 
-        response = model.generate_content(prompt)
-        result = response.text
-        
-        cache.set(cache_key, result, 86400)
+        result = _generate(prompt, store_key, ai_store.HINT, on_result)
         logger.info("Hint generated successfully")
         return result
     
@@ -132,17 +202,26 @@ def get_ai_response(user_message, task_question, task_subject):
     Отвечает на произвольный вопрос пользователя о задаче
     """
     import logging
+    from . import ai_store
+    from .ai_executor import DEFAULT_MODEL
     
     logger = logging.getLogger(__name__)
     
-    if not GEMINI_API_KEY or GEMINI_API_KEY == 'your-gemini-api-key-here':
+    if not is_configured():
         logger.warning("Gemini API key not configured")
-        return "⚠️ API ключ Gemini не настроен. Добавьте GEMINI_API_KEY в файл .env"
+        return NOT_CONFIGURED_MESSAGE
+    
+    # Повторяющиеся вопросы к той же задаче берем из хранилища
+    # (регистр и лишние пробелы в вопросе не учитываются)
+    normalized_message = ' '.join(user_message.split()).lower()
+    store_key = ai_store.make_key(ai_store.ANSWER, DEFAULT_MODEL, normalized_message, task_question, task_subject)
+    cached = ai_store.get(store_key)
+    if cached:
+        logger.debug(f"Returning stored AI answer for {task_subject}")
+        return cached
     
     try:
         logger.info(f"Processing AI question for subject: {task_subject}")
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
         prompt = f"""Ты - дружелюбный ИИ-помощник для подготовки к ЕГЭ по предмету "{task_subject}".
 
 Текущая задача: {task_question}
@@ -158,9 +237,9 @@ def get_ai_response(user_message, task_question, task_subject):
 
 Твой ответ:"""
 
-        response = model.generate_content(prompt)
+        result = _generate(prompt, store_key, ai_store.ANSWER)
         logger.info("AI response generated successfully")
-        return response.text
+        return result
     
     except Exception as e:
         logger.error(f"Error generating AI response: {e}", exc_info=True)
@@ -0,0 +1,348 @@
+"""
+Постоянное хранилище ответов AI
+
+Ответы адресуются хэшем входных данных (вид + модель + части запроса)
+и хранятся в таблице AIResponse, поэтому переживают деплой и перезапуск
+воркеров. Перед БД стоит LRU в памяти процесса, ограниченный по байтам.
+
+Политики вытеснения:
+- память: LRU до AI_STORE['MEMORY_MAX_BYTES'] байт на процесс;
+- БД: команда prune_ai_responses удаляет ответы, не использованные
+  дольше MAX_AGE_DAYS, и самые давно использованные сверх MAX_BYTES.
+  Она очищает LRU только своего процесса; в других воркерах удаленный
+  ответ живет в памяти не дольше TOUCH_INTERVAL - при обновлении
+  last_used_at строки уже нет, и запись выбрасывается из LRU.
+
+Счетчики hit/miss/байтов копятся в памяти процесса и раз в
+METRICS_FLUSH_INTERVAL секунд одним пакетом добавляются в общий кэш
+(общие для всех воркеров), а не двумя incr на каждое чтение. Попадания в
+памяти так же копятся в LRU и попадают в AIResponse.hits одним
+UPDATE ... SET hits = hits + n, когда запись обновляет last_used_at.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .caching import cache_lock, has_atomic_ops
+
+logger = logging.getLogger(__name__)
+
+THEORY = 'theory'
+HINT = 'hint'
+ANSWER = 'answer'
+
+DEFAULT_AI_STORE = {
+    'MEMORY_MAX_BYTES': 8 * 1024 * 1024,
+    'MAX_AGE_DAYS': 90,
+    'MAX_BYTES': 512 * 1024 * 1024,
+}
+
+# Как часто попадание в памяти обновляет last_used_at в БД (секунды)
+TOUCH_INTERVAL = 60 * 60
+
+# Как часто процесс добавляет накопленные метрики в общий кэш (секунды)
+METRICS_FLUSH_INTERVAL = 30
+
+METRICS = ('memory_hits', 'db_hits', 'misses', 'bytes_served', 'bytes_stored')
+
+
+def get_config():
+    """Настройки хранилища с учетом значений по умолчанию"""
+    return {**DEFAULT_AI_STORE, **getattr(settings, 'AI_STORE', {})}
+
+
+def make_key(kind, *parts):
+    """
+    Ключ ответа по его входным данным
+
+    Args:
+        kind: Вид ответа (THEORY, HINT, ANSWER)
+        *parts: Части запроса (модель, текст задачи, язык и т.п.)
+
+    Returns:
+        str: sha256 в hex
+    """
+    raw = '\0'.join([kind] + [str(part) for part in parts])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class MemoryLRU:
+    """
+    LRU в памяти процесса с ограничением по суммарному размеру
+
+    Хранит пары key -> [text, size, touched_at, hits]; hits - попадания
+    с последнего touch, еще не записанные в БД.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns:
+            tuple | None: (text, touched_at) или None
+        """
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            self._items.move_to_end(key)
+            item[3] += 1
+            return item[0], item[2]
+
+    def set(self, key, text, size, touched_at=None):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._items[key] = [text, size, touched_at or time.monotonic(), 0]
+            self.size += size
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= evicted[1]
+
+    def touch(self, key):
+        """
+        Обновление времени использования
+
+        Returns:
+            int: Попадания с прошлого touch (счетчик обнуляется)
+        """
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return 0
+            hits = item[3]
+            item[2] = time.monotonic()
+            item[3] = 0
+            return hits
+
+    def discard(self, key):
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is not None:
+                self.size -= item[1]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._items)
+
+
+_memory = None
+_memory_lock = threading.Lock()
+
+
+def get_memory():
+    """LRU в памяти текущего процесса"""
+    global _memory
+    if _memory is None:
+        with _memory_lock:
+            if _memory is None:
+                _memory = MemoryLRU(get_config()['MEMORY_MAX_BYTES'])
+    return _memory
+
+
+def _metric_key(name):
+    return f'ai_store:{name}'
+
+
+_pending = Counter()
+_pending_lock = threading.Lock()
+_flushed_at = time.monotonic()
+
+
+def _count(name, amount=1):
+    """Увеличение счетчика; в общий кэш он попадет при flush_metrics()"""
+    with _pending_lock:
+        _pending[name] += amount
+        due = time.monotonic() - _flushed_at >= METRICS_FLUSH_INTERVAL
+    if due:
+        flush_metrics()
+
+
+def flush_metrics():
+    """
+    Добавление накопленных в процессе метрик в общий кэш
+
+    Ошибки кэша не должны ломать ответ: они логируются, а недобавленные
+    счетчики возвращаются в очередь до следующего сброса.
+    """
+    global _flushed_at
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _flushed_at = time.monotonic()
+    if not pending:
+        return
+
+    try:
+        if has_atomic_ops(cache):
+            for name, amount in list(pending.items()):
+                cache.add(_metric_key(name), 0, None)
+                cache.incr(_metric_key(name), amount)
+                del pending[name]
+            return
+        # BaseCache.incr - это get + set, поэтому весь пакет под блокировкой
+        with cache_lock(cache):
+            current = cache.get_many([_metric_key(name) for name in pending])
+            cache.set_many({
+                _metric_key(name): current.get(_metric_key(name), 0) + amount
+                for name, amount in pending.items()
+            }, None)
+    except Exception as e:
+        logger.error(f"Failed to flush AI store metrics: {e}")
+        with _pending_lock:
+            _pending.update(pending)
+
+
+def get(key):
+    """
+    Ответ по ключу: сначала память, затем БД
+
+    Args:
+        key: Ключ из make_key()
+
+    Returns:
+        str | None: Текст ответа или None при промахе
+    """
+    from .models import AIResponse
+
+    memory = get_memory()
+    item = memory.get(key)
+    if item is not None:
+        text, touched_at = item
+        if time.monotonic() - touched_at > TOUCH_INTERVAL:
+            # Иначе ответ, который всегда отдается из памяти, выглядел бы в БД неиспользуемым
+            hits = memory.touch(key)
+            touched = AIResponse.objects.filter(key=key).update(hits=F('hits') + hits, last_used_at=timezone.now())
+            if not touched:
+                # Ответ удален из БД (prune_ai_responses в другом процессе)
+                memory.discard(key)
+                _count('misses')
+                return None
+        _count('memory_hits')
+        _count('bytes_served', len(text.encode()))
+        return text
+
+    row = AIResponse.objects.filter(key=key).values_list('text', 'size').first()
+    if row is None:
+        _count('misses')
+        return None
+
+    text, size = row
+    AIResponse.objects.filter(key=key).update(hits=F('hits') + 1, last_used_at=timezone.now())
+    memory.set(key, text, size)
+    _count('db_hits')
+    _count('bytes_served', size)
+    return text
+
+
+def put(key, kind, text):
+    """
+    Сохранение ответа в БД и в память
+
+    Args:
+        key: Ключ из make_key()
+        kind: Вид ответа
+        text: Текст ответа
+    """
+    from .models import AIResponse
+
+    size = len(text.encode())
+    AIResponse.objects.update_or_create(
+        key=key,
+        defaults={'kind': kind, 'text': text, 'size': size, 'last_used_at': timezone.now()},
+    )
+    get_memory().set(key, text, size)
+    _count('bytes_stored', size)
+
+
+def prune(max_age_days=None, max_bytes=None):
+    """
+    Вытеснение ответов из БД
+
+    Args:
+        max_age_days: Удалить ответы, не использованные дольше (None - из настроек)
+        max_bytes: Затем удалять самые давно использованные, пока общий
+            размер больше (None - из настроек)
+
+    Returns:
+        tuple: (expired, evicted) - количество удаленных по возрасту и по размеру
+    """
+    from .models import AIResponse
+
+    config = get_config()
+    max_age_days = config['MAX_AGE_DAYS'] if max_age_days is None else max_age_days
+    max_bytes = config['MAX_BYTES'] if max_bytes is None else max_bytes
+
+    expired = 0
+    if max_age_days:
+        cutoff = timezone.now() - timedelta(days=max_age_days)
+        expired, _ = AIResponse.objects.filter(last_used_at__lt=cutoff).delete()
+
+    evicted = 0
+    if max_bytes:
+        total = AIResponse.objects.aggregate(total=Sum('size'))['total'] or 0
+        excess = total - max_bytes
+        if excess > 0:
+            doomed = []
+            rows = AIResponse.objects.order_by('last_used_at').values_list('key', 'size').iterator()
+            for key, size in rows:
+                if excess <= 0:
+                    break
+                doomed.append(key)
+                excess -= size
+            for start in range(0, len(doomed), 500):
+                deleted, _ = AIResponse.objects.filter(key__in=doomed[start:start + 500]).delete()
+                evicted += deleted
+
+    # Память других процессов очистится сама: см. get() и TOUCH_INTERVAL
+    if expired or evicted:
+        get_memory().clear()
+    return expired, evicted
+
+
+def stats():
+    """
+    Метрики хранилища
+
+    Метрики других процессов видны с задержкой до METRICS_FLUSH_INTERVAL.
+
+    Returns:
+        dict: Счетчики попаданий/промахов/байтов, hit_rate, объем БД и памяти
+    """
+    from .models import AIResponse
+
+    flush_metrics()
+    data = {name: cache.get(_metric_key(name), 0) for name in METRICS}
+    lookups = data['memory_hits'] + data['db_hits'] + data['misses']
+    data['hit_rate'] = round((data['memory_hits'] + data['db_hits']) / lookups, 4) if lookups else 0
+    totals = AIResponse.objects.aggregate(total=Sum('size'))
+    data['db_rows'] = AIResponse.objects.count()
+    data['db_bytes'] = totals['total'] or 0
+    data['memory_items'] = len(get_memory())
+    data['memory_bytes'] = get_memory().size
+    return data
+
+
+def reset_metrics():
+    with _pending_lock:
+        _pending.clear()
+    cache.delete_many([_metric_key(name) for name in METRICS])
@@ -0,0 +1,154 @@
+"""
+Журнал ответов пользователей (AnswerEvent)
+
+Каждый ответ - одна вставка в AnswerEvent; из полей строки меняется
+только флаг folded, поэтому журнал можно переиграть для аналитики.
+
+Два режима (settings.ANSWER_EVENTS['ASYNC']):
+- синхронный (по умолчанию): TaskService учитывает ответ сразу, а в
+  журнал пишет событие с folded=True;
+- асинхронный: отправка ответа - только вставка события (folded=False);
+  TaskAttempt, XP, рейтинг и прогресс обновляет команда
+  fold_answer_events, сворачивая события пачками по возрастанию ID.
+
+Обработчик выбирает события с folded=False (частичный индекс по id) и
+помечает их folded=True в той же транзакции, в которой их учитывает.
+Поэтому событие, которое получило ID раньше, а закоммитилось позже уже
+учтенных, не теряется: оно просто попадет в следующий проход. Строка
+EventCursor блокируется, чтобы одновременно работал один обработчик, и
+хранит ID последнего учтенного события для мониторинга.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+FOLD_CURSOR = 'answer_fold'
+
+DEFAULT_ANSWER_EVENTS = {
+    'ASYNC': False,
+    'FOLD_BATCH': 1000,
+}
+
+
+def get_config():
+    """Настройки журнала с учетом значений по умолчанию"""
+    return {**DEFAULT_ANSWER_EVENTS, **getattr(settings, 'ANSWER_EVENTS', {})}
+
+
+def is_async():
+    return bool(get_config()['ASYNC'])
+
+
+def record(user, task, answer, is_correct, folded):
+    """
+    Запись ответа в журнал
+
+    Args:
+        user: User объект
+        task: Task или TaskRecord
+        answer: Ответ пользователя
+        is_correct: Результат проверки
+        folded: Ответ уже учтен в TaskAttempt
+    """
+    from .models import AnswerEvent
+
+    AnswerEvent.objects.create(user=user, task_id=task.id, answer=answer, is_correct=is_correct, folded=folded)
+
+
+def record_many(user, entries):
+    """
+    Запись уже учтенных ответов одной вставкой
+
+    Args:
+        user: User объект
+        entries: Список (task, answer, is_correct)
+    """
+    from .models import AnswerEvent
+
+    now = timezone.now()
+    AnswerEvent.objects.bulk_create([
+        AnswerEvent(user=user, task_id=task.id, answer=answer, is_correct=is_correct, folded=True, created_at=now)
+        for task, answer, is_correct in entries
+    ])
+
+
+def pending_attempt(user, task):
+    """
+    Предварительное состояние попытки с учетом еще не свернутых событий
+
+    Args:
+        user: User объект
+        task: Task или TaskRecord (нужны id и difficulty)
+
+    Returns:
+        tuple: (attempt, points_earned) - несохраненный TaskAttempt и очки
+            за последнее событие (0, если оно не решило задачу)
+    """
+    from .models import AnswerEvent, TaskAttempt
+    from .services import TaskService
+
+    attempt = TaskAttempt.objects.filter(user=user, task_id=task.id).first() or TaskAttempt(user=user, task_id=task.id)
+    pending = AnswerEvent.objects.filter(
+        user=user, task_id=task.id, folded=False,
+    ).order_by('id').values_list('is_correct', flat=True)
+
+    points_earned = 0
+    for is_correct in pending:
+        points_earned = 0
+        if attempt.is_solved:
+            continue
+        attempt.attempts += 1
+        if is_correct:
+            points_earned = TaskService._calculate_points(task, attempt.attempts)
+            attempt.is_solved = True
+            attempt.points_earned = points_earned
+    return attempt, points_earned
+
+
+def fold(batch_size=None):
+    """
+    Учет следующей пачки событий журнала
+
+    Args:
+        batch_size: Максимум событий за проход (None - из настроек)
+
+    Returns:
+        tuple: (events, users) - сколько событий просмотрено и у скольких
+            пользователей обновлены попытки
+    """
+    from django.contrib.auth.models import User
+    from .catalog import get_snapshot
+    from .models import AnswerEvent, EventCursor
+    from .services import TaskService
+
+    batch_size = batch_size or get_config()['FOLD_BATCH']
+
+    with transaction.atomic():
+        EventCursor.objects.get_or_create(name=FOLD_CURSOR)
+        # Блокировка курсора: одновременно работает только один обработчик
+        cursor = EventCursor.objects.select_for_update().get(name=FOLD_CURSOR)
+
+        events = list(AnswerEvent.objects.filter(folded=False).order_by('id').values_list(
+            'id', 'user_id', 'task_id', 'is_correct',
+        )[:batch_size])
+        if not events:
+            return 0, 0
+
+        snapshot = get_snapshot()
+        by_user = defaultdict(list)
+        for _, user_id, task_id, is_correct in events:
+            task = snapshot.get_task(task_id)
+            if task is not None:
+                by_user[user_id].append((task, is_correct))
+
+        users = User.objects.in_bulk(list(by_user))
+        for user_id, answers in by_user.items():
+            if user_id in users:
+                TaskService._apply_answers(users[user_id], answers)
+
+        AnswerEvent.objects.filter(id__in=[event[0] for event in events]).update(folded=True)
+        cursor.last_event_id = max(cursor.last_event_id, events[-1][0])
+        cursor.save(update_fields=['last_event_id', 'updated_at'])
+    return len(events), len(by_user)
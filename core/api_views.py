@@ -2,22 +2,34 @@
 API Views для мобильного приложения Flutter
 Все эндпоинты возвращают JSON и работают параллельно с существующими HTML-шаблонами
 """
+import json
+
 from rest_framework import viewsets, status, generics
 from rest_framework.decorators import api_view, action, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
-from django.db.models import Count, Q
+from django.core.exceptions import ValidationError
+from django.http import Http404, StreamingHttpResponse
+from django.utils.decorators import method_decorator
 
 from .models import Subject, Topic, Task, UserProfile, TaskAttempt, Leaderboard
+from .caching import get_catalog_stats
+from .catalog import get_snapshot
+from .conditional import conditional_api
+from .pagination import OrderIdCursorPagination
+from .progress import get_attempts_map, get_progress_map, get_subject_solved_counts
+from . import rank_index
+from .services import TaskService
 from .serializers import (
     SubjectSerializer, SubjectDetailSerializer,
     TopicSerializer, TopicDetailSerializer,
     TaskSerializer, TaskDetailSerializer,
     UserSerializer, UserProfileSerializer,
-    UserRegistrationSerializer, SubmitAnswerSerializer,
+    UserRegistrationSerializer, SubmitAnswerSerializer, SubmitBatchSerializer,
     LeaderboardSerializer
 )
 
@@ -130,19 +142,16 @@ def user_profile_api(request):
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@conditional_api
 def home_api(request):
     """
     Главная страница - список всех предметов с прогрессом
     GET /api/home/
     """
-    subjects = Subject.objects.annotate(total_tasks_count=Count('tasks'))
+    subjects = get_snapshot().subjects
     
     # Статистика
-    stats = {
-        'total_users': User.objects.count(),
-        'total_tasks': Task.objects.count(),
-        'total_subjects': Subject.objects.count(),
-    }
+    stats = get_catalog_stats()
     
     # Если пользователь авторизован, добавляем прогресс
     if request.user.is_authenticated:
@@ -156,9 +165,50 @@ def home_api(request):
     })
 
 
+# ==================== Каталог ====================
+
+class CatalogSnapshotMixin:
+    """
+    Чтение каталога из снимка в памяти процесса (core.catalog) вместо БД
+
+    snapshot_collection - атрибут снимка со списком объектов,
+    snapshot_lookup - метод снимка для поиска объекта по ID,
+    snapshot_actions - действия, которые обслуживаются из снимка
+    (остальные, например submit, работают с моделями как обычно).
+    """
+    snapshot_collection = None
+    snapshot_lookup = None
+    snapshot_actions = ('list', 'retrieve')
+    
+    def get_queryset(self):
+        if self.action in self.snapshot_actions:
+            return getattr(get_snapshot(), self.snapshot_collection)
+        return super().get_queryset()
+    
+    def get_object(self):
+        if self.action not in self.snapshot_actions:
+            return super().get_object()
+        
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        obj = getattr(get_snapshot(), self.snapshot_lookup)(self.kwargs[lookup_url_kwarg])
+        if obj is None:
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+    
+    # Ответы из снимка зависят только от версии каталога и прогресса пользователя
+    @method_decorator(conditional_api)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @method_decorator(conditional_api)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+
 # ==================== Предметы ====================
 
-class SubjectViewSet(viewsets.ReadOnlyModelViewSet):
+class SubjectViewSet(CatalogSnapshotMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet для предметов
     GET /api/subjects/ - список всех предметов
@@ -166,6 +216,8 @@ class SubjectViewSet(viewsets.ReadOnlyModelViewSet):
     """
     queryset = Subject.objects.all()
     permission_classes = [AllowAny]
+    snapshot_collection = 'subjects'
+    snapshot_lookup = 'get_subject'
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -178,15 +230,21 @@ class SubjectViewSet(viewsets.ReadOnlyModelViewSet):
 
 # ==================== Темы ====================
 
-class TopicViewSet(viewsets.ReadOnlyModelViewSet):
+class TopicViewSet(CatalogSnapshotMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet для тем
-    GET /api/topics/ - список всех тем
+    GET /api/topics/?cursor=...&limit=50&fields=id,title - список всех тем
     GET /api/topics/{id}/ - детальная информация о теме
     GET /api/topics/{id}/tasks/ - список задач в теме
+    GET /api/topics/{id}/tasks/?bulk=1 - все задачи темы потоковым JSON
+    GET /api/topics/{id}/pack/ - офлайн-пакет темы (gzip, ETag)
     """
     queryset = Topic.objects.all()
     permission_classes = [AllowAny]
+    pagination_class = OrderIdCursorPagination
+    snapshot_collection = 'topics'
+    snapshot_lookup = 'get_topic'
+    snapshot_actions = ('list', 'retrieve', 'tasks')
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -197,33 +255,100 @@ class TopicViewSet(viewsets.ReadOnlyModelViewSet):
         return {'request': self.request}
     
     @action(detail=True, methods=['get'])
+    @method_decorator(conditional_api)
     def tasks(self, request, pk=None):
         """Получить все задачи для конкретной темы"""
         topic = self.get_object()
-        tasks = Task.objects.filter(topic=topic).order_by('order')
+        tasks = get_snapshot().tasks_for_topic(topic.id)
+        context = {'request': request}
+        serializer_class = TaskDetailSerializer if request.user.is_authenticated else TaskSerializer
         
-        if request.user.is_authenticated:
-            serializer = TaskDetailSerializer(tasks, many=True, context={'request': request})
-        else:
-            serializer = TaskSerializer(tasks, many=True)
+        if request.query_params.get('bulk') in ('1', 'true'):
+            return self._stream_tasks(topic, tasks, serializer_class, context)
         
         return Response({
-            'topic': TopicDetailSerializer(topic, context={'request': request}).data,
-            'tasks': serializer.data
+            'topic': TopicDetailSerializer(topic, context=context).data,
+            'tasks': serializer_class(tasks, many=True, context=context).data
         })
+    
+    @action(detail=True, methods=['get'])
+    def pack(self, request, pk=None):
+        """
+        Офлайн-пакет темы: тема и все задачи одним gzip JSON (core.topic_packs)
+        
+        Отдается с диска как есть; с If-None-Match - 304, пока тема не изменилась.
+        """
+        import gzip
+        from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+        from django.utils.http import parse_etags
+        from .topic_packs import get_pack
+        
+        pack = get_pack(pk)
+        if pack is None:
+            raise Http404
+        
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if '*' in if_none_match or pack.etag in if_none_match:
+            response = HttpResponseNotModified()
+        elif 'gzip' in request.headers.get('Accept-Encoding', ''):
+            response = FileResponse(open(pack.path, 'rb'), content_type='application/json',
+                                    filename=f'topic-{pack.topic_id}.json')
+            response['Content-Encoding'] = 'gzip'
+        else:
+            with open(pack.path, 'rb') as packed:
+                response = HttpResponse(gzip.decompress(packed.read()), content_type='application/json')
+        
+        response['ETag'] = pack.etag
+        response['Cache-Control'] = 'no-cache'
+        response['Vary'] = 'Accept-Encoding'
+        return response
+    
+    STREAM_CHUNK = 200
+    
+    def _stream_tasks(self, topic, tasks, serializer_class, context):
+        """
+        Потоковый ответ {"topic": {...}, "tasks": [...]} без пагинации
+        
+        JSON отдается частями по STREAM_CHUNK задач, так что большие темы
+        не собираются в памяти целиком. Прогресс пользователя загружается
+        до начала отдачи.
+        """
+        topic_data = TopicDetailSerializer(topic, context=context).data
+        serializer = serializer_class(context=context)
+        progress = get_progress_map(context)
+        if progress is not None:
+            # Попытки по задачам темы загружаем до начала отдачи
+            serializer_class.prefetch_progress(progress, tasks)
+            progress.load()
+        
+        def dumps(data):
+            return json.dumps(data, cls=JSONEncoder, ensure_ascii=False)
+        
+        def generate():
+            yield '{"topic": ' + dumps(topic_data) + ', "tasks": ['
+            for start in range(0, len(tasks), self.STREAM_CHUNK):
+                chunk = ', '.join(dumps(serializer.to_representation(task)) for task in tasks[start:start + self.STREAM_CHUNK])
+                yield (', ' if start else '') + chunk
+            yield ']}'
+        
+        return StreamingHttpResponse(generate(), content_type='application/json')
 
 
 # ==================== Задачи ====================
 
-class TaskViewSet(viewsets.ReadOnlyModelViewSet):
+class TaskViewSet(CatalogSnapshotMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet для задач
-    GET /api/tasks/ - список всех задач
+    GET /api/tasks/?cursor=...&limit=50&fields=id,question - список всех задач
     GET /api/tasks/{id}/ - детальная информация о задаче
     POST /api/tasks/{id}/submit/ - отправить ответ на задачу
+    POST /api/tasks/submit-batch/ - отправить пакет ответов, решенных офлайн
     """
     queryset = Task.objects.all()
     permission_classes = [AllowAny]
+    pagination_class = OrderIdCursorPagination
+    snapshot_collection = 'tasks'
+    snapshot_lookup = 'get_task'
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -249,35 +374,13 @@ class TaskViewSet(viewsets.ReadOnlyModelViewSet):
                 'message': 'Ответ не указан'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Получаем или создаем попытку
-        attempt, created = TaskAttempt.objects.get_or_create(
-            user=request.user,
-            task=task
-        )
-        
-        # Увеличиваем счетчик попыток
-        attempt.attempts += 1
-        
-        # Проверяем правильность ответа
-        is_correct = str(answer) == str(task.correct_answer)
-        
-        if is_correct and not attempt.is_solved:
-            attempt.is_solved = True
-            # Начисляем очки (можно настроить логику)
-            points = max(10 - attempt.attempts, 1)  # Чем меньше попыток, тем больше очков
-            attempt.points_earned = points
-            
-            # Обновляем профиль пользователя
-            profile = UserProfile.objects.get(user=request.user)
-            profile.xp += points
-            profile.save()
-            
-            # Обновляем leaderboard
-            leaderboard, _ = Leaderboard.objects.get_or_create(user_profile=profile)
-            leaderboard.points = profile.xp
-            leaderboard.save()
-        
-        attempt.save()
+        try:
+            attempt, is_correct, points_earned = TaskService.submit_answer(request.user, task, answer)
+        except ValidationError as e:
+            return Response({
+                'success': False,
+                'message': e.messages[0]
+            }, status=status.HTTP_400_BAD_REQUEST)
         
         return Response({
             'success': True,
@@ -288,6 +391,47 @@ class TaskViewSet(viewsets.ReadOnlyModelViewSet):
             'correct_answer': task.correct_answer if is_correct or attempt.attempts >= 3 else None,
             'message': 'Правильно! 🎉' if is_correct else 'Неправильно, попробуйте еще раз'
         })
+    
+    @action(detail=False, methods=['post'], url_path='submit-batch', permission_classes=[IsAuthenticated])
+    def submit_batch(self, request):
+        """
+        Отправить пакет ответов, решенных офлайн
+        POST /api/tasks/submit-batch/
+        Body: {answers: [{task_id, answer, client_timestamp}, ...]}
+        
+        Ошибка в одном ответе (удаленная задача, пустой ответ) не отменяет
+        остальные - она возвращается в results этого ответа.
+        """
+        serializer = SubmitBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({
+                'success': False,
+                'errors': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        results, points_earned = TaskService.submit_batch(request.user, serializer.validated_data['answers'])
+        
+        data = []
+        for result in results:
+            if 'error' in result:
+                data.append({'task_id': result['task_id'], 'success': False, 'message': result['error']})
+                continue
+            task = result['task']
+            data.append({
+                'task_id': task.id,
+                'success': True,
+                'is_correct': result['is_correct'],
+                'is_solved': result['is_solved'],
+                'attempts': result['attempts'],
+                'points_earned': result['points_earned'],
+                'correct_answer': task.correct_answer if result['is_correct'] or result['attempts'] >= 3 else None,
+            })
+        
+        return Response({
+            'success': True,
+            'results': data,
+            'points_earned': points_earned,
+        })
 
 
 # ==================== Прогресс пользователя ====================
@@ -299,16 +443,12 @@ def user_progress_api(request):
     Получить прогресс пользователя по всем предметам
     GET /api/progress/
     """
-    subjects = Subject.objects.all()
+    solved_counts = get_subject_solved_counts(request.user)
     progress_data = []
     
-    for subject in subjects:
-        total_tasks = subject.tasks.count()
-        completed_tasks = TaskAttempt.objects.filter(
-            user=request.user,
-            task__subject=subject,
-            is_solved=True
-        ).count()
+    for subject in get_snapshot().subjects:
+        total_tasks = subject.total_tasks
+        completed_tasks = solved_counts.get(subject.id, 0)
         
         progress_data.append({
             'subject_id': subject.id,
@@ -334,25 +474,26 @@ def topic_progress_api(request, topic_id):
     Получить прогресс пользователя по конкретной теме
     GET /api/progress/topic/{topic_id}/
     """
-    try:
-        topic = Topic.objects.get(id=topic_id)
-    except Topic.DoesNotExist:
+    topic = get_snapshot().get_topic(topic_id)
+    if topic is None:
         return Response({
             'success': False,
             'message': 'Тема не найдена'
         }, status=status.HTTP_404_NOT_FOUND)
     
-    tasks = Task.objects.filter(topic=topic).order_by('order')
+    # Задачи темы - из снимка каталога, попытки - одним запросом по всем задачам
+    tasks = get_snapshot().tasks_for_topic(topic.id)
+    attempts = get_attempts_map(request.user, [task.id for task in tasks])
     tasks_data = []
     
     for task in tasks:
-        attempt = TaskAttempt.objects.filter(user=request.user, task=task).first()
+        attempts_count, is_solved = attempts.get(task.id, (0, False))
         tasks_data.append({
             'task_id': task.id,
             'question': task.question,
             'order': task.order,
-            'is_solved': attempt.is_solved if attempt else False,
-            'attempts': attempt.attempts if attempt else 0
+            'is_solved': is_solved,
+            'attempts': attempts_count
         })
     
     completed_count = sum(1 for t in tasks_data if t['is_solved'])
@@ -366,6 +507,23 @@ def topic_progress_api(request, topic_id):
     })
 
 
+# ==================== Синхронизация ====================
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def sync_api(request):
+    """
+    Изменения каталога и прогресса после версии клиента
+    GET /api/sync/?since=<version>
+
+    Без since - полный снимок (full: true). Полученный version клиент
+    передает в следующий запрос. Попытки отдаются только авторизованным.
+    """
+    from .sync import get_changes
+
+    return Response(get_changes(request.user, request.query_params.get('since')))
+
+
 # ==================== Leaderboard ====================
 
 @api_view(['GET'])
@@ -373,22 +531,32 @@ def topic_progress_api(request, topic_id):
 def leaderboard_api(request):
     """
     Получить таблицу лидеров
-    GET /api/leaderboard/
+    GET /api/leaderboard/?cursor=...&limit=100
+    GET /api/leaderboard/?around=me&window=5 - окно вокруг текущего пользователя
     """
-    leaderboard = Leaderboard.objects.select_related('user_profile__user').order_by('-points')[:100]
-    serializer = LeaderboardSerializer(leaderboard, many=True)
+    from .leaderboard import (
+        get_leaderboard_page, get_leaderboard_window, clamp, MAX_WINDOW, DEFAULT_WINDOW,
+    )
     
-    # Если пользователь авторизован, добавляем его позицию
+    profile = None
     user_rank = None
     if request.user.is_authenticated:
-        try:
-            user_entry = Leaderboard.objects.get(user_profile__user=request.user)
-            user_rank = Leaderboard.objects.filter(points__gt=user_entry.points).count() + 1
-        except Leaderboard.DoesNotExist:
-            user_rank = None
+        profile = UserProfile.objects.filter(user=request.user).first()
+        if profile is not None:
+            user_rank = rank_index.rank(profile.id)
+    
+    if request.query_params.get('around') == 'me' and profile is not None:
+        window = clamp(request.query_params.get('window'), DEFAULT_WINDOW, MAX_WINDOW)
+        entries, next_cursor = get_leaderboard_window(profile, window)
+    else:
+        limit = clamp(request.query_params.get('limit'), 100, 100)
+        entries, next_cursor = get_leaderboard_page(request.query_params.get('cursor'), limit)
+    
+    serializer = LeaderboardSerializer(entries, many=True)
     
     return Response({
         'leaderboard': serializer.data,
+        'next_cursor': next_cursor,
         'user_rank': user_rank
     })
 
@@ -402,22 +570,18 @@ def user_stats_api(request):
     Получить детальную статистику пользователя
     GET /api/stats/
     """
-    profile = UserProfile.objects.get(user=request.user)
+    profile = UserProfile.objects.select_related('user').get(user=request.user)
     
-    total_solved = TaskAttempt.objects.filter(user=request.user, is_solved=True).count()
-    total_attempts = TaskAttempt.objects.filter(user=request.user).aggregate(
-        total=Count('id')
-    )['total'] or 0
+    # Решенные задачи по предметам - из счетчиков прогресса (один запрос)
+    solved_counts = get_subject_solved_counts(request.user)
+    total_solved = sum(solved_counts.values())
+    total_attempts = TaskAttempt.objects.filter(user=request.user).count()
     
     # Статистика по предметам
     subjects_stats = []
-    for subject in Subject.objects.all():
-        subject_tasks = subject.tasks.count()
-        subject_solved = TaskAttempt.objects.filter(
-            user=request.user,
-            task__subject=subject,
-            is_solved=True
-        ).count()
+    for subject in get_snapshot().subjects:
+        subject_tasks = subject.total_tasks
+        subject_solved = solved_counts.get(subject.id, 0)
         
         if subject_tasks > 0:
             subjects_stats.append({
@@ -434,7 +598,5 @@ def user_stats_api(request):
         'total_solved': total_solved,
         'total_attempts': total_attempts,
         'subjects_stats': subjects_stats,
-        'leaderboard_rank': Leaderboard.objects.filter(
-            points__gt=profile.xp
-        ).count() + 1 if Leaderboard.objects.filter(user_profile=profile).exists() else None
+        'leaderboard_rank': rank_index.rank(profile.id)
     })
@@ -0,0 +1,268 @@
+"""
+Слой кэширования поверх общего кэша (settings.CACHES)
+
+- Пространства имен с версиями: make_key(namespace, ...) включает текущую
+  версию пространства, а bump_namespace(namespace) одним вызовом делает
+  недействительными все его ключи (старые записи просто истекают по TTL).
+- cache-aside хелперы для каталога (Subject/Topic/Task). Каталог меняется
+  только импортом и через админку, поэтому версия пространства CATALOG
+  сбрасывается сигналами моделей (см. core.signals). Она же служит
+  поколением для снимка каталога в памяти процесса (см. core.catalog).
+- Версии прогресса: PROGRESS (общая) и progress:<user_id> (пользователя)
+  меняются при каждом ответе и пересчете счетчиков. Вместе с версией
+  каталога они дают валидаторы для условных GET (см. core.conditional).
+- Атомарные операции: у Redis, memcached и locmem add/incr атомарны, а у
+  файлового кэша это чтение и запись файла, поэтому для него они
+  выполняются под блокировкой файла (cache_lock), общей для процессов
+  на одной машине.
+"""
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.db import transaction
+
+try:
+    import fcntl
+except ImportError:  # Windows: только блокировка внутри процесса
+    fcntl = None
+
+CATALOG = 'catalog'
+CATALOG_TIMEOUT = 60 * 60
+# TTL закэшированного отсутствия объекта: созданный в обход сигналов объект появится быстро
+MISS_TIMEOUT = 60
+PROGRESS = 'progress'
+
+_MISSING = object()
+
+# Бэкенды, у которых add и incr атомарны (incr к тому же не меняет срок жизни ключа)
+ATOMIC_BACKENDS = ('RedisCache', 'PyMemcacheCache', 'PyLibMCCache', 'LocMemCache')
+
+
+def _version_key(namespace):
+    return f'ns_version:{namespace}'
+
+
+def namespace_version(namespace):
+    """
+    Текущая версия пространства имен
+
+    Args:
+        namespace: Имя пространства
+
+    Returns:
+        int: Версия (метка времени последнего сброса)
+    """
+    if namespace == CATALOG:
+        _apply_pending_catalog_bump()
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        # Новая версия, а не 1: после вытеснения ключа нельзя подхватить старые записи
+        version = time.time_ns()
+        if not cache.add(_version_key(namespace), version, None):
+            version = cache.get(_version_key(namespace), version)
+    return version
+
+
+def bump_namespace(namespace):
+    """
+    Инвалидация всех ключей пространства имен
+
+    Args:
+        namespace: Имя пространства
+    """
+    cache.set(_version_key(namespace), time.time_ns(), None)
+
+
+def make_key(namespace, *parts):
+    """
+    Ключ кэша с учетом версии пространства имен
+
+    Args:
+        namespace: Имя пространства
+        *parts: Части ключа
+
+    Returns:
+        str: Ключ вида "namespace:version:part1:part2"
+    """
+    return ':'.join([namespace, str(namespace_version(namespace))] + [str(part) for part in parts])
+
+
+def get_or_set(namespace, parts, loader, timeout=CATALOG_TIMEOUT, none_timeout=None):
+    """
+    cache-aside: значение из кэша или результат loader()
+
+    Args:
+        namespace: Имя пространства
+        parts: Части ключа (tuple)
+        loader: Функция без аргументов, загружающая значение при промахе
+        timeout: TTL в секундах
+        none_timeout: TTL для None (по умолчанию timeout; 0 - не кэшировать)
+
+    Returns:
+        Значение из кэша или загруженное значение
+    """
+    key = make_key(namespace, *parts)
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        value = loader()
+        if value is not None:
+            cache.set(key, value, timeout)
+        elif none_timeout != 0:
+            cache.set(key, value, timeout if none_timeout is None else none_timeout)
+    return value
+
+
+# ==================== Каталог ====================
+
+def get_task(task_id):
+    """
+    Задача по ID вместе с предметом и темой
+
+    Отсутствие задачи кэшируется только на MISS_TIMEOUT.
+
+    Returns:
+        Task | None
+    """
+    from .models import Task
+
+    return get_or_set(CATALOG, ('task', task_id), lambda: (
+        Task.objects.select_related('subject', 'topic').filter(id=task_id).first()
+    ), none_timeout=MISS_TIMEOUT)
+
+
+def get_catalog_stats():
+    """
+    Общая статистика для главной страницы (5 минут)
+
+    Returns:
+        dict: total_users, total_tasks, total_subjects
+    """
+    from django.contrib.auth.models import User
+    from .models import Subject, Task
+
+    return get_or_set(CATALOG, ('stats',), lambda: {
+        'total_users': User.objects.count(),
+        'total_tasks': Task.objects.count(),
+        'total_subjects': Subject.objects.count(),
+    }, timeout=300)
+
+
+def _bump_catalog():
+    transaction.get_connection().catalog_bump_pending = False
+    bump_namespace(CATALOG)
+
+
+def _apply_pending_catalog_bump():
+    """Отложенный сброс версии каталога перед чтением внутри меняющей его транзакции"""
+    connection = transaction.get_connection()
+    if getattr(connection, 'catalog_bump_pending', False):
+        connection.catalog_bump_pending = False
+        bump_namespace(CATALOG)
+
+
+def invalidate_catalog():
+    """
+    Сброс всех закэшированных данных каталога
+
+    Вне транзакции изменение уже закоммичено - версия сбрасывается сразу.
+    В транзакции сброс один после коммита, сколько бы объектов она ни
+    меняла (импорт, каскадное удаление): сброс до коммита дал бы другому
+    воркеру закэшировать старые данные под новой версией. Чтобы сама
+    транзакция не читала из кэша устаревший каталог, перед первым чтением
+    версии после изменений она сбрасывается еще раз (namespace_version).
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        bump_namespace(CATALOG)
+        return
+    connection.catalog_bump_pending = True
+    # Повторные вызовы в той же транзакции не планируют еще один сброс
+    if not any(entry[1] is _bump_catalog for entry in connection.run_on_commit):
+        transaction.on_commit(_bump_catalog)
+
+
+# ==================== Прогресс ====================
+
+def progress_namespace(user_id):
+    """Пространство имен прогресса одного пользователя"""
+    return f'{PROGRESS}:{user_id}'
+
+
+def progress_version(user_id):
+    """
+    Версия прогресса пользователя
+
+    Returns:
+        str: Общая версия и версия пользователя
+    """
+    return f'{namespace_version(PROGRESS)}.{namespace_version(progress_namespace(user_id))}'
+
+
+def invalidate_progress(user_id=None):
+    """
+    Сброс версии прогресса сразу и после коммита
+
+    Args:
+        user_id: ID пользователя (None - прогресс всех пользователей)
+    """
+    namespace = PROGRESS if user_id is None else progress_namespace(user_id)
+    bump_namespace(namespace)
+    transaction.on_commit(lambda: bump_namespace(namespace))
+
+
+# ==================== Атомарные операции ====================
+
+def has_atomic_ops(backend=None):
+    """Атомарны ли add/incr бэкенда (None - кэш default)"""
+    backend = backend or caches[DEFAULT_CACHE_ALIAS]
+    return type(backend).__name__ in ATOMIC_BACKENDS
+
+
+_thread_lock = threading.Lock()
+
+
+def _lock_path(backend):
+    # У файлового кэша блокировка лежит рядом с его файлами
+    directory = getattr(backend, '_dir', None) or tempfile.gettempdir()
+    return os.path.join(directory, 'cache.lock')
+
+
+@contextmanager
+def cache_lock(backend=None):
+    """
+    Блокировка для составных операций с кэшем без атомарных add/incr
+
+    Args:
+        backend: Бэкенд кэша (None - кэш default)
+    """
+    backend = backend or caches[DEFAULT_CACHE_ALIAS]
+    with _thread_lock:
+        if fcntl is None:
+            yield
+            return
+        path = _lock_path(backend)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def add(key, value, timeout, backend=None):
+    """
+    Атомарный cache.add (у FileBasedCache это has_key + set)
+
+    Returns:
+        bool: Ключ добавлен этим вызовом
+    """
+    backend = backend or caches[DEFAULT_CACHE_ALIAS]
+    if has_atomic_ops(backend):
+        return backend.add(key, value, timeout)
+    with cache_lock(backend):
+        return backend.add(key, value, timeout)
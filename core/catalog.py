@@ -0,0 +1,244 @@
+"""
+Снимок каталога (Subject/Topic/Task) в памяти процесса
+
+Каталог меняется только импортом и через админку, поэтому каждый воркер
+загружает его один раз в неизменяемый снимок из компактных __slots__ записей.
+Снимок привязан к поколению каталога - версии пространства имен CATALOG
+в общем кэше (см. core.caching). Поколение увеличивают сигналы моделей
+и команды импорта; увидев новое поколение, воркер строит новый снимок
+и подменяет ссылку на него целиком, так что читатели никогда не видят
+наполовину обновленные данные.
+
+Записи снимка общие для всех запросов - их нельзя изменять. Данные
+пользователя (прогресс) добавляются в отдельные словари, см. as_dict().
+"""
+import threading
+
+from .caching import CATALOG, invalidate_catalog, namespace_version
+
+
+class _Record:
+    """Неизменяемая запись каталога"""
+
+    __slots__ = ()
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            object.__setattr__(self, name, fields.get(name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is read-only')
+
+    def __repr__(self):
+        return f'<{type(self).__name__} {self.id}>'
+
+    @property
+    def pk(self):
+        return self.id
+
+    def as_dict(self, **extra):
+        """
+        Копия полей записи в виде словаря (для шаблонов)
+
+        Args:
+            **extra: Дополнительные ключи (прогресс пользователя и т.п.)
+
+        Returns:
+            dict: Поля записи и extra
+        """
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data.update(extra)
+        return data
+
+
+class SubjectRecord(_Record):
+    __slots__ = ('id', 'title', 'icon', 'color', 'updated_at', 'total_tasks', 'topics')
+
+
+class TopicRecord(_Record):
+    __slots__ = ('id', 'subject', 'title', 'order', 'is_locked', 'updated_at', 'total_tasks')
+
+    @property
+    def subject_id(self):
+        return self.subject.id
+
+
+class TaskRecord(_Record):
+    __slots__ = ('id', 'subject', 'topic', 'question', 'options', 'correct_answer',
+                 'difficulty', 'order', 'original_test_id', 'updated_at')
+
+    @property
+    def subject_id(self):
+        return self.subject.id
+
+    @property
+    def topic_id(self):
+        return self.topic.id if self.topic is not None else None
+
+
+def _freeze(value):
+    """Списки из JSON-поля превращаем в кортежи, чтобы их нельзя было изменить"""
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class CatalogSnapshot:
+    """
+    Неизменяемый снимок каталога
+
+    Attributes:
+        generation: Поколение каталога, из которого построен снимок
+        subjects: Кортеж SubjectRecord в порядке id
+        topics: Кортеж TopicRecord в порядке (order, id)
+        tasks: Кортеж TaskRecord в порядке (order, id)
+    """
+
+    __slots__ = ('generation', 'subjects', 'topics', 'tasks',
+                 '_subjects_by_id', '_topics_by_id', '_tasks_by_id', '_tasks_by_topic')
+
+    def __init__(self, generation, subjects, topics, tasks):
+        self.generation = generation
+        self.subjects = subjects
+        self.topics = topics
+        self.tasks = tasks
+        self._subjects_by_id = {subject.id: subject for subject in subjects}
+        self._topics_by_id = {topic.id: topic for topic in topics}
+        self._tasks_by_id = {task.id: task for task in tasks}
+
+        tasks_by_topic = {}
+        for task in tasks:
+            if task.topic is not None:
+                tasks_by_topic.setdefault(task.topic.id, []).append(task)
+        self._tasks_by_topic = {topic_id: tuple(items) for topic_id, items in tasks_by_topic.items()}
+
+    def get_subject(self, subject_id):
+        """SubjectRecord по ID или None"""
+        return self._subjects_by_id.get(_to_int(subject_id))
+
+    def get_topic(self, topic_id):
+        """TopicRecord по ID или None"""
+        return self._topics_by_id.get(_to_int(topic_id))
+
+    def get_task(self, task_id):
+        """TaskRecord по ID или None"""
+        return self._tasks_by_id.get(_to_int(task_id))
+
+    def tasks_for_topic(self, topic_id):
+        """Задачи темы в порядке (order, id)"""
+        return self._tasks_by_topic.get(_to_int(topic_id), ())
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def build_snapshot(generation):
+    """
+    Загрузка каталога из БД (три запроса)
+
+    Args:
+        generation: Поколение каталога, которым помечается снимок
+
+    Returns:
+        CatalogSnapshot
+    """
+    from .models import Subject, Task, Topic
+
+    subject_rows = list(Subject.objects.order_by('id').values_list('id', 'title', 'icon', 'color', 'updated_at'))
+    topic_rows = list(
+        Topic.objects.order_by('order', 'id').values_list(
+            'id', 'subject_id', 'title', 'order', 'is_locked', 'updated_at',
+        )
+    )
+    task_rows = list(
+        Task.objects.order_by('order', 'id').values_list(
+            'id', 'subject_id', 'topic_id', 'question', 'options', 'correct_answer',
+            'difficulty', 'order', 'original_test_id', 'updated_at',
+        )
+    )
+
+    subject_totals = {}
+    topic_totals = {}
+    for row in task_rows:
+        subject_totals[row[1]] = subject_totals.get(row[1], 0) + 1
+        if row[2] is not None:
+            topic_totals[row[2]] = topic_totals.get(row[2], 0) + 1
+
+    subjects = {
+        subject_id: SubjectRecord(
+            id=subject_id, title=title, icon=icon, color=color, updated_at=updated_at,
+            total_tasks=subject_totals.get(subject_id, 0), topics=(),
+        )
+        for subject_id, title, icon, color, updated_at in subject_rows
+    }
+
+    topics = []
+    topics_by_subject = {}
+    for topic_id, subject_id, title, order, is_locked, updated_at in topic_rows:
+        topic = TopicRecord(
+            id=topic_id, subject=subjects[subject_id], title=title, order=order,
+            is_locked=is_locked, updated_at=updated_at, total_tasks=topic_totals.get(topic_id, 0),
+        )
+        topics.append(topic)
+        topics_by_subject.setdefault(subject_id, []).append(topic)
+
+    for subject_id, subject in subjects.items():
+        # topics выставляется один раз при сборке, дальше запись неизменяема
+        object.__setattr__(subject, 'topics', tuple(topics_by_subject.get(subject_id, ())))
+
+    topics_by_id = {topic.id: topic for topic in topics}
+    tasks = tuple(
+        TaskRecord(
+            id=task_id, subject=subjects[subject_id], topic=topics_by_id.get(topic_id),
+            question=question, options=_freeze(options), correct_answer=correct_answer,
+            difficulty=difficulty, order=order, original_test_id=original_test_id,
+            updated_at=updated_at,
+        )
+        for (task_id, subject_id, topic_id, question, options, correct_answer,
+             difficulty, order, original_test_id, updated_at) in task_rows
+    )
+
+    return CatalogSnapshot(
+        generation=generation,
+        subjects=tuple(subjects.values()),
+        topics=tuple(topics),
+        tasks=tasks,
+    )
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot():
+    """
+    Актуальный снимок каталога
+
+    Проверка поколения - одно чтение из общего кэша. При смене поколения
+    снимок строится заново под блокировкой (один раз на процесс), после
+    чего ссылка подменяется атомарно.
+
+    Returns:
+        CatalogSnapshot
+    """
+    global _snapshot
+    generation = namespace_version(CATALOG)
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.generation == generation:
+        return snapshot
+
+    with _snapshot_lock:
+        snapshot = _snapshot
+        if snapshot is None or snapshot.generation != generation:
+            snapshot = build_snapshot(generation)
+            _snapshot = snapshot
+    return snapshot
+
+
+def bump_generation():
+    """Новое поколение каталога: все воркеры перестроят снимок при следующем обращении"""
+    invalidate_catalog()
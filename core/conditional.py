@@ -0,0 +1,121 @@
+"""
+Условные GET для каталога (ETag / If-None-Match)
+
+ETag считается без обращения к каталогу в БД и без шаблонов: это хэш
+версии каталога, версии кода (RELEASE_VERSION), языка и, для
+авторизованного пользователя, версии его прогресса (см. core.caching).
+Пока ничего из этого не изменилось, клиент получает 304 Not Modified.
+Главная страница добавляет к нему общую статистику (main_etag): число
+пользователей меняется без изменения каталога.
+
+ETag один на всех анонимных посетителей, поэтому страница, в которую
+попал CSRF-токен (он свой у каждого посетителя), отдается без ETag и
+с Cache-Control: private.
+
+- catalog_condition - для HTML-представлений (django.views.decorators.http.condition);
+- conditional_api - для DRF: ETag считается после аутентификации DRF
+  (JWT), поэтому декоратор ставится под @api_view или на метод ViewSet
+  через method_decorator.
+"""
+import hashlib
+from functools import partial, wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.translation import get_language
+from django.views.decorators.http import condition
+
+from .caching import CATALOG, get_catalog_stats, namespace_version, progress_version
+
+
+def _make_etag(parts):
+    return '"%s"' % hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def catalog_etag(request, *args, **kwargs):
+    """
+    ETag ответа, зависящего только от каталога и прогресса пользователя
+
+    Returns:
+        str | None: ETag в кавычках или None, если ответ нельзя
+            отдавать из кэша клиента (есть непоказанные сообщения)
+    """
+    if len(get_messages(request)):
+        return None
+
+    user = getattr(request, 'user', None)
+    parts = [
+        getattr(settings, 'RELEASE_VERSION', ''),
+        namespace_version(CATALOG),
+        get_language() or '',
+        f'{user.id}:{progress_version(user.id)}' if user is not None and user.is_authenticated else 'anonymous',
+    ]
+    return _make_etag(parts)
+
+
+def main_etag(request, *args, **kwargs):
+    """ETag главной страницы: catalog_etag и общая статистика (get_catalog_stats)"""
+    etag = catalog_etag(request)
+    if etag is None:
+        return None
+    return _make_etag([etag] + sorted(get_catalog_stats().items()))
+
+
+def _revalidate(response, request, vary):
+    """Клиент хранит ответ, но каждый раз перепроверяет его по ETag"""
+    user = getattr(request, 'user', None)
+    patch_cache_control(response, no_cache=True)
+    if user is not None and user.is_authenticated:
+        patch_cache_control(response, private=True)
+    patch_vary_headers(response, vary)
+    return response
+
+
+def catalog_condition(view_func=None, etag_func=catalog_etag):
+    """
+    Условный GET для HTML-страницы каталога
+
+    Используется как @catalog_condition или @catalog_condition(etag_func=main_etag).
+    """
+    if view_func is None:
+        return partial(catalog_condition, etag_func=etag_func)
+
+    conditional = condition(etag_func=etag_func)(view_func)
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        response = _revalidate(conditional(request, *args, **kwargs), request, ('Cookie',))
+        if request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+            # В странице CSRF-токен посетителя: общий ETag и общие кэши для нее не годятся
+            del response['ETag']
+            patch_cache_control(response, private=True)
+        return response
+
+    return wrapper
+
+
+def conditional_api(view_func):
+    """
+    Условный GET для API каталога
+
+    Args:
+        view_func: Функция view(request, ...) с DRF Request после аутентификации
+
+    Returns:
+        function: View, отвечающая 304 при совпадении If-None-Match
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        etag = catalog_etag(request) if request.method in ('GET', 'HEAD') else None
+        if etag is None:
+            return view_func(request, *args, **kwargs)
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = view_func(request, *args, **kwargs)
+        if response.status_code in (200, 304) and not response.has_header('ETag'):
+            response['ETag'] = etag
+        return _revalidate(response, request, ('Authorization', 'Cookie'))
+
+    return wrapper
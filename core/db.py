@@ -0,0 +1,41 @@
+"""
+SQL, которого нет в ORM: upsert с инкрементом и UPDATE ... RETURNING
+
+INSERT ... ON CONFLICT DO UPDATE ... RETURNING поддерживают PostgreSQL и
+SQLite 3.35+. На остальных БД вызывающий код идет через ORM (несколько
+запросов вместо одного), поэтому сначала проверяет has_upsert_returning().
+"""
+from django.db import connection
+
+
+def has_upsert_returning():
+    """Поддерживает ли БД INSERT ... ON CONFLICT DO UPDATE ... RETURNING"""
+    return connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_rows_from_bulk_insert
+
+
+def table(model):
+    """Имя таблицы модели в кавычках"""
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def datetime_param(value):
+    """datetime в формате, в котором его хранит ORM (SQLite хранит строки)"""
+    return connection.ops.adapt_datetimefield_value(value)
+
+
+def execute(sql, params):
+    """Выполнение запроса без результата"""
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def fetchone(sql, params):
+    """
+    Выполнение запроса и первая строка результата
+
+    Returns:
+        tuple | None
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchone()
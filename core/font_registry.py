@@ -0,0 +1,160 @@
+"""
+Шрифты для рендеринга картинок (OG-изображения задач)
+
+Путь к DejaVu ищется один раз на процесс (сначала core/fonts, затем
+системные каталоги), шрифты кэшируются по (путь, размер). Ширина текста
+для переноса строк считается по таблице ширин символов, которая
+заполняется лениво для каждого шрифта, - без повторных textbbox.
+"""
+import logging
+import os
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from PIL import ImageFont
+
+logger = logging.getLogger(__name__)
+
+REGULAR = 'DejaVuSans.ttf'
+BOLD = 'DejaVuSans-Bold.ttf'
+
+SYSTEM_FONT_DIRS = (
+    # Linux
+    '/usr/share/fonts/truetype/dejavu',
+    # macOS
+    '/System/Library/Fonts/Supplemental',
+    # Windows
+    'C:\\Windows\\Fonts',
+)
+
+
+def font_dirs():
+    return (os.path.join(settings.BASE_DIR, 'core', 'fonts'),) + SYSTEM_FONT_DIRS
+
+
+@lru_cache(maxsize=None)
+def resolve_font_path(bold=False):
+    """
+    Путь к файлу шрифта DejaVu (поиск выполняется один раз)
+
+    Args:
+        bold: Жирное начертание; если его нет, берется обычное
+
+    Returns:
+        str | None: Путь или None, если DejaVu не найден
+    """
+    names = (BOLD, REGULAR) if bold else (REGULAR,)
+    for name in names:
+        for directory in font_dirs():
+            path = os.path.join(directory, name)
+            if os.path.exists(path):
+                logger.info(f"Using font {path}")
+                return path
+    logger.error("No DejaVu font found! Tajik characters may not display correctly.")
+    return None
+
+
+@lru_cache(maxsize=64)
+def load_font(path, size):
+    """Шрифт по (путь, размер); path=None - встроенный шрифт PIL"""
+    if path is None:
+        return ImageFont.load_default()
+    return ImageFont.truetype(path, size)
+
+
+def get_font(size, bold=False):
+    """
+    Шрифт DejaVu нужного размера
+
+    Args:
+        size: Размер в пикселях
+        bold: Жирное начертание
+
+    Returns:
+        ImageFont: Общий для процесса объект шрифта
+    """
+    return load_font(resolve_font_path(bold), size)
+
+
+class GlyphWidths:
+    """Ширины символов одного шрифта, измеренные по одному разу"""
+
+    def __init__(self, font):
+        self.font = font
+        self._widths = {}
+        self._lock = threading.Lock()
+
+    def char_width(self, char):
+        width = self._widths.get(char)
+        if width is None:
+            width = self.font.getlength(char)
+            with self._lock:
+                self._widths[char] = width
+        return width
+
+    def text_width(self, text):
+        """Ширина строки как сумма ширин символов (без кернинга)"""
+        return sum(self.char_width(char) for char in text)
+
+
+_glyph_widths = {}
+_glyph_widths_lock = threading.Lock()
+
+
+def get_glyph_widths(font):
+    """Таблица ширин символов для шрифта (одна на процесс)"""
+    widths = _glyph_widths.get(id(font))
+    if widths is None or widths.font is not font:
+        with _glyph_widths_lock:
+            widths = _glyph_widths.get(id(font))
+            if widths is None or widths.font is not font:
+                widths = _glyph_widths[id(font)] = GlyphWidths(font)
+    return widths
+
+
+def wrap_text(text, font, max_width):
+    """
+    Перенос текста по словам по ширине в пикселях
+
+    Слово длиннее строки не разрывается и занимает строку целиком.
+
+    Args:
+        text: Текст
+        font: ImageFont
+        max_width: Максимальная ширина строки
+
+    Returns:
+        list: Строки
+    """
+    widths = get_glyph_widths(font)
+    space = widths.char_width(' ')
+    lines = []
+    current = []
+    current_width = 0
+
+    for word in text.split():
+        word_width = widths.text_width(word)
+        if current and current_width + space + word_width > max_width:
+            lines.append(' '.join(current))
+            current, current_width = [], 0
+        current_width += word_width + (space if current else 0)
+        current.append(word)
+
+    if current:
+        lines.append(' '.join(current))
+    return lines
+
+
+def truncate_text(text, font, max_width, suffix='...'):
+    """Обрезка строки с многоточием, чтобы она помещалась в max_width"""
+    widths = get_glyph_widths(font)
+    if widths.text_width(text) <= max_width:
+        return text
+    limit = max_width - widths.text_width(suffix)
+    width = 0
+    for index, char in enumerate(text):
+        width += widths.char_width(char)
+        if width > limit:
+            return text[:index].rstrip() + suffix
+    return text
@@ -2,6 +2,7 @@
 Helper функции для уменьшения дублирования кода
 """
 from django.core.cache import cache
+from .caching import make_key
 from .models import UserProfile
 
 
@@ -41,6 +42,9 @@ def cache_key_for_user(prefix, user):
     """
     Создание ключа кэша для пользователя
     
+    Ключ лежит в пространстве имен prefix (см. core.caching), поэтому
+    bump_namespace(prefix) сбрасывает его сразу для всех пользователей.
+    
     Args:
         prefix: Префикс ключа
         user: User объект или None
@@ -49,8 +53,8 @@ def cache_key_for_user(prefix, user):
         str: Ключ кэша
     """
     if user and user.is_authenticated:
-        return f"{prefix}_{user.id}"
-    return f"{prefix}_anonymous"
+        return make_key(prefix, user.id)
+    return make_key(prefix, 'anonymous')
 
 
 def invalidate_user_cache(user, *prefixes):
@@ -0,0 +1,128 @@
+"""
+Постраничная выдача таблицы лидеров
+
+Используется keyset-пагинация по (points, id): курсор хранит последнюю
+показанную пару, следующая страница - это строки строго "ниже" нее.
+Стоимость запроса не зависит от того, насколько глубоко листает пользователь.
+"""
+from django.db.models import Q
+
+from .models import Leaderboard
+from .pagination import decode_key, encode_key
+from . import rank_index
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+DEFAULT_WINDOW = 5
+MAX_WINDOW = 25
+
+
+def encode_cursor(entry):
+    """
+    Кодирование курсора по строке таблицы лидеров
+
+    Args:
+        entry: Leaderboard объект (последний на странице)
+
+    Returns:
+        str: Непрозрачный курсор для следующей страницы
+    """
+    return encode_key(entry.points, entry.id)
+
+
+def decode_cursor(cursor):
+    """
+    Декодирование курсора
+
+    Args:
+        cursor: Строка из encode_cursor
+
+    Returns:
+        tuple | None: (points, id) или None, если курсор невалиден
+    """
+    return decode_key(cursor)
+
+
+def clamp(value, default, maximum):
+    """Безопасное приведение параметра запроса к числу в пределах [1, maximum]"""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(value, maximum))
+
+
+def _base_queryset():
+    return Leaderboard.objects.select_related('user_profile__user')
+
+
+def _attach_ranks(entries):
+    """Проставляет каждой строке место в рейтинге (O(log n) на строку)"""
+    ranks = {}
+    for entry in entries:
+        if entry.points not in ranks:
+            ranks[entry.points] = rank_index.rank_for_points(entry.points)
+        entry.rank = ranks[entry.points]
+    return entries
+
+
+def get_leaderboard_page(cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Страница таблицы лидеров по убыванию очков
+
+    Args:
+        cursor: Курсор предыдущей страницы (None - первая страница)
+        limit: Количество строк
+
+    Returns:
+        tuple: (entries, next_cursor) - next_cursor None на последней странице
+    """
+    queryset = _base_queryset().order_by('-points', 'id')
+    position = decode_cursor(cursor)
+    if position:
+        points, entry_id = position
+        queryset = queryset.filter(Q(points__lt=points) | Q(points=points, id__gt=entry_id))
+
+    # Берем на одну строку больше, чтобы узнать, есть ли следующая страница
+    entries = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = encode_cursor(entries[-1])
+
+    return _attach_ranks(entries), next_cursor
+
+
+def get_leaderboard_window(profile, size=DEFAULT_WINDOW):
+    """
+    Окно таблицы лидеров вокруг пользователя: size строк выше и ниже
+
+    Args:
+        profile: UserProfile объект
+        size: Количество соседей с каждой стороны
+
+    Returns:
+        tuple: (entries, next_cursor) или ([], None), если пользователя нет в рейтинге
+    """
+    me = _base_queryset().filter(user_profile=profile).order_by('-points', 'id').first()
+    if me is None:
+        return [], None
+
+    above = list(
+        _base_queryset()
+        .filter(Q(points__gt=me.points) | Q(points=me.points, id__lt=me.id))
+        .order_by('points', '-id')[:size]
+    )
+    below = list(
+        _base_queryset()
+        .filter(Q(points__lt=me.points) | Q(points=me.points, id__gt=me.id))
+        .order_by('-points', 'id')[:size + 1]
+    )
+
+    next_cursor = None
+    if len(below) > size:
+        below = below[:size]
+        next_cursor = encode_cursor(below[-1])
+
+    entries = list(reversed(above)) + [me] + below
+    return _attach_ranks(entries), next_cursor
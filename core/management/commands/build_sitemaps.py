@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from core import sitemap
+from core.catalog import get_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Собирает sitemap для текущего поколения каталога, чтобы запросы не ждали фоновой сборки'
+
+    def handle(self, *args, **options):
+        snapshot = get_snapshot()
+        directory = sitemap.build_generation(snapshot)
+        self.stdout.write(self.style.SUCCESS(f'✅ Sitemap поколения {snapshot.generation}: {directory}'))
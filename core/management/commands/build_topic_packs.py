@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.catalog import get_snapshot
+from core.topic_packs import build_pack, prune_packs
+
+
+class Command(BaseCommand):
+    help = 'Собирает офлайн-пакеты тем (gzip JSON) для мобильного приложения; неизменившиеся темы пропускаются'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--topic',
+            type=int,
+            action='append',
+            dest='topic_ids',
+            help='ID темы (можно указать несколько раз). По умолчанию - все темы'
+        )
+        parser.add_argument('--prune', action='store_true', help='Удалить устаревшие пакеты')
+
+    def handle(self, *args, **options):
+        if options['prune'] and options['topic_ids']:
+            raise CommandError('--prune работает только при сборке всех тем')
+
+        snapshot = get_snapshot()
+        topics = snapshot.topics
+        if options['topic_ids']:
+            topics = [snapshot.get_topic(topic_id) for topic_id in options['topic_ids']]
+            if None in topics:
+                raise CommandError('Тема не найдена')
+
+        created = total_size = 0
+        keep = set()
+        for topic in topics:
+            pack, was_created = build_pack(topic)
+            keep.add(pack.path)
+            created += was_created
+            total_size += pack.size
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Пакетов: {len(keep)}, собрано заново: {created}, размер: {total_size // 1024} КБ'
+        ))
+
+        if options['prune']:
+            removed = prune_packs(keep)
+            self.stdout.write(f'🧹 Удалено устаревших пакетов: {removed}')
@@ -5,6 +5,7 @@ Django management command для очистки и импорта тестов
 
 from django.core.management.base import BaseCommand
 from core.models import Subject, Topic, Task
+from core.catalog import bump_generation
 from django.db import connection
 import json
 import os
@@ -28,6 +29,8 @@ class Command(BaseCommand):
         self.stdout.write("=" * 70)
         
         self.import_new_data()
+        # Новое поколение каталога - воркеры перечитают снимок
+        bump_generation()
         
         self.stdout.write("\n" + "=" * 70)
         self.stdout.write(self.style.SUCCESS("🎉 ВСЕ ГОТОВО!"))
@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from core.models import Task, Topic, Subject
+from core.catalog import bump_generation
 
 
 class Command(BaseCommand):
@@ -26,6 +27,7 @@ class Command(BaseCommand):
         # Удаляем
         Task.objects.all().delete()
         Topic.objects.all().delete()
+        bump_generation()
         
         self.stdout.write(self.style.SUCCESS(f'✅ Удалено {task_count} заданий'))
         self.stdout.write(self.style.SUCCESS(f'✅ Удалено {topic_count} тем'))
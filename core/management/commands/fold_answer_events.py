@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from core import answer_events
+
+
+class Command(BaseCommand):
+    help = (
+        'Учитывает ответы из журнала AnswerEvent в попытках, XP, рейтинге и прогрессе. '
+        'Нужна при ANSWER_EVENTS["ASYNC"]; прерванный запуск продолжается с сохраненной позиции'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Событий за один проход (по умолчанию ANSWER_EVENTS["FOLD_BATCH"])')
+        parser.add_argument(
+            '--watch',
+            type=int,
+            metavar='SECONDS',
+            help='Фоновый режим: когда новых событий нет, ждать SECONDS секунд и проверять снова'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] is not None and options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть не меньше 1')
+
+        while True:
+            self.run_once(options['batch_size'])
+            if not options['watch']:
+                break
+            close_old_connections()
+            time.sleep(options['watch'])
+
+    def run_once(self, batch_size):
+        """Свертка всех накопившихся событий пачками"""
+        total_events = total_users = 0
+        while True:
+            events, users = answer_events.fold(batch_size)
+            if not events:
+                break
+            total_events += events
+            total_users += users
+        if total_events:
+            self.stdout.write(self.style.SUCCESS(f'✅ Учтено событий: {total_events}, обновлено пользователей: {total_users}'))
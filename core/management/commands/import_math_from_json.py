@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from core.models import Subject, Topic, Task
+from core.catalog import bump_generation
 import json
 import os
 
@@ -196,6 +197,9 @@ class Command(BaseCommand):
                     self.stdout.write('')
                     self.stdout.write(f'   ✅ Импортировано: {topic_imported} | ⏭️  Пропущено: {topic_skipped}')
                 
+                # Новое поколение каталога (после коммита транзакции)
+                bump_generation()
+                
                 # Итоговая статистика
                 self.stdout.write('\n' + '=' * 70)
                 self.stdout.write(self.style.SUCCESS(f'✅ ИМПОРТ ЗАВЕРШЕН УСПЕШНО!'))
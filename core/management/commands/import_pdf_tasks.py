@@ -2,6 +2,7 @@ from django.core.management.base import BaseCommand
 import re
 import PyPDF2
 from core.models import Subject, Topic, Task
+from core.catalog import bump_generation
 
 
 class Command(BaseCommand):
@@ -36,6 +37,7 @@ class Command(BaseCommand):
             # Сохраняем в БД
             self.stdout.write('💾 Сохранение в базу данных...')
             self.save_tasks_to_db(tasks, subject_name)
+            bump_generation()
             self.stdout.write(self.style.SUCCESS('✅ Импорт завершен!'))
         else:
             self.stdout.write(self.style.WARNING('⚠️  Задания не найдены'))
@@ -7,6 +7,7 @@ from dataclasses import dataclass
 
 from django.core.management.base import BaseCommand
 
+from core.catalog import bump_generation
 from core.models import Subject, Task, Topic
 
 
@@ -344,4 +345,5 @@ class Command(BaseCommand):
             )
             created_tasks += 1
 
+        bump_generation()
         self.stdout.write(self.style.SUCCESS(f'✅ Импорт завершен: создано {created_tasks}, пропущено дублей {skipped_tasks}, без ответа {skipped_no_answer}'))
@@ -0,0 +1,114 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from core import ai_content
+from core.ai_executor import get_model
+from core.ai_helper import is_configured
+from core.models import Task
+
+
+class Command(BaseCommand):
+    help = (
+        'Заранее генерирует теорию и подсказки для всех задач (ru и tg) и сохраняет их в TaskAIContent. '
+        'Уже готовые тексты пропускаются, поэтому прерванный запуск можно просто повторить'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kind',
+            action='append',
+            choices=ai_content.KINDS,
+            help='Вид контента (можно указать несколько раз). По умолчанию - теория и подсказки'
+        )
+        parser.add_argument(
+            '--language',
+            action='append',
+            choices=ai_content.LANGUAGES,
+            help='Язык (можно указать несколько раз). По умолчанию - ru и tg'
+        )
+        parser.add_argument('--subject', type=int, help='Только задачи предмета с этим ID')
+        parser.add_argument('--concurrency', type=int, default=4, help='Одновременных запросов к модели (по умолчанию 4)')
+        parser.add_argument('--limit', type=int, help='Сгенерировать не больше N текстов за запуск')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, сколько текстов нужно сгенерировать')
+        parser.add_argument(
+            '--watch',
+            type=int,
+            metavar='SECONDS',
+            help='Фоновый режим: повторять проверку каждые SECONDS секунд'
+        )
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency должен быть не меньше 1')
+        if not options['dry_run'] and not is_configured():
+            raise CommandError('API ключ Gemini не настроен (GEMINI_API_KEY)')
+
+        while True:
+            self.run_once(options)
+            if not options['watch']:
+                break
+            close_old_connections()
+            time.sleep(options['watch'])
+
+    def run_once(self, options):
+        tasks = Task.objects.select_related('subject').only('id', 'question', 'subject__title').order_by('id')
+        if options['subject']:
+            tasks = tasks.filter(subject_id=options['subject'])
+
+        pending = list(ai_content.iter_pending(
+            tasks.iterator(),
+            kinds=options['kind'] or ai_content.KINDS,
+            languages=options['language'] or ai_content.LANGUAGES,
+        ))
+        if options['limit']:
+            pending = pending[:options['limit']]
+
+        self.stdout.write(f'📝 Нужно сгенерировать: {len(pending)}')
+        if options['dry_run'] or not pending:
+            return
+
+        created, failed = self.generate(pending, options['concurrency'])
+        self.stdout.write(self.style.SUCCESS(f'✅ Сгенерировано: {created}, ошибок: {failed}'))
+
+    def generate(self, pending, concurrency):
+        """
+        Генерация в пуле потоков; запись в БД - в основном потоке сразу
+        после каждого ответа, так что прогресс не теряется при прерывании
+        """
+        def call(prompt):
+            return get_model().generate_content(prompt).text
+
+        created = failed = 0
+        items = iter(pending)
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='pregenerate') as pool:
+            # В очереди держим не больше concurrency заданий
+            running = {}
+            for item in items:
+                running[pool.submit(call, item[4])] = item
+                if len(running) >= concurrency:
+                    break
+
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task_id, kind, language, digest, _prompt = running.pop(future)
+                    try:
+                        text = future.result()
+                        if not text:
+                            raise ValueError('empty response')
+                        ai_content.store(task_id, kind, language, digest, text)
+                        created += 1
+                    except Exception as e:
+                        failed += 1
+                        self.stderr.write(f'❌ Задача {task_id} ({kind}, {language}): {e}')
+
+                    if (created + failed) % 50 == 0:
+                        self.stdout.write(f'   ... {created + failed}/{len(pending)}')
+
+                    next_item = next(items, None)
+                    if next_item is not None:
+                        running[pool.submit(call, next_item[4])] = next_item
+
+        return created, failed
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from core import ai_store
+
+
+class Command(BaseCommand):
+    help = 'Удаляет старые и лишние ответы AI из хранилища (AIResponse) и выводит метрики'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age-days',
+            type=int,
+            help='Удалить ответы, не использованные дольше N дней (по умолчанию AI_STORE["MAX_AGE_DAYS"])'
+        )
+        parser.add_argument(
+            '--max-bytes',
+            type=int,
+            help='Оставить не больше N байт, удаляя самые давно использованные (по умолчанию AI_STORE["MAX_BYTES"])'
+        )
+        parser.add_argument('--stats', action='store_true', help='Только показать метрики, ничего не удалять')
+
+    def handle(self, *args, **options):
+        if not options['stats']:
+            expired, evicted = ai_store.prune(options['max_age_days'], options['max_bytes'])
+            self.stdout.write(
+                self.style.SUCCESS(f'✅ Удалено ответов: по возрасту - {expired}, по размеру - {evicted}')
+            )
+
+        for name, value in ai_store.stats().items():
+            self.stdout.write(f'  {name}: {value}')
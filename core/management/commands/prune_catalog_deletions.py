@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from core import sync
+
+
+class Command(BaseCommand):
+    help = 'Удаляет старые записи об удалениях каталога (CatalogDeletion); более старые токены синхронизации получат полный снимок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age-days',
+            type=int,
+            help='Удалить записи старше N дней (по умолчанию SYNC["DELETION_RETENTION_DAYS"])'
+        )
+
+    def handle(self, *args, **options):
+        deleted = sync.prune_deletions(options['max_age_days'])
+        self.stdout.write(self.style.SUCCESS(f'✅ Удалено записей об удалениях: {deleted}'))
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from core.models import TaskAttempt
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет пустые записи TaskAttempt (0 попыток, задача не решена), которые раньше создавались '
+        'при каждом просмотре страницы задачи. Удаляет пачками, чтобы не держать долгих блокировок'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Записей за один DELETE (по умолчанию 1000)')
+        parser.add_argument('--sleep', type=float, default=0, help='Пауза между пачками в секундах')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, сколько записей будет удалено')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть не меньше 1')
+
+        empty = TaskAttempt.objects.filter(attempts=0, is_solved=False)
+        if options['dry_run']:
+            self.stdout.write(f'📝 Пустых записей: {empty.count()}')
+            return
+
+        deleted = 0
+        last_id = 0
+        while True:
+            ids = list(
+                empty.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not ids:
+                break
+            last_id = ids[-1]
+            # Условие повторяется в DELETE: запись могла получить попытку после выборки
+            count, _ = empty.filter(id__in=ids).delete()
+            deleted += count
+            self.stdout.write(f'   ... удалено {deleted}')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Удалено пустых записей: {deleted}'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from core.progress import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики прогресса (UserProgress, UserTopicProgress) по решенным задачам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='user_ids',
+            help='ID пользователя (можно указать несколько раз). По умолчанию - все пользователи'
+        )
+
+    def handle(self, *args, **options):
+        subject_rows, topic_rows = reconcile(options['user_ids'])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✅ Прогресс пересчитан: предметов - {subject_rows}, тем - {topic_rows}'
+            )
+        )
@@ -0,0 +1,168 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from core import og_images
+from core.catalog import get_snapshot
+
+
+def _init_worker():
+    # Для start method spawn (macOS, Windows) Django в процессе пула еще не настроен
+    django.setup()
+
+
+def _render(source, path):
+    # С --force файл заменяется: для --max-bytes важен только прирост размера каталога
+    try:
+        replaced = os.path.getsize(path)
+    except OSError:
+        replaced = 0
+    return og_images.render(source, path) - replaced
+
+
+def _benchmark_source(index):
+    return og_images.ImageSource(
+        -index - 1,
+        f'Ҳисоб кунед: {index} + {index * 7} = ? Суммаи ададҳоро ёбед ва ҷавоби дурустро интихоб кунед.',
+        {'A': str(index * 8), 'B': str(index * 8 + 1), 'C': str(index * 8 - 1), 'D': 'Ҷавоб нест'},
+        'Математика',
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Заранее рендерит OG-картинки задач в кэш на диске (OG_IMAGE_DIR), который отдает task_og_image_view. '
+        'Уже готовые картинки с тем же содержимым пропускаются, поэтому прерванный запуск можно просто повторить'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subject', type=int, help='Только задачи предмета с этим ID')
+        parser.add_argument('--force', action='store_true', help='Перерисовать и готовые картинки')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Процессов рендера (по умолчанию - число ядер)')
+        parser.add_argument('--limit', type=int, help='Отрендерить не больше N картинок за запуск')
+        parser.add_argument(
+            '--max-bytes',
+            type=int,
+            help='Остановиться, когда каталог картинок займет больше N байт'
+        )
+        parser.add_argument('--prune', action='store_true', help='После рендера всех задач удалить устаревшие картинки')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, сколько картинок нужно отрендерить')
+        parser.add_argument(
+            '--benchmark',
+            type=int,
+            metavar='COUNT',
+            help='Только замер: отрендерить COUNT тестовых картинок (без БД и кэша) и показать скорость'
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers должен быть не меньше 1')
+        if options['prune'] and (options['subject'] or options['limit']):
+            raise CommandError('--prune нельзя совмещать с --subject и --limit')
+
+        if options['benchmark']:
+            self.benchmark(options['benchmark'], options['workers'])
+            return
+
+        tasks = get_snapshot().tasks
+        if options['subject']:
+            tasks = [task for task in tasks if task.subject_id == options['subject']]
+
+        keep = set()
+        pending = []
+        for task in tasks:
+            path = og_images.image_path(task)
+            keep.add(path)
+            if options['force'] or not os.path.exists(path):
+                pending.append((og_images.ImageSource.from_task(task), path))
+        if options['limit']:
+            pending = pending[:options['limit']]
+
+        self.stdout.write(f'📝 Задач: {len(tasks)}, нужно отрендерить: {len(pending)}')
+        if options['dry_run']:
+            return
+
+        rendered, failed, stopped = self.render(pending, options['workers'], options['max_bytes'])
+        self.stdout.write(self.style.SUCCESS(f'✅ Отрендерено: {rendered}, ошибок: {failed}'))
+        if stopped:
+            self.stdout.write(self.style.WARNING('⚠️ Достигнут лимит --max-bytes, остальные картинки не отрендерены'))
+
+        if options['prune'] and not stopped and not failed:
+            removed = og_images.prune_images(keep)
+            self.stdout.write(f'🗑  Удалено устаревших картинок: {removed}')
+
+    def render(self, pending, workers, max_bytes=None):
+        """
+        Рендер в пуле процессов; в очереди держим не больше 2 * workers заданий,
+        чтобы лимит размера срабатывал сразу
+
+        Returns:
+            tuple: (rendered, failed, stopped)
+        """
+        used = self.directory_size() if max_bytes else 0
+        rendered = failed = 0
+        stopped = False
+        items = iter(pending)
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            running = {}
+
+            def submit_next():
+                item = next(items, None)
+                if item is not None:
+                    running[pool.submit(_render, *item)] = item[0].id
+
+            for _ in range(workers * 2):
+                submit_next()
+
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task_id = running.pop(future)
+                    try:
+                        used += future.result()
+                        rendered += 1
+                    except Exception as e:
+                        failed += 1
+                        self.stderr.write(f'❌ Задача {task_id}: {e}')
+
+                    if (rendered + failed) % 100 == 0:
+                        self.stdout.write(f'   ... {rendered + failed}/{len(pending)}')
+
+                    if max_bytes and used >= max_bytes:
+                        stopped = True
+                    if not stopped:
+                        submit_next()
+
+        return rendered, failed, stopped
+
+    def directory_size(self):
+        image_dir = og_images.get_og_image_dir()
+        if not os.path.isdir(image_dir):
+            return 0
+        return sum(entry.stat().st_size for entry in os.scandir(image_dir) if entry.is_file())
+
+    def benchmark(self, count, workers):
+        """Скорость рендера (Pillow) на тестовых задачах во временный каталог"""
+        import shutil
+        import tempfile
+
+        tmp_dir = tempfile.mkdtemp(prefix='og-benchmark-')
+        try:
+            pending = [
+                (_benchmark_source(index), os.path.join(tmp_dir, f'{index}.png'))
+                for index in range(count)
+            ]
+            started = time.perf_counter()
+            rendered, failed, _ = self.render(pending, workers)
+            elapsed = time.perf_counter() - started
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        rate = rendered / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {rendered} картинок за {elapsed:.2f} с: {rate:.1f} в секунду, '
+            f'{rate / workers:.1f} в секунду на процесс ({workers} процессов, ошибок: {failed})'
+        ))
@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from core.models import UserProfile, Leaderboard
+from core.rank_index import get_rank_index
 
 class Command(BaseCommand):
     help = 'Синхронизирует таблицу лидеров с профилями пользователей'
@@ -30,6 +31,13 @@ class Command(BaseCommand):
                         self.style.WARNING(f'Обновлена запись для {profile.user.username}: {profile.xp} XP')
                     )
         
+        # Перестраиваем индекс рейтинга по актуальной таблице лидеров
+        members = get_rank_index().reload()
+        if members is None:
+            self.stdout.write(self.style.WARNING('Индекс рейтинга уже перестраивается другим процессом'))
+        else:
+            self.stdout.write(f'Индекс рейтинга перестроен: {members} участников')
+        
         self.stdout.write(
             self.style.SUCCESS(f'\nГотово! Создано: {created}, Обновлено: {synced}')
         )
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_task_core_task_subject_bcc7bf_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='leaderboard',
+            index=models.Index(fields=['-points', 'id'], name='core_leader_points_86874e_idx'),
+        ),
+    ]
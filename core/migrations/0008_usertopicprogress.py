@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_progress(apps, schema_editor):
+    """Заполняем счетчики прогресса по уже решенным задачам"""
+    Task = apps.get_model('core', 'Task')
+    TaskAttempt = apps.get_model('core', 'TaskAttempt')
+    UserProgress = apps.get_model('core', 'UserProgress')
+    UserTopicProgress = apps.get_model('core', 'UserTopicProgress')
+
+    solved = TaskAttempt.objects.filter(is_solved=True)
+    subject_totals = dict(
+        Task.objects.values('subject_id').annotate(total=Count('id')).values_list('subject_id', 'total')
+    )
+
+    UserProgress.objects.bulk_create(
+        [
+            UserProgress(
+                user_id=row['user_id'],
+                subject_id=row['task__subject_id'],
+                completed_tasks=row['solved'],
+                total_tasks=subject_totals.get(row['task__subject_id'], 0),
+            )
+            for row in solved.values('user_id', 'task__subject_id').annotate(solved=Count('id'))
+        ],
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['user', 'subject'],
+        update_fields=['completed_tasks', 'total_tasks'],
+    )
+    UserTopicProgress.objects.bulk_create(
+        [
+            UserTopicProgress(
+                user_id=row['user_id'],
+                topic_id=row['task__topic_id'],
+                completed_tasks=row['solved'],
+            )
+            for row in solved.filter(task__topic__isnull=False)
+            .values('user_id', 'task__topic_id').annotate(solved=Count('id'))
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_leaderboard_points_id_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserTopicProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completed_tasks', models.IntegerField(default=0)),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.topic')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'User Topic Progress',
+                'unique_together': {('user', 'topic')},
+            },
+        ),
+        migrations.RunPython(backfill_progress, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_usertopicprogress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskAIContent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('theory', 'Теория'), ('hint', 'Подсказка')], max_length=16)),
+                ('language', models.CharField(max_length=8)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('text', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ai_content', to='core.task')),
+            ],
+            options={
+                'verbose_name_plural': 'Task AI Content',
+                'unique_together': {('task', 'kind', 'language')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_taskaicontent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIResponse',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('kind', models.CharField(max_length=16)),
+                ('text', models.TextField()),
+                ('size', models.IntegerField(default=0)),
+                ('hits', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name_plural': 'AI Responses',
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:18
+
+from django.db import migrations, models
+
+
+def remove_duplicate_rows(apps, schema_editor):
+    # Для каждого профиля оставляем строку с наибольшими очками
+    Leaderboard = apps.get_model('core', 'Leaderboard')
+    keep = {}
+    duplicates = []
+    for row_id, profile_id in Leaderboard.objects.order_by('user_profile_id', '-points', 'id').values_list('id', 'user_profile_id'):
+        if profile_id in keep:
+            duplicates.append(row_id)
+        else:
+            keep[profile_id] = row_id
+    for start in range(0, len(duplicates), 1000):
+        Leaderboard.objects.filter(id__in=duplicates[start:start + 1000]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_answerevent_eventcursor'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_rows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='leaderboard',
+            constraint=models.UniqueConstraint(fields=('user_profile',), name='core_leaderboard_unique_profile'),
+        ),
+    ]
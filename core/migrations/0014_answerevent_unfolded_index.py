@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_leaderboard_unique_profile'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='answerevent',
+            index=models.Index(condition=models.Q(('folded', False)), fields=['id'], name='core_answerevent_unfolded'),
+        ),
+    ]
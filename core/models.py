@@ -1,20 +1,62 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 
 from django.contrib.auth.models import User
 
-class Subject(models.Model):
+class SyncedQuerySet(models.QuerySet):
+    def delete(self):
+        from .sync import collecting_deletions
+
+        with collecting_deletions():
+            return super().delete()
+
+class SyncedModel(models.Model):
+    """
+    Объект каталога с номером изменения для дельта-синхронизации (core.sync)
+
+    Номер берется из SyncSequence в той же транзакции, что и запись строки,
+    поэтому номера становятся видны в порядке коммитов. queryset.update()
+    save() не вызывает - там sync_seq=next_sequence() передается явно.
+    """
+    sync_seq = models.BigIntegerField(default=0, db_index=True)
+
+    objects = SyncedQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        from .sync import next_sequence
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'sync_seq'}
+        with transaction.atomic():
+            self.sync_seq = next_sequence()
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        from .sync import collecting_deletions
+
+        # Каскад удаляемых тем и задач записывается в CatalogDeletion одной пачкой
+        with collecting_deletions():
+            return super().delete(*args, **kwargs)
+
+class Subject(SyncedModel):
     title = models.CharField(max_length=255)
     icon = models.CharField(max_length=255, blank=True)
     color = models.CharField(max_length=32, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.title
 
-class Topic(models.Model):
+class Topic(SyncedModel):
     subject = models.ForeignKey(Subject, related_name='topics', on_delete=models.CASCADE)
     title = models.CharField(max_length=255)
     order = models.IntegerField(default=0)
     is_locked = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     class Meta:
         ordering = ['order']
@@ -22,7 +64,7 @@ class Topic(models.Model):
     def __str__(self):
         return f"{self.subject.title} - {self.title}"
 
-class Task(models.Model):
+class Task(SyncedModel):
     subject = models.ForeignKey(Subject, related_name='tasks', on_delete=models.CASCADE)
     topic = models.ForeignKey(Topic, related_name='tasks', on_delete=models.CASCADE, null=True, blank=True)
     question = models.TextField()
@@ -31,6 +73,7 @@ class Task(models.Model):
     difficulty = models.IntegerField(default=1)
     order = models.IntegerField(default=0)
     original_test_id = models.IntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         ordering = ['order']
@@ -50,6 +93,31 @@ class Task(models.Model):
     def __str__(self):
         return f"{self.subject.title}: {self.question[:30]}"
 
+class CatalogDeletion(models.Model):
+    """Запись об удалении объекта каталога для дельта-синхронизации (core.sync)"""
+    model = models.CharField(max_length=16)
+    object_id = models.IntegerField()
+    sync_seq = models.BigIntegerField(default=0, db_index=True)
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    def __str__(self):
+        return f"{self.model} #{self.object_id}"
+
+class SyncSequence(models.Model):
+    """
+    Счетчик изменений каталога (одна строка)
+
+    value увеличивается в транзакции, которая меняет каталог, и остается
+    заблокированным до ее коммита. pruned_through - наибольший sync_seq
+    удаленных записей CatalogDeletion: токенам старше него нужна полная
+    синхронизация.
+    """
+    value = models.BigIntegerField(default=0)
+    pruned_through = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.value} (pruned through {self.pruned_through})"
+
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     phone = models.CharField(max_length=32, blank=True)
@@ -66,6 +134,14 @@ class Leaderboard(models.Model):
 
     class Meta:
         ordering = ['-points']
+        indexes = [
+            # Keyset-пагинация таблицы лидеров по (points, id)
+            models.Index(fields=['-points', 'id']),
+        ]
+        constraints = [
+            # Одна строка на профиль: очки пишутся одним upsert (TaskService._award_points)
+            models.UniqueConstraint(fields=['user_profile'], name='core_leaderboard_unique_profile'),
+        ]
 
     def __str__(self):
         return f"{self.user_profile.user.username}: {self.points}"
@@ -89,6 +165,19 @@ class UserProgress(models.Model):
             return 0
         return int((self.completed_tasks / self.total_tasks) * 100)
 
+class UserTopicProgress(models.Model):
+    """Денормализованный счетчик решенных задач пользователя по теме"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    topic = models.ForeignKey(Topic, on_delete=models.CASCADE)
+    completed_tasks = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('user', 'topic')
+        verbose_name_plural = 'User Topic Progress'
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.topic.title}"
+
 class TaskAttempt(models.Model):
     """Отслеживание попыток решения задач"""
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -110,3 +199,75 @@ class TaskAttempt(models.Model):
     
     def __str__(self):
         return f"{self.user.username} - {self.task.question[:30]} - {self.attempts} попыток"
+
+class AnswerEvent(models.Model):
+    """
+    Ответ пользователя на задачу - запись журнала (core.answer_events)
+    
+    Строки только вставляются; меняется лишь folded. folded=True - ответ
+    уже учтен в TaskAttempt (при отправке или командой fold_answer_events).
+    Неучтенные события ищутся по частичному индексу core_answerevent_unfolded.
+    На PostgreSQL по created_at строится BRIN-индекс (миграция 0012).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    task = models.ForeignKey(Task, on_delete=models.CASCADE)
+    answer = models.CharField(max_length=100)
+    is_correct = models.BooleanField()
+    folded = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(folded=False), name='core_answerevent_unfolded'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.task_id} ({'+' if self.is_correct else '-'})"
+
+class EventCursor(models.Model):
+    """Обработчик журнала: блокировка единственного обработчика и ID последнего учтенного события"""
+    name = models.CharField(max_length=32, unique=True)
+    last_event_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name}: {self.last_event_id}"
+
+class TaskAIContent(models.Model):
+    """Заранее сгенерированные теория и подсказки к задаче"""
+    KIND_CHOICES = [
+        ('theory', 'Теория'),
+        ('hint', 'Подсказка'),
+    ]
+    
+    task = models.ForeignKey(Task, related_name='ai_content', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    language = models.CharField(max_length=8)
+    # Хэш входных данных промпта: при изменении задачи запись считается устаревшей
+    content_hash = models.CharField(max_length=64)
+    text = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ('task', 'kind', 'language')
+        verbose_name_plural = 'Task AI Content'
+    
+    def __str__(self):
+        return f"{self.task_id} - {self.kind} ({self.language})"
+
+class AIResponse(models.Model):
+    """Сохраненный ответ AI, адресуемый хэшем входных данных"""
+    key = models.CharField(max_length=64, primary_key=True)
+    kind = models.CharField(max_length=16)
+    text = models.TextField()
+    size = models.IntegerField(default=0)
+    hits = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        verbose_name_plural = 'AI Responses'
+    
+    def __str__(self):
+        return f"{self.kind}: {self.key[:12]}"
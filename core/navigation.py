@@ -0,0 +1,119 @@
+"""
+Индекс навигации по задачам темы
+
+Для каждой темы в кэше хранится словарь
+{task_id: (position, prev_id, next_id, total)}, поэтому страница задачи
+находит свою позицию и соседей без запросов к БД.
+
+Ключ индекса включает версию темы; при импорте или изменении порядка
+задач версия меняется (см. core.signals), и индекс строится заново.
+
+Там же хранится указатель "последняя открытая задача темы" для
+пользователя: просмотр страницы задачи пишет только в кэш, а не в БД.
+"""
+from django.core.cache import cache
+
+from .caching import bump_namespace, get_or_set
+from .models import Task
+
+NAVIGATION_TIMEOUT = 60 * 60 * 24
+LAST_VIEWED_TIMEOUT = 60 * 60 * 24 * 30
+
+
+def _namespace(topic_id):
+    return f'topic_nav_{topic_id}'
+
+
+def build_topic_navigation(topic_id):
+    """
+    Построение индекса навигации по теме (один запрос только за ID)
+
+    Args:
+        topic_id: ID темы
+
+    Returns:
+        dict: {task_id: (position, prev_id, next_id, total)}, position с 1
+    """
+    task_ids = list(
+        Task.objects.filter(topic_id=topic_id).order_by('order', 'id').values_list('id', flat=True)
+    )
+    total = len(task_ids)
+    navigation = {}
+    for index, task_id in enumerate(task_ids):
+        prev_id = task_ids[index - 1] if index > 0 else None
+        next_id = task_ids[index + 1] if index < total - 1 else None
+        navigation[task_id] = (index + 1, prev_id, next_id, total)
+    return navigation
+
+
+def get_topic_navigation(topic_id):
+    """
+    Индекс навигации по теме из кэша (строится при промахе)
+
+    Args:
+        topic_id: ID темы
+
+    Returns:
+        dict: {task_id: (position, prev_id, next_id, total)}
+    """
+    return get_or_set(
+        _namespace(topic_id), ('index',),
+        lambda: build_topic_navigation(topic_id),
+        timeout=NAVIGATION_TIMEOUT
+    )
+
+
+def get_task_position(task):
+    """
+    Позиция задачи в своей теме
+
+    Args:
+        task: Task объект
+
+    Returns:
+        tuple: (position, prev_id, next_id, total)
+    """
+    if not task.topic_id:
+        return 1, None, None, 1
+    position = get_topic_navigation(task.topic_id).get(task.id)
+    if position is None:
+        return 1, None, None, 1
+    return position
+
+
+def invalidate_topic_navigation(*topic_ids):
+    """
+    Сброс индекса навигации для тем
+
+    Args:
+        *topic_ids: ID тем (None пропускаются)
+    """
+    for topic_id in set(topic_ids):
+        if topic_id is not None:
+            bump_namespace(_namespace(topic_id))
+
+
+def _last_viewed_key(user_id, topic_id):
+    return f'last_viewed:{user_id}:{topic_id}'
+
+
+def remember_last_viewed(user_id, task):
+    """
+    Запоминание последней открытой задачи темы
+
+    Args:
+        user_id: ID пользователя
+        task: Task объект (нужны id и topic_id)
+    """
+    if task.topic_id:
+        cache.set(_last_viewed_key(user_id, task.topic_id), task.id, LAST_VIEWED_TIMEOUT)
+
+
+def get_last_viewed(user_id, topic_id):
+    """
+    Последняя открытая пользователем задача темы
+
+    Returns:
+        int | None: ID задачи или None, если указателя нет
+    """
+    return cache.get(_last_viewed_key(user_id, topic_id))
@@ -2,14 +2,14 @@
 Генератор Open Graph изображений для задач
 Создает красивые карточки 1200x630px с текстом вопроса
 """
-from PIL import Image, ImageDraw, ImageFont
-import textwrap
+from PIL import Image, ImageDraw
 from io import BytesIO
-import os
 import logging
-from django.conf import settings
 from django.utils.html import strip_tags
 
+from . import font_registry
+from .font_registry import get_font, truncate_text
+
 logger = logging.getLogger(__name__)
 
 
@@ -36,79 +36,10 @@ def generate_task_og_image(task):
     # Нижний левый угол - светло-фиолетовый круг
     draw.ellipse([-100, 400, 300, 800], fill=(245, 235, 250))
     
-    # Загружаем шрифты с поддержкой таджикского языка
-    title_font = None
-    question_font = None
-    small_font = None
-    
-    # Приоритет шрифтов: используем обычный DejaVu Sans для читабельности
-    font_paths = [
-        # Шрифты из core/fonts/
-        os.path.join(settings.BASE_DIR, 'core', 'fonts', 'DejaVuSans.ttf'),
-        os.path.join(settings.BASE_DIR, 'core', 'fonts', 'DejaVuSans-Bold.ttf'),
-        # Системные шрифты DejaVu (Linux)
-        '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
-        '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf',
-        # macOS
-        '/System/Library/Fonts/Supplemental/DejaVuSans.ttf',
-        # Windows
-        'C:\\Windows\\Fonts\\DejaVuSans.ttf',
-    ]
-    
-    bold_font_paths = [
-        os.path.join(settings.BASE_DIR, 'core', 'fonts', 'DejaVuSans-Bold.ttf'),
-        '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf',
-        '/System/Library/Fonts/Supplemental/DejaVuSans-Bold.ttf',
-        'C:\\Windows\\Fonts\\DejaVuSans-Bold.ttf',
-    ]
-    
-    font_loaded = False
-    loaded_font_path = None
-    loaded_bold_font_path = None
-    
-    # Загружаем обычный шрифт
-    for font_path in font_paths:
-        try:
-            if os.path.exists(font_path):
-                question_font = ImageFont.truetype(font_path, 32)  # Для вопроса
-                small_font = ImageFont.truetype(font_path, 26)  # Для вариантов
-                font_loaded = True
-                loaded_font_path = font_path
-                logger.info(f"Successfully loaded regular font from: {font_path}")
-                break
-        except Exception as e:
-            logger.warning(f"Failed to load font from {font_path}: {str(e)}")
-            continue
-    
-    # Загружаем жирный шрифт для заголовка
-    for bold_path in bold_font_paths:
-        try:
-            if os.path.exists(bold_path):
-                title_font = ImageFont.truetype(bold_path, 36)  # Жирный для бренда
-                loaded_bold_font_path = bold_path
-                logger.info(f"Successfully loaded bold font from: {bold_path}")
-                break
-        except Exception as e:
-            logger.warning(f"Failed to load bold font from {bold_path}: {str(e)}")
-            continue
-    
-    # Если жирный не загрузился, используем обычный
-    if not loaded_bold_font_path and loaded_font_path:
-        title_font = ImageFont.truetype(loaded_font_path, 36)
-    
-    # Если не нашли ни один шрифт - используем встроенный (но он не поддерживает таджикский)
-    if not font_loaded:
-        logger.error("No suitable font found! Tajik characters may not display correctly.")
-        try:
-            title_font = ImageFont.load_default()
-            question_font = ImageFont.load_default()
-            small_font = ImageFont.load_default()
-        except Exception as e:
-            logger.error(f"Failed to load default font: {str(e)}")
-            # Последний fallback - None (PIL будет использовать базовый)
-            title_font = None
-            question_font = None
-            small_font = None
+    # Шрифты с поддержкой таджикского языка загружаются один раз на процесс
+    title_font = get_font(36, bold=True)  # Жирный для бренда
+    question_font = get_font(32)  # Для вопроса
+    small_font = get_font(26)  # Для вариантов
     
     # Отступы
     padding = 70
@@ -128,16 +59,15 @@ def generate_task_og_image(task):
     if len(question_text) > 150:
         question_text = question_text[:147] + "..."
     
-    # Разбиваем текст на строки с учетом ширины
-    max_chars_per_line = 55
-    lines = textwrap.wrap(question_text, width=max_chars_per_line, break_long_words=False, break_on_hyphens=False)
+    # Разбиваем текст на строки по ширине в пикселях (ширины символов из кэша)
+    content_width = width - padding * 2
+    lines = font_registry.wrap_text(question_text, question_font, content_width)
     
     # Ограничиваем количество строк вопроса
     max_lines = 3
     if len(lines) > max_lines:
         lines = lines[:max_lines]
-        if len(lines[-1]) > 50:
-            lines[-1] = lines[-1][:47] + "..."
+        lines[-1] = truncate_text(lines[-1] + "...", question_font, content_width)
     
     # Рисуем вопрос (темно-серый текст)
     y_offset = line_y + 40
@@ -163,14 +93,13 @@ def generate_task_og_image(task):
             for key in sorted(options.keys())[:4]:  # Максимум 4 варианта
                 value = strip_tags(str(options[key]))
                 
-                # Ограничиваем длину варианта
-                if len(value) > 60:
-                    value = value[:57] + "..."
-                
                 # Параметры блока
                 box_height = 50
                 box_width = width - (padding * 2)
                 
+                # Ограничиваем длину варианта шириной блока (за кругом с буквой)
+                value = truncate_text(value, small_font, box_width - 73)
+                
                 # Белый блок с тенью (эффект карточки)
                 # Тень
                 shadow_offset = 3
@@ -240,28 +169,9 @@ def generate_task_og_image(task):
     return buffer
 
 
-def wrap_text(text, font, max_width, draw):
+def wrap_text(text, font, max_width, draw=None):
     """
     Вспомогательная функция для переноса текста по словам
-    с учетом ширины шрифта
+    с учетом ширины шрифта (см. core.font_registry.wrap_text)
     """
-    words = text.split()
-    lines = []
-    current_line = []
-    
-    for word in words:
-        test_line = ' '.join(current_line + [word])
-        bbox = draw.textbbox((0, 0), test_line, font=font)
-        width = bbox[2] - bbox[0]
-        
-        if width <= max_width:
-            current_line.append(word)
-        else:
-            if current_line:
-                lines.append(' '.join(current_line))
-            current_line = [word]
-    
-    if current_line:
-        lines.append(' '.join(current_line))
-    
-    return lines
+    return font_registry.wrap_text(text, font, max_width)
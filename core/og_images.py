@@ -0,0 +1,172 @@
+"""
+Кэш Open Graph изображений задач на диске
+
+Картинка рендерится (core.og_image_generator) один раз на содержимое:
+имя файла включает хэш вопроса, вариантов ответа, названия предмета и
+версии шаблона. Пока содержимое не изменилось, запрос отдает готовый файл;
+хэш же служит ETag и параметром ?v= в og:image, поэтому версионированный
+URL можно кэшировать как immutable.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+from django.conf import settings
+
+# Увеличить при изменении внешнего вида карточки в og_image_generator
+OG_TEMPLATE_VERSION = 2
+
+
+def get_og_image_dir():
+    return str(getattr(settings, 'OG_IMAGE_DIR', os.path.join(settings.BASE_DIR, 'var', 'og')))
+
+
+def content_hash(task):
+    """
+    Хэш всего, что видно на картинке задачи
+
+    Args:
+        task: Task или TaskRecord (нужны question, options и subject.title)
+
+    Returns:
+        str: 32 hex-символа sha256
+    """
+    options = json.dumps(task.options or {}, ensure_ascii=False, sort_keys=True)
+    raw = '\0'.join([str(OG_TEMPLATE_VERSION), task.subject.title, task.question, options])
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+class OGImage:
+    """Отрендеренная картинка на диске"""
+
+    __slots__ = ('task_id', 'digest', 'path', 'size')
+
+    def __init__(self, task_id, digest, path, size):
+        self.task_id = task_id
+        self.digest = digest
+        self.path = path
+        self.size = size
+
+    @property
+    def etag(self):
+        return f'"{self.digest}"'
+
+
+def _image_path(task_id, digest):
+    return os.path.join(get_og_image_dir(), f'task-{task_id}-{digest}.png')
+
+
+def write_atomic(path, data):
+    """Запись файла через временный файл и os.replace - читатели не видят недописанный PNG"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def get_image(task):
+    """
+    Картинка задачи: готовый файл или рендер, если содержимое изменилось
+
+    Args:
+        task: Task или TaskRecord
+
+    Returns:
+        tuple: (OGImage, created)
+    """
+    from .og_image_generator import generate_task_og_image
+
+    digest = content_hash(task)
+    path = _image_path(task.id, digest)
+    if os.path.exists(path):
+        return OGImage(task.id, digest, path, os.path.getsize(path)), False
+
+    data = generate_task_og_image(task).getvalue()
+    write_atomic(path, data)
+    return OGImage(task.id, digest, path, len(data)), True
+
+
+class ImageSource:
+    """
+    Минимальные данные задачи для рендера в другом процессе
+
+    TaskRecord ссылается на весь предмет с темами, поэтому в пул
+    процессов передаются только поля, которые видны на картинке.
+    """
+
+    __slots__ = ('id', 'question', 'options', 'subject')
+
+    def __init__(self, task_id, question, options, subject_title):
+        self.id = task_id
+        self.question = question
+        self.options = options
+        self.subject = _Subject(subject_title)
+
+    @classmethod
+    def from_task(cls, task):
+        return cls(task.id, task.question, task.options, task.subject.title)
+
+    def __getstate__(self):
+        return self.id, self.question, self.options, self.subject.title
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+
+class _Subject:
+    __slots__ = ('title',)
+
+    def __init__(self, title):
+        self.title = title
+
+
+def image_path(task):
+    """Путь файла картинки для текущего содержимого задачи"""
+    return _image_path(task.id, content_hash(task))
+
+
+def render(source, path):
+    """
+    Рендер картинки в файл (выполняется в процессе пула)
+
+    Args:
+        source: ImageSource
+        path: Путь из image_path()
+
+    Returns:
+        int: Размер файла в байтах
+    """
+    from .og_image_generator import generate_task_og_image
+
+    data = generate_task_og_image(source).getvalue()
+    write_atomic(path, data)
+    return len(data)
+
+
+def prune_images(keep):
+    """
+    Удаление картинок, которых нет в keep
+
+    Args:
+        keep: Множество путей актуальных картинок
+
+    Returns:
+        int: Количество удаленных файлов
+    """
+    image_dir = get_og_image_dir()
+    if not os.path.isdir(image_dir):
+        return 0
+    removed = 0
+    for name in os.listdir(image_dir):
+        path = os.path.join(image_dir, name)
+        if name.startswith('task-') and name.endswith('.png') and path not in keep:
+            os.unlink(path)
+            removed += 1
+    return removed
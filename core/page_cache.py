@@ -0,0 +1,122 @@
+"""
+Кэш готовых HTML-страниц для анонимных посетителей
+
+Ключ - пространство имен (с версией, см. core.caching), язык из
+LocaleMiddleware и полный путь с параметрами. Страницы каталога лежат в
+пространстве CATALOG, поэтому любое изменение каталога сразу делает их
+недействительными; рейтинг меняется с каждым ответом, поэтому для него
+пространство не сбрасывается, а TTL короткий.
+
+Защита от stampede: при промахе страницу рендерит только запрос,
+получивший блокировку (атомарный caching.add - и на файловом кэше),
+остальные ждут его результат до LOCK_WAIT секунд и только потом
+рендерят сами.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.translation import get_language
+
+from . import caching
+from .caching import CATALOG, make_key
+
+LEADERBOARD = 'leaderboard_page'
+
+# Совпадает со временем жизни общей статистики на главной
+PAGE_TIMEOUT = 5 * 60
+LEADERBOARD_TIMEOUT = 30
+
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 2.0
+LOCK_POLL = 0.05
+
+# Заголовки, которые можно отдавать другим посетителям
+_SAFE_HEADERS = ('Content-Type', 'Content-Language')
+
+
+def _is_cacheable_request(request):
+    return (
+        request.method in ('GET', 'HEAD')
+        and not request.user.is_authenticated
+        and not len(get_messages(request))
+    )
+
+
+def _is_cacheable_response(request, response):
+    # Ответ с cookie (сессия, CSRF) принадлежит конкретному посетителю
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+    )
+
+
+def _page_key(namespace, request):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return make_key(namespace, 'page', get_language() or '', path)
+
+
+def _to_response(entry):
+    content, headers = entry
+    response = HttpResponse(content)
+    for name, value in headers:
+        response[name] = value
+    return response
+
+
+def _wait_for(key):
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def anonymous_page_cache(namespace=CATALOG, timeout=PAGE_TIMEOUT):
+    """
+    Декоратор: кэширование страницы целиком для анонимных посетителей
+
+    Args:
+        namespace: Пространство имен ключей (сброс версии - сброс страниц)
+        timeout: TTL страницы в секундах
+
+    Returns:
+        function: Декоратор для view(request, ...)
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not _is_cacheable_request(request):
+                return view_func(request, *args, **kwargs)
+
+            key = _page_key(namespace, request)
+            entry = cache.get(key)
+            if entry is not None:
+                return _to_response(entry)
+
+            lock_key = f'{key}:lock'
+            locked = caching.add(lock_key, 1, LOCK_TIMEOUT)
+            if not locked:
+                entry = _wait_for(key)
+                if entry is not None:
+                    return _to_response(entry)
+
+            try:
+                response = view_func(request, *args, **kwargs)
+                if request.method == 'GET' and _is_cacheable_response(request, response):
+                    headers = [(name, response[name]) for name in _SAFE_HEADERS if response.has_header(name)]
+                    cache.set(key, (response.content, headers), timeout)
+            finally:
+                if locked:
+                    cache.delete(lock_key)
+            return response
+
+        return wrapper
+    return decorator
@@ -0,0 +1,156 @@
+"""
+Keyset-пагинация и выборочные поля для API каталога
+
+- Курсор - непрозрачная строка с парой (order, id) последнего объекта
+  страницы; следующая страница - объекты строго после нее. OFFSET нет,
+  стоимость не зависит от глубины.
+- Ответ сохраняет форму PageNumberPagination (count, next, previous,
+  results) и добавляет next_cursor; count - длина кортежа.
+- Страницы строятся из кортежей снимка каталога (core.catalog), которые
+  уже отсортированы по (order, id), - начало страницы ищется бинарным
+  поиском, запросов к БД нет.
+- ?fields=id,question оставляет в ответе только перечисленные поля.
+"""
+import base64
+import binascii
+from bisect import bisect_right
+from collections import OrderedDict
+
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def encode_key(*values):
+    """
+    Кодирование ключа сортировки в курсор
+
+    Args:
+        *values: Целые числа ключа
+
+    Returns:
+        str: Непрозрачный курсор
+    """
+    raw = ':'.join(str(value) for value in values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_key(cursor, size=2):
+    """
+    Декодирование курсора из encode_key
+
+    Returns:
+        tuple | None: Ключ из size целых чисел или None, если курсор невалиден
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = tuple(int(value) for value in base64.urlsafe_b64decode(padded.encode()).decode().split(':'))
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+    return values if len(values) == size else None
+
+
+def parse_fields(request):
+    """
+    Поля из параметра ?fields=a,b,c
+
+    Returns:
+        set | None: Имена полей или None, если параметр не задан
+    """
+    if request is None:
+        return None
+    raw = request.query_params.get('fields')
+    if not raw:
+        return None
+    fields = {name.strip() for name in raw.split(',') if name.strip()}
+    return fields or None
+
+
+class SparseFieldsMixin:
+    """Serializer, который оставляет только поля из ?fields= (id всегда остается)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = parse_fields(self.context.get('request'))
+        if fields:
+            for name in set(self.fields) - fields - {'id'}:
+                self.fields.pop(name)
+
+
+class OrderIdCursorPagination(BasePagination):
+    """
+    Курсорная пагинация по (order, id) для кортежей снимка каталога
+
+    GET ...?limit=50 - первая страница
+    GET ...?cursor=<next_cursor>&limit=50 - следующая
+
+    previous ведет на страницу, которая заканчивается перед текущей.
+    """
+    page_size = 50
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        limit = self.get_page_size(request)
+        position = decode_key(request.query_params.get(self.cursor_query_param))
+
+        # Страница перед текущей: None - ее нет, '' - это первая страница
+        self.previous_cursor = None
+        self.count = len(queryset)
+        start = bisect_right(queryset, position, key=lambda item: (item.order, item.id)) if position else 0
+        if start:
+            item = queryset[start - limit - 1] if start > limit else None
+            self.previous_cursor = encode_key(item.order, item.id) if item else ''
+        rows = list(queryset[start:start + limit + 1])
+
+        self.next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            self.next_cursor = encode_key(rows[-1].order, rows[-1].id)
+        return rows
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_previous_link(self):
+        if self.previous_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        if not self.previous_cursor:
+            return remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.previous_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('next_cursor', self.next_cursor),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['count', 'results'],
+            'properties': {
+                'count': {'type': 'integer'},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'next_cursor': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,328 @@
+"""
+Счетчики прогресса пользователя по предметам и темам
+
+UserProgress и UserTopicProgress хранят количество решенных задач и
+обновляются в той же транзакции, что и первое решение задачи. Чтение
+прогресса - один индексный запрос вместо COUNT по TaskAttempt.
+Расхождения (удаление задач, ручные правки) исправляет команда
+reconcile_progress.
+"""
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from . import db
+from .caching import invalidate_progress
+from .models import Task, TaskAttempt, UserProgress, UserTopicProgress
+
+
+def _increment(model, user_id, amount, defaults=None, **lookup):
+    """
+    completed_tasks += amount для строки (user_id, lookup); строка создается при необходимости
+
+    defaults - значения других столбцов, которые записываются и в новую,
+    и в существующую строку (total_tasks предмета из снимка каталога).
+    """
+    defaults = defaults or {}
+    if db.has_upsert_returning():
+        # Один INSERT ... ON CONFLICT DO UPDATE SET completed_tasks = completed_tasks + n;
+        # остальные столбцы новой строки - defaults или значения по умолчанию модели
+        values = {'user_id': user_id, **lookup, **defaults, 'completed_tasks': amount}
+        for field in model._meta.concrete_fields:
+            if not field.primary_key and field.attname not in values:
+                values[field.attname] = field.get_default()
+        table = db.table(model)
+        updates = [f'completed_tasks = {table}.completed_tasks + excluded.completed_tasks']
+        updates += [f'{name} = excluded.{name}' for name in defaults]
+        db.execute(
+            f'INSERT INTO {table} ({", ".join(values)}) VALUES ({", ".join(["%s"] * len(values))}) '
+            f'ON CONFLICT (user_id, {", ".join(lookup)}) DO UPDATE SET {", ".join(updates)}',
+            list(values.values())
+        )
+        return
+
+    rows = model.objects.filter(user_id=user_id, **lookup)
+    if not rows.update(completed_tasks=F('completed_tasks') + amount, **defaults):
+        model.objects.bulk_create(
+            [model(user_id=user_id, completed_tasks=0, **lookup, **defaults)],
+            ignore_conflicts=True
+        )
+        rows.update(completed_tasks=F('completed_tasks') + amount)
+
+
+def _subject_defaults(subject_id):
+    """total_tasks для строки UserProgress - из снимка каталога"""
+    from .catalog import get_snapshot
+
+    subject = get_snapshot().get_subject(subject_id)
+    return {'total_tasks': subject.total_tasks} if subject is not None else None
+
+
+def record_first_solve(user, task, amount=1):
+    """
+    Учет первого решения задачи в счетчиках прогресса
+
+    Должна вызываться внутри транзакции, отметившей TaskAttempt решенной.
+
+    Args:
+        user: User объект
+        task: Task объект (нужны subject_id и topic_id)
+        amount: На сколько увеличить счетчики
+    """
+    _increment(UserProgress, user.id, amount, _subject_defaults(task.subject_id), subject_id=task.subject_id)
+    if task.topic_id:
+        _increment(UserTopicProgress, user.id, amount, topic_id=task.topic_id)
+
+
+def record_solves(user, tasks):
+    """
+    Учет первых решений нескольких задач одним обновлением на предмет/тему
+
+    Args:
+        user: User объект
+        tasks: Итерируемое задач (нужны subject_id и topic_id)
+    """
+    subjects = Counter(task.subject_id for task in tasks)
+    topics = Counter(task.topic_id for task in tasks if task.topic_id)
+    for subject_id, amount in subjects.items():
+        _increment(UserProgress, user.id, amount, _subject_defaults(subject_id), subject_id=subject_id)
+    for topic_id, amount in topics.items():
+        _increment(UserTopicProgress, user.id, amount, topic_id=topic_id)
+
+
+def get_subject_solved_counts(user):
+    """
+    Количество решенных задач по предметам
+
+    Returns:
+        dict: {subject_id: completed_tasks}
+    """
+    return dict(
+        UserProgress.objects.filter(user=user).values_list('subject_id', 'completed_tasks')
+    )
+
+
+def get_topic_solved_counts(user, subject_id=None, topic_ids=None):
+    """
+    Количество решенных задач по темам
+
+    Args:
+        user: User объект
+        subject_id: Ограничить темами одного предмета (опционально)
+        topic_ids: Ограничить этими темами (опционально)
+
+    Returns:
+        dict: {topic_id: completed_tasks}
+    """
+    rows = UserTopicProgress.objects.filter(user=user)
+    if subject_id is not None:
+        rows = rows.filter(topic__subject_id=subject_id)
+    if topic_ids is not None:
+        rows = rows.filter(topic_id__in=topic_ids)
+    return dict(rows.values_list('topic_id', 'completed_tasks'))
+
+
+@transaction.atomic
+def reconcile(user_ids=None):
+    """
+    Пересчет счетчиков прогресса по таблице TaskAttempt
+
+    Args:
+        user_ids: Список ID пользователей (None - все пользователи)
+
+    Returns:
+        tuple: (subject_rows, topic_rows) - количество записанных строк
+    """
+    attempts = TaskAttempt.objects.filter(is_solved=True)
+    subject_progress = UserProgress.objects.all()
+    topic_progress = UserTopicProgress.objects.all()
+    if user_ids is not None:
+        attempts = attempts.filter(user_id__in=user_ids)
+        subject_progress = subject_progress.filter(user_id__in=user_ids)
+        topic_progress = topic_progress.filter(user_id__in=user_ids)
+
+    subject_totals = dict(
+        Task.objects.values('subject_id').annotate(total=Count('id')).values_list('subject_id', 'total')
+    )
+
+    # Сбрасываем счетчики и записываем актуальные значения одним upsert;
+    # total_tasks обновляем и у строк, где решенных задач не осталось
+    subject_task_count = (
+        Task.objects.filter(subject_id=OuterRef('subject_id'))
+        .values('subject_id').annotate(total=Count('id')).values('total')
+    )
+    subject_progress.update(completed_tasks=0, total_tasks=Coalesce(Subquery(subject_task_count), Value(0)))
+    topic_progress.update(completed_tasks=0)
+
+    subject_rows = [
+        UserProgress(
+            user_id=row['user_id'],
+            subject_id=row['task__subject_id'],
+            completed_tasks=row['solved'],
+            total_tasks=subject_totals.get(row['task__subject_id'], 0),
+        )
+        for row in attempts.values('user_id', 'task__subject_id').annotate(solved=Count('id'))
+    ]
+    topic_rows = [
+        UserTopicProgress(
+            user_id=row['user_id'],
+            topic_id=row['task__topic_id'],
+            completed_tasks=row['solved'],
+        )
+        for row in attempts.filter(task__topic__isnull=False)
+        .values('user_id', 'task__topic_id').annotate(solved=Count('id'))
+    ]
+
+    UserProgress.objects.bulk_create(
+        subject_rows,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['user', 'subject'],
+        update_fields=['completed_tasks', 'total_tasks'],
+    )
+    UserTopicProgress.objects.bulk_create(
+        topic_rows,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['user', 'topic'],
+        update_fields=['completed_tasks'],
+    )
+
+    if user_ids is None:
+        invalidate_progress()
+    else:
+        for user_id in user_ids:
+            invalidate_progress(user_id)
+    return len(subject_rows), len(topic_rows)
+
+
+@contextmanager
+def reconciling(tasks):
+    """
+    Пересчет счетчиков после массового изменения задач (перенос, удаление)
+
+    queryset.update() и удаление не проходят через TaskService, поэтому
+    счетчики пользователей, решивших эти задачи, пересчитываются в той же
+    транзакции после блока.
+
+    Args:
+        tasks: QuerySet задач, которые изменяются внутри блока
+    """
+    with transaction.atomic():
+        user_ids = list(
+            TaskAttempt.objects.filter(task__in=tasks, is_solved=True)
+            .values_list('user_id', flat=True).distinct()
+        )
+        yield
+        if user_ids:
+            reconcile(user_ids)
+
+
+class ProgressMap:
+    """
+    Прогресс одного пользователя для ответа API
+
+    Читаются только строки объектов ответа: списки сериализаторов
+    (ProgressListSerializer) заранее регистрируют ID через prefetch, и
+    при первом обращении они загружаются одним запросом. ID, которого
+    не было в prefetch (одиночный объект), загружается отдельно вместе
+    с остальными ожидающими. Количество запросов не зависит от
+    количества тем и задач в ответе.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._subject_solved = None
+        self._topic_solved = {}
+        self._attempts = {}
+        self._pending_topics = set()
+        self._pending_tasks = set()
+
+    @property
+    def subject_solved(self):
+        """dict: {subject_id: completed_tasks} (предметов немного - читаются все)"""
+        if self._subject_solved is None:
+            self._subject_solved = get_subject_solved_counts(self.user)
+        return self._subject_solved
+
+    def prefetch(self, topic_ids=(), task_ids=()):
+        """
+        Регистрация ID объектов ответа для загрузки одним запросом
+
+        Args:
+            topic_ids: ID тем
+            task_ids: ID задач
+        """
+        self._pending_topics.update(topic_id for topic_id in topic_ids if topic_id not in self._topic_solved)
+        self._pending_tasks.update(task_id for task_id in task_ids if task_id not in self._attempts)
+
+    def load(self):
+        """Загрузка всех зарегистрированных ID (не больше запроса на таблицу)"""
+        if self._pending_topics:
+            ids, self._pending_topics = self._pending_topics, set()
+            counts = get_topic_solved_counts(self.user, topic_ids=ids)
+            self._topic_solved.update((topic_id, counts.get(topic_id, 0)) for topic_id in ids)
+        if self._pending_tasks:
+            ids, self._pending_tasks = self._pending_tasks, set()
+            attempts = get_attempts_map(self.user, ids)
+            self._attempts.update((task_id, attempts.get(task_id, (0, False))) for task_id in ids)
+
+    def topic_completed(self, topic_id):
+        """int: Решено задач темы"""
+        if topic_id not in self._topic_solved:
+            self.prefetch(topic_ids=(topic_id,))
+            self.load()
+        return self._topic_solved[topic_id]
+
+    def attempt(self, task_id):
+        """tuple: (attempts, is_solved) по задаче"""
+        if task_id not in self._attempts:
+            self.prefetch(task_ids=(task_id,))
+            self.load()
+        return self._attempts[task_id]
+
+
+def get_attempts_map(user, task_ids=None):
+    """
+    Попытки пользователя по задачам
+
+    Args:
+        user: User объект
+        task_ids: Ограничить этими задачами (опционально)
+
+    Returns:
+        dict: {task_id: (attempts, is_solved)}
+    """
+    rows = TaskAttempt.objects.filter(user=user)
+    if task_ids is not None:
+        rows = rows.filter(task_id__in=task_ids)
+    return {
+        task_id: (attempts, is_solved)
+        for task_id, attempts, is_solved in rows.values_list('task_id', 'attempts', 'is_solved')
+    }
+
+
+def get_progress_map(context):
+    """
+    ProgressMap из контекста сериализатора (создается один раз на запрос)
+
+    Вложенные сериализаторы используют контекст корневого, поэтому
+    карта общая для всего ответа.
+
+    Args:
+        context: serializer.context
+
+    Returns:
+        ProgressMap | None: None для анонимного пользователя
+    """
+    request = context.get('request')
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return None
+    progress = context.get('progress')
+    if progress is None:
+        progress = context['progress'] = ProgressMap(user)
+    return progress
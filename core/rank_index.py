@@ -0,0 +1,565 @@
+"""
+Индекс рейтинга (leaderboard) с O(log n) поиском позиции и топа
+
+Позиция пользователя считается как в турнирной таблице: количество
+участников с бОльшим числом очков + 1 (одинаковые очки - одинаковое место).
+
+Бэкенды:
+- RedisRankIndex - sorted set на Redis, общий для всех воркеров. Это
+  бэкенд для продакшена с несколькими воркерами gunicorn.
+- SkipListRankIndex - индексируемый skip-list внутри процесса. Только для
+  одного процесса (runserver, тесты, один воркер): у каждого процесса
+  своя копия, и update() в одном воркере не виден другим.
+
+Бэкенд выбирается настройкой RANK_INDEX в settings.py.
+"""
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RANK_INDEX = {
+    'BACKEND': 'core.rank_index.SkipListRankIndex',
+    'OPTIONS': {},
+}
+
+
+def load_entries():
+    """
+    Загрузка пар (user_profile_id, points) из таблицы лидеров
+
+    Returns:
+        dict: {user_profile_id: points}
+    """
+    from .models import Leaderboard
+
+    entries = {}
+    for member, points in Leaderboard.objects.values_list('user_profile_id', 'points').iterator():
+        if member not in entries or points > entries[member]:
+            entries[member] = points
+    return entries
+
+
+class BaseRankIndex:
+    """Общий интерфейс индекса рейтинга"""
+
+    def update(self, member, points):
+        """Добавить или обновить участника"""
+        raise NotImplementedError
+
+    def remove(self, member):
+        """Удалить участника из индекса"""
+        raise NotImplementedError
+
+    def rank(self, member):
+        """
+        Позиция участника в рейтинге
+
+        Args:
+            member: ID профиля пользователя
+
+        Returns:
+            int | None: Позиция (с 1) или None, если участника нет в индексе
+        """
+        raise NotImplementedError
+
+    def rank_for_points(self, points):
+        """Позиция, которую занимал бы участник с данным числом очков"""
+        raise NotImplementedError
+
+    def top(self, limit, offset=0):
+        """
+        Участники с наибольшим числом очков
+
+        Returns:
+            list: [(member, points), ...] по убыванию очков
+        """
+        raise NotImplementedError
+
+    def count(self):
+        """Количество участников в индексе"""
+        raise NotImplementedError
+
+    def rebuild(self, entries):
+        """
+        Полная перестройка индекса
+
+        Args:
+            entries: dict {member: points}
+        """
+        raise NotImplementedError
+
+    def reload(self):
+        """
+        Перестройка по таблице лидеров без потери обновлений, пришедших
+        во время чтения таблицы
+
+        Returns:
+            int | None: Количество участников или None, если перестройку
+                уже выполняет другой процесс
+        """
+        raise NotImplementedError
+
+
+class _Node:
+    __slots__ = ('key', 'forward', 'span')
+
+    def __init__(self, key, level):
+        self.key = key
+        self.forward = [None] * level
+        self.span = [0] * level
+
+
+class SkipListRankIndex(BaseRankIndex):
+    """
+    Индексируемый skip-list в памяти процесса
+
+    Ключ узла - (-points, member), поэтому обход слева направо идет
+    по убыванию очков. Каждая ссылка хранит ширину (span), что дает
+    поиск позиции и доступ по номеру за O(log n).
+
+    Только для одного процесса: при нескольких воркерах у каждого своя
+    копия, поэтому места расходятся до следующего перечитывания из БД
+    (не чаще раза в max_age секунд). Таблица читается без блокировки
+    индекса - пока идет перечитывание, запросы отвечают по прежним
+    данным, а обновления за это время применяются поверх прочитанного.
+    """
+
+    MAX_LEVEL = 32
+    P = 0.25
+
+    def __init__(self, max_age=60):
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self._loaded_at = None
+        # Обновления во время чтения таблицы: {member: points | None}
+        self._pending = None
+        self._reset()
+
+    def _reset(self):
+        self._header = _Node(None, self.MAX_LEVEL)
+        self._level = 1
+        self._length = 0
+        self._scores = {}
+
+    def _is_fresh(self):
+        if self._loaded_at is None:
+            return False
+        return not self.max_age or time.monotonic() - self._loaded_at < self.max_age
+
+    def _ensure_loaded(self):
+        if self._is_fresh():
+            return
+        # Ждем только первую загрузку; дальше перечитывает один поток, остальные отвечают по прежним данным
+        if not self._load_lock.acquire(blocking=self._loaded_at is None):
+            return
+        try:
+            if not self._is_fresh():
+                self._reload()
+        finally:
+            self._load_lock.release()
+
+    def _reload(self):
+        with self._lock:
+            self._pending = {}
+        try:
+            entries = load_entries()
+        except BaseException:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            for member, points in self._pending.items():
+                if points is None:
+                    entries.pop(member, None)
+                else:
+                    entries[member] = points
+            self._pending = None
+            self.rebuild(entries)
+        return len(entries)
+
+    def _random_level(self):
+        level = 1
+        while level < self.MAX_LEVEL and random.random() < self.P:
+            level += 1
+        return level
+
+    def _insert(self, key):
+        update = [None] * self.MAX_LEVEL
+        rank = [0] * self.MAX_LEVEL
+        x = self._header
+        for i in range(self._level - 1, -1, -1):
+            rank[i] = 0 if i == self._level - 1 else rank[i + 1]
+            while x.forward[i] is not None and x.forward[i].key < key:
+                rank[i] += x.span[i]
+                x = x.forward[i]
+            update[i] = x
+
+        level = self._random_level()
+        if level > self._level:
+            for i in range(self._level, level):
+                rank[i] = 0
+                update[i] = self._header
+                self._header.span[i] = self._length
+            self._level = level
+
+        node = _Node(key, level)
+        for i in range(level):
+            node.forward[i] = update[i].forward[i]
+            update[i].forward[i] = node
+            node.span[i] = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i] = (rank[0] - rank[i]) + 1
+
+        for i in range(level, self._level):
+            update[i].span[i] += 1
+
+        self._length += 1
+
+    def _delete(self, key):
+        update = [None] * self.MAX_LEVEL
+        x = self._header
+        for i in range(self._level - 1, -1, -1):
+            while x.forward[i] is not None and x.forward[i].key < key:
+                x = x.forward[i]
+            update[i] = x
+
+        x = x.forward[0]
+        if x is None or x.key != key:
+            return False
+
+        for i in range(self._level):
+            if update[i].forward[i] is x:
+                update[i].span[i] += x.span[i] - 1
+                update[i].forward[i] = x.forward[i]
+            else:
+                update[i].span[i] -= 1
+
+        while self._level > 1 and self._header.forward[self._level - 1] is None:
+            self._level -= 1
+        self._length -= 1
+        return True
+
+    def _count_less(self, key):
+        count = 0
+        x = self._header
+        for i in range(self._level - 1, -1, -1):
+            while x.forward[i] is not None and x.forward[i].key < key:
+                count += x.span[i]
+                x = x.forward[i]
+        return count
+
+    def _node_at(self, index):
+        traversed = 0
+        x = self._header
+        for i in range(self._level - 1, -1, -1):
+            while x.forward[i] is not None and traversed + x.span[i] <= index + 1:
+                traversed += x.span[i]
+                x = x.forward[i]
+            if traversed == index + 1:
+                return x
+        return None
+
+    def update(self, member, points):
+        with self._lock:
+            if self._pending is not None:
+                self._pending[member] = points
+            if self._loaded_at is None:
+                # Индекс еще не загружен - актуальные очки придут из БД
+                return
+            old = self._scores.get(member)
+            if old == points:
+                return
+            if old is not None:
+                self._delete((-old, member))
+            self._insert((-points, member))
+            self._scores[member] = points
+
+    def remove(self, member):
+        with self._lock:
+            if self._pending is not None:
+                self._pending[member] = None
+            old = self._scores.pop(member, None)
+            if old is not None:
+                self._delete((-old, member))
+
+    def rank(self, member):
+        self._ensure_loaded()
+        with self._lock:
+            points = self._scores.get(member)
+            if points is None:
+                return None
+            return self._count_less((-points, float('-inf'))) + 1
+
+    def rank_for_points(self, points):
+        self._ensure_loaded()
+        with self._lock:
+            return self._count_less((-points, float('-inf'))) + 1
+
+    def top(self, limit, offset=0):
+        self._ensure_loaded()
+        with self._lock:
+            result = []
+            node = self._node_at(offset) if offset < self._length else None
+            while node is not None and len(result) < limit:
+                result.append((node.key[1], -node.key[0]))
+                node = node.forward[0]
+            return result
+
+    def count(self):
+        self._ensure_loaded()
+        with self._lock:
+            return self._length
+
+    def rebuild(self, entries):
+        with self._lock:
+            self._reset()
+            for member, points in entries.items():
+                self._insert((-points, member))
+                self._scores[member] = points
+            self._loaded_at = time.monotonic()
+
+    def reload(self):
+        with self._load_lock:
+            return self._reload()
+
+
+class RedisRankIndex(BaseRankIndex):
+    """
+    Sorted set на Redis, общий для всех воркеров gunicorn
+
+    update() сразу виден всем воркерам, а таблица лидеров читается только
+    при reload() (команда sync_leaderboard) и если ключ пропал (Redis
+    перезапущен без сохранения) - наличие ключа :built проверяется не
+    чаще раза в CHECK_INTERVAL секунд. Требует пакет redis.
+
+    Перестройка не теряет обновлений: пока она идет (ключ :rebuilding,
+    он же не дает перестраивать двум процессам сразу), update() и
+    remove() меняют и основной, и временный ключ. Очки из таблицы
+    добавляются во временный ключ через ZADD NX, то есть не затирают
+    более новые, а затем временный ключ атомарно заменяет основной.
+    """
+
+    CHECK_INTERVAL = 10
+    REBUILD_TIMEOUT = 300
+
+    # KEYS: key, rebuilding, tmp, removed, built
+    _START_SCRIPT = """
+if redis.call('SET', KEYS[2], 1, 'NX', 'EX', ARGV[1]) then
+    redis.call('DEL', KEYS[3], KEYS[4])
+    return 1
+end
+return 0
+"""
+    _UPDATE_SCRIPT = """
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('ZADD', KEYS[3], ARGV[2], ARGV[1])
+    redis.call('SREM', KEYS[4], ARGV[1])
+end
+"""
+    _REMOVE_SCRIPT = """
+redis.call('ZREM', KEYS[1], ARGV[1])
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('ZREM', KEYS[3], ARGV[1])
+    redis.call('SADD', KEYS[4], ARGV[1])
+end
+"""
+    _FINISH_SCRIPT = """
+for _, member in ipairs(redis.call('SMEMBERS', KEYS[4])) do
+    redis.call('ZREM', KEYS[3], member)
+end
+if redis.call('EXISTS', KEYS[3]) == 1 then
+    redis.call('RENAME', KEYS[3], KEYS[1])
+else
+    redis.call('DEL', KEYS[1])
+end
+redis.call('DEL', KEYS[2], KEYS[4])
+redis.call('SET', KEYS[5], 1)
+"""
+
+    def __init__(self, url='redis://127.0.0.1:6379/0', key='hushyor:leaderboard'):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImproperlyConfigured('RedisRankIndex требует пакет redis') from e
+
+        self.key = key
+        self._built_key = f'{key}:built'
+        self._keys = [key, f'{key}:rebuilding', f'{key}:tmp', f'{key}:removed', self._built_key]
+        self._client = redis.Redis.from_url(url)
+        self._start = self._client.register_script(self._START_SCRIPT)
+        self._update = self._client.register_script(self._UPDATE_SCRIPT)
+        self._remove = self._client.register_script(self._REMOVE_SCRIPT)
+        self._finish = self._client.register_script(self._FINISH_SCRIPT)
+        self._checked_at = None
+
+    def _ensure_loaded(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.CHECK_INTERVAL:
+            return
+        if not self._client.exists(self._built_key):
+            self.reload()
+        self._checked_at = now
+
+    def update(self, member, points):
+        self._update(keys=self._keys, args=[member, points])
+
+    def remove(self, member):
+        self._remove(keys=self._keys, args=[member])
+
+    def rank(self, member):
+        self._ensure_loaded()
+        points = self._client.zscore(self.key, member)
+        if points is None:
+            return None
+        return self.rank_for_points(points)
+
+    def rank_for_points(self, points):
+        self._ensure_loaded()
+        return self._client.zcount(self.key, f'({points}', '+inf') + 1
+
+    def top(self, limit, offset=0):
+        self._ensure_loaded()
+        if limit <= 0:
+            return []
+        rows = self._client.zrevrange(self.key, offset, offset + limit - 1, withscores=True)
+        return [(int(member), int(points)) for member, points in rows]
+
+    def count(self):
+        self._ensure_loaded()
+        return self._client.zcard(self.key)
+
+    def _rebuild(self, loader):
+        if not self._start(keys=self._keys, args=[self.REBUILD_TIMEOUT]):
+            logger.info("Rank index rebuild is already running in another process")
+            return None
+        try:
+            entries = loader()
+            items = list(entries.items())
+            pipe = self._client.pipeline(transaction=False)
+            for start in range(0, len(items), 1000):
+                pipe.zadd(self._keys[2], dict(items[start:start + 1000]), nx=True)
+            pipe.execute()
+            self._finish(keys=self._keys)
+        except BaseException:
+            self._client.delete(*self._keys[1:4])
+            raise
+        self._checked_at = time.monotonic()
+        return len(entries)
+
+    def rebuild(self, entries):
+        self._rebuild(lambda: entries)
+
+    def reload(self):
+        return self._rebuild(load_entries)
+
+
+_rank_index = None
+_rank_index_lock = threading.Lock()
+
+
+def get_rank_index():
+    """
+    Получение индекса рейтинга, настроенного в settings.RANK_INDEX
+
+    Returns:
+        BaseRankIndex: Экземпляр бэкенда (один на процесс)
+    """
+    global _rank_index
+    if _rank_index is None:
+        with _rank_index_lock:
+            if _rank_index is None:
+                config = getattr(settings, 'RANK_INDEX', DEFAULT_RANK_INDEX)
+                backend_class = import_string(config.get('BACKEND', DEFAULT_RANK_INDEX['BACKEND']))
+                _rank_index = backend_class(**config.get('OPTIONS', {}))
+    return _rank_index
+
+
+def _db_rank_for_points(points):
+    from .models import Leaderboard
+
+    return Leaderboard.objects.filter(points__gt=points).count() + 1
+
+
+def rank(member):
+    """
+    Позиция участника по индексу, а если индекс недоступен - по БД
+
+    Ошибка бэкенда (Redis недоступен, не удалось перечитать таблицу)
+    не должна ронять страницу рейтинга: она логируется, и позиция
+    считается запросом COUNT(points > x) к таблице лидеров.
+
+    Args:
+        member: ID профиля пользователя
+
+    Returns:
+        int | None: Позиция (с 1) или None, если участника нет в рейтинге
+    """
+    from .models import Leaderboard
+
+    try:
+        return get_rank_index().rank(member)
+    except Exception as e:
+        logger.error(f"Rank index is unavailable, counting rank of profile {member} in DB: {e}")
+    points = Leaderboard.objects.filter(user_profile_id=member).values_list('points', flat=True).first()
+    if points is None:
+        return None
+    return _db_rank_for_points(points)
+
+
+def rank_for_points(points):
+    """
+    Позиция для числа очков по индексу, а если индекс недоступен - по БД
+
+    Returns:
+        int: Позиция (с 1)
+    """
+    try:
+        return get_rank_index().rank_for_points(points)
+    except Exception as e:
+        logger.error(f"Rank index is unavailable, counting rank for {points} points in DB: {e}")
+    return _db_rank_for_points(points)
+
+
+def count():
+    """
+    Количество участников рейтинга по индексу, а если индекс недоступен - по БД
+
+    Returns:
+        int
+    """
+    from .models import Leaderboard
+
+    try:
+        return get_rank_index().count()
+    except Exception as e:
+        logger.error(f"Rank index is unavailable, counting leaderboard in DB: {e}")
+    return Leaderboard.objects.count()
+
+
+def schedule_update(member, points):
+    """
+    Обновление индекса после коммита текущей транзакции
+
+    Ошибки индекса не должны ломать начисление очков, поэтому они
+    только логируются - индекс восстановится при следующей перестройке.
+
+    Args:
+        member: ID профиля пользователя
+        points: Новое количество очков
+    """
+    def _update():
+        try:
+            get_rank_index().update(member, points)
+        except Exception as e:
+            logger.error(f"Failed to update rank index for profile {member}: {e}", exc_info=True)
+
+    transaction.on_commit(_update)
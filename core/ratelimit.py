@@ -0,0 +1,153 @@
+"""
+Ограничение частоты запросов: скользящее окно поверх общего кэша
+
+Счетчик на каждое окно хранится отдельным ключом кэша. Оценка числа
+запросов за последние window секунд - текущее окно плюс предыдущее с весом
+оставшейся доли (sliding window counter), поэтому окно не сбрасывается
+при каждом запросе и нет всплеска 2 * limit на границе окон.
+
+Счетчики лежат в общем кэше (settings.RATELIMIT_CACHE, по умолчанию
+default): Redis в продакшене и файловый кэш локально, - так что лимит
+один на все воркеры gunicorn. Увеличение атомарно: у Redis, memcached и
+locmem есть собственный incr, а для остальных бэкендов (файловый кэш, БД)
+чтение и запись счетчика выполняются под core.caching.cache_lock.
+
+Одна политика (RatePolicy) применяется и в HTML-представлениях (hit),
+и в DRF (core.throttling.SlidingWindowThrottle). Частота берется из
+REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] по scope.
+"""
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .caching import cache_lock, has_atomic_ops
+
+AI = 'ai'
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+class RatePolicy:
+    """Не больше limit запросов за window секунд"""
+
+    __slots__ = ('scope', 'limit', 'window')
+
+    def __init__(self, scope, limit, window):
+        self.scope = scope
+        self.limit = limit
+        self.window = window
+
+    @classmethod
+    def from_rate(cls, scope, rate):
+        """
+        Политика из строки в формате DRF
+
+        Args:
+            scope: Имя политики (часть ключа кэша)
+            rate: Строка вида '10/hour', '5/m'
+
+        Returns:
+            RatePolicy
+        """
+        count, period = rate.split('/')
+        return cls(scope, int(count), PERIODS[period[0]])
+
+
+class RateLimitResult:
+    """Результат проверки: пропущен ли запрос и когда можно повторить"""
+
+    __slots__ = ('allowed', 'remaining', 'retry_after')
+
+    def __init__(self, allowed, remaining, retry_after):
+        self.allowed = allowed
+        self.remaining = remaining
+        self.retry_after = retry_after
+
+
+def get_policy(scope):
+    """Политика для scope из REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']"""
+    rates = getattr(settings, 'REST_FRAMEWORK', {}).get('DEFAULT_THROTTLE_RATES', {})
+    return RatePolicy.from_rate(scope, rates[scope])
+
+
+def get_cache():
+    return caches[getattr(settings, 'RATELIMIT_CACHE', 'default')]
+
+
+def client_ident(request):
+    """
+    Идентификатор клиента: пользователь или IP для анонимов
+
+    Args:
+        request: HttpRequest или DRF Request
+
+    Returns:
+        str
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user-{user.pk}'
+    return f'ip-{request.META.get("REMOTE_ADDR")}'
+
+
+def _incr(cache, key, delta, timeout):
+    """Атомарное изменение счетчика; возвращает новое значение"""
+    if has_atomic_ops(cache):
+        for _ in range(2):
+            cache.add(key, 0, timeout)
+            try:
+                return cache.incr(key, delta)
+            except ValueError:
+                # Ключ истек между add и incr
+                continue
+        return delta
+
+    # BaseCache.incr - это get + set со сроком жизни по умолчанию
+    with cache_lock(cache):
+        value = cache.get(key, 0) + delta
+        cache.set(key, value, timeout)
+        return value
+
+
+def _key(policy, ident, window_index):
+    return f'ratelimit:{policy.scope}:{ident}:{window_index}'
+
+
+def hit(policy, ident, now=None):
+    """
+    Учет запроса клиента по политике
+
+    Отклоненный запрос лимит не расходует.
+
+    Args:
+        policy: RatePolicy
+        ident: Идентификатор клиента (client_ident)
+        now: Время в секундах (для тестов)
+
+    Returns:
+        RateLimitResult
+    """
+    cache = get_cache()
+    now = time.time() if now is None else now
+    window_index, offset = divmod(now, policy.window)
+    window_index = int(window_index)
+    current_key = _key(policy, ident, window_index)
+
+    count = _incr(cache, current_key, 1, policy.window * 2)
+    previous = cache.get(_key(policy, ident, window_index - 1), 0)
+    previous_weight = 1 - offset / policy.window
+    estimated = previous * previous_weight + count
+
+    if estimated <= policy.limit:
+        return RateLimitResult(True, int(policy.limit - estimated), 0)
+
+    _incr(cache, current_key, -1, policy.window * 2)
+    if count > policy.limit or not previous:
+        # Текущее окно заполнено само по себе
+        wait = policy.window - offset
+    else:
+        # Ждем, пока вес предыдущего окна уменьшится настолько, чтобы запрос поместился
+        wait = policy.window * (1 - (policy.limit - count) / previous) - offset
+    return RateLimitResult(False, 0, max(1, math.ceil(wait)))
@@ -1,16 +1,22 @@
+from django.db import models
 from rest_framework import serializers
 from .models import Subject, Task, UserProfile, Leaderboard, UserProgress, Topic, TaskAttempt
 from django.contrib.auth.models import User
 
+from .catalog import get_snapshot
+from .pagination import SparseFieldsMixin
+from .progress import get_progress_map
+
 class SubjectSerializer(serializers.ModelSerializer):
     class Meta:
         model = Subject
-        fields = '__all__'
+        # Номер изменения нужен только серверу для дельты синхронизации
+        exclude = ['sync_seq']
 
-class TaskSerializer(serializers.ModelSerializer):
+class TaskSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Task
-        fields = '__all__'
+        exclude = ['sync_seq']
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -25,9 +31,14 @@ class UserProfileSerializer(serializers.ModelSerializer):
 
 class LeaderboardSerializer(serializers.ModelSerializer):
     user_profile = UserProfileSerializer(read_only=True)
+    rank = serializers.SerializerMethodField()
     class Meta:
         model = Leaderboard
         fields = '__all__'
+    
+    def get_rank(self, obj):
+        # Место проставляется в core.leaderboard при постраничной выдаче
+        return getattr(obj, 'rank', None)
 
 class UserProgressSerializer(serializers.ModelSerializer):
     subject = SubjectSerializer(read_only=True)
@@ -39,13 +50,44 @@ class UserProgressSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class TopicSerializer(serializers.ModelSerializer):
+class TopicSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Базовый serializer для темы"""
     class Meta:
         model = Topic
         fields = ['id', 'title', 'order', 'is_locked', 'subject']
 
 
+def _catalog_total(obj, lookup):
+    """
+    Количество задач предмета/темы без запроса к БД
+
+    У записей снимка каталога (core.catalog) оно уже посчитано, для
+    моделей берем соответствующую запись снимка.
+    """
+    total = getattr(obj, 'total_tasks', None)
+    if total is None:
+        record = getattr(get_snapshot(), lookup)(obj.id)
+        total = record.total_tasks if record is not None else 0
+    return total
+
+
+class ProgressListSerializer(serializers.ListSerializer):
+    """
+    Список объектов с прогрессом пользователя
+
+    До сериализации передает ID объектов списка в ProgressMap
+    (child.prefetch_progress), чтобы прогресс всех объектов ответа
+    читался одним запросом и только по ним.
+    """
+    
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        progress = get_progress_map(self.context)
+        if progress is not None:
+            self.child.prefetch_progress(progress, items)
+        return super().to_representation(items)
+
+
 class TopicDetailSerializer(serializers.ModelSerializer):
     """Детальный serializer темы с количеством задач и прогрессом"""
     total_tasks = serializers.SerializerMethodField()
@@ -55,20 +97,19 @@ class TopicDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = Topic
         fields = ['id', 'title', 'order', 'is_locked', 'subject', 'total_tasks', 'completed_tasks', 'progress_percentage']
+        list_serializer_class = ProgressListSerializer
+    
+    @staticmethod
+    def prefetch_progress(progress, topics):
+        progress.prefetch(topic_ids=[topic.id for topic in topics])
     
     def get_total_tasks(self, obj):
-        return obj.tasks.count()
+        return _catalog_total(obj, 'get_topic')
     
     def get_completed_tasks(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            task_ids = obj.tasks.values_list('id', flat=True)
-            return TaskAttempt.objects.filter(
-                user=request.user,
-                task_id__in=task_ids,
-                is_solved=True
-            ).count()
-        return 0
+        # Прогресс тем ответа читается одним запросом (core.progress.ProgressMap)
+        progress = get_progress_map(self.context)
+        return progress.topic_completed(obj.id) if progress else 0
     
     def get_progress_percentage(self, obj):
         total = self.get_total_tasks(obj)
@@ -86,19 +127,22 @@ class SubjectDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = Subject
         fields = ['id', 'title', 'icon', 'color', 'total_tasks', 'completed_tasks', 'progress_percentage', 'topics']
+        list_serializer_class = ProgressListSerializer
+    
+    @staticmethod
+    def prefetch_progress(progress, subjects):
+        # Темы всех предметов списка - тоже одним запросом (у записей снимка темы уже в памяти)
+        progress.prefetch(topic_ids=[
+            topic.id for subject in subjects
+            if isinstance(subject.topics, (list, tuple)) for topic in subject.topics
+        ])
     
     def get_total_tasks(self, obj):
-        return obj.tasks.count()
+        return _catalog_total(obj, 'get_subject')
     
     def get_completed_tasks(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return TaskAttempt.objects.filter(
-                user=request.user,
-                task__subject=obj,
-                is_solved=True
-            ).count()
-        return 0
+        progress = get_progress_map(self.context)
+        return progress.subject_solved.get(obj.id, 0) if progress else 0
     
     def get_progress_percentage(self, obj):
         total = self.get_total_tasks(obj)
@@ -114,7 +158,7 @@ class TaskAttemptSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at']
 
 
-class TaskDetailSerializer(serializers.ModelSerializer):
+class TaskDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Детальный serializer задачи с информацией о попытках пользователя"""
     subject_title = serializers.CharField(source='subject.title', read_only=True)
     topic_title = serializers.CharField(source='topic.title', read_only=True)
@@ -125,20 +169,23 @@ class TaskDetailSerializer(serializers.ModelSerializer):
         model = Task
         fields = ['id', 'subject', 'subject_title', 'topic', 'topic_title', 'question', 
                   'options', 'correct_answer', 'difficulty', 'order', 'is_solved', 'attempts_count']
+        list_serializer_class = ProgressListSerializer
+    
+    @staticmethod
+    def prefetch_progress(progress, tasks):
+        progress.prefetch(task_ids=[task.id for task in tasks])
     
     def get_is_solved(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            attempt = TaskAttempt.objects.filter(user=request.user, task=obj).first()
-            return attempt.is_solved if attempt else False
-        return False
+        progress = get_progress_map(self.context)
+        if progress is None:
+            return False
+        return progress.attempt(obj.id)[1]
     
     def get_attempts_count(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            attempt = TaskAttempt.objects.filter(user=request.user, task=obj).first()
-            return attempt.attempts if attempt else 0
-        return 0
+        progress = get_progress_map(self.context)
+        if progress is None:
+            return 0
+        return progress.attempt(obj.id)[0]
 
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -188,3 +235,17 @@ class SubmitAnswerSerializer(serializers.Serializer):
         if not Task.objects.filter(id=value).exists():
             raise serializers.ValidationError("Задача не найдена")
         return value
+
+
+class SubmitBatchItemSerializer(serializers.Serializer):
+    """Один ответ из пакета, решенного офлайн"""
+    task_id = serializers.IntegerField()
+    answer = serializers.CharField(allow_blank=True, trim_whitespace=True)
+    client_timestamp = serializers.DateTimeField(required=False)
+
+
+class SubmitBatchSerializer(serializers.Serializer):
+    """Serializer для пакетной отправки ответов"""
+    MAX_ITEMS = 200
+    
+    answers = SubmitBatchItemSerializer(many=True, allow_empty=False, max_length=MAX_ITEMS)
@@ -2,8 +2,11 @@
 Сервисный слой для работы с задачами
 """
 from django.db import transaction
+from django.db.models import F
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from core.models import Task, TaskAttempt, UserProfile, Leaderboard
+from core import answer_events, caching, db, progress, rank_index
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,12 +15,38 @@ logger = logging.getLogger(__name__)
 class TaskService:
     """Сервис для работы с задачами и ответами"""
     
+    MAX_ANSWER_LENGTH = 100
+    
+    @staticmethod
+    def validate_answer(answer):
+        """
+        Проверка формата ответа
+        
+        Raises:
+            ValidationError: Если ответ пустой или слишком длинный
+        """
+        if not answer or len(answer) > TaskService.MAX_ANSWER_LENGTH:
+            raise ValidationError("Ответ должен быть от 1 до 100 символов")
+    
+    @staticmethod
+    def check_answer(task, answer):
+        """Сравнение ответа с правильным (без учета пробелов по краям)"""
+        return str(answer).strip() == str(task.correct_answer).strip()
+    
     @staticmethod
     @transaction.atomic
     def submit_answer(user, task, answer):
         """
         Обработка ответа пользователя на задачу
         
+        Единая точка записи для HTML-страницы задачи и API. Все изменения
+        счетчиков делаются условными UPDATE ... SET x = x + n, поэтому
+        одновременные ответы одного пользователя не теряют обновлений.
+        
+        Каждый ответ пишется в журнал AnswerEvent. В асинхронном режиме
+        (ANSWER_EVENTS['ASYNC']) этим все и ограничивается: попытка в ответе
+        предварительная, а TaskAttempt, XP и рейтинг обновит fold_answer_events.
+        
         Args:
             user: User объект
             task: Task объект
@@ -29,51 +58,265 @@ class TaskService:
         Raises:
             ValidationError: Если ответ невалиден
         """
-        # Валидация
-        if not answer or len(answer) > 100:
-            raise ValidationError("Ответ должен быть от 1 до 100 символов")
+        answer = str(answer).strip() if answer is not None else ''
+        TaskService.validate_answer(answer)
         
-        # Получаем или создаем попытку
-        attempt, created = TaskAttempt.objects.select_for_update().get_or_create(
-            user=user,
-            task=task
-        )
+        is_correct = TaskService.check_answer(task, answer)
         
-        attempt.attempts += 1
-        is_correct = str(answer).strip() == str(task.correct_answer).strip()
+        if answer_events.is_async():
+            # Только запись в журнал; учет сделает fold_answer_events
+            answer_events.record(user, task, answer, is_correct, folded=False)
+            attempt, points_earned = answer_events.pending_attempt(user, task)
+            return attempt, is_correct, points_earned
+        
+        answer_events.record(user, task, answer, is_correct, folded=True)
+        attempt, solved = TaskService._register_answer(user, task, is_correct)
         points_earned = 0
         
-        if is_correct and not attempt.is_solved:
-            # Рассчитываем и начисляем очки
-            points_earned = TaskService._calculate_points(task, attempt)
+        if solved:
+            points_earned = attempt.points_earned
             TaskService._award_points(user, points_earned)
+            progress.record_first_solve(user, task)
+            logger.info(f"User {user.id} solved task {task.id}, earned {points_earned} points")
+        
+        caching.invalidate_progress(user.id)
+        return attempt, is_correct, points_earned
+    
+    @staticmethod
+    @transaction.atomic
+    def submit_batch(user, items):
+        """
+        Пакетная обработка ответов, решенных офлайн
+        
+        Задачи берутся из снимка каталога, ответы проверяются в памяти
+        в порядке client_timestamp и учитываются одним _apply_answers
+        на весь пакет (в любом режиме журнала - синхронно).
+        
+        Args:
+            user: User объект
+            items: Список dict с task_id, answer и client_timestamp (опционально)
             
-            attempt.is_solved = True
-            attempt.points_earned = points_earned
+        Returns:
+            tuple: (results, points_earned) - результаты в порядке items
+                (dict с task, is_correct, is_solved, attempts, points_earned
+                или error) и сумма начисленных очков
+        """
+        from core.catalog import get_snapshot
+        
+        snapshot = get_snapshot()
+        results = [None] * len(items)
+        graded = []
+        
+        for index, item in enumerate(items):
+            task = snapshot.get_task(item['task_id'])
+            answer = str(item.get('answer') or '').strip()
+            if task is None:
+                results[index] = {'task_id': item['task_id'], 'error': 'Задача не найдена'}
+                continue
+            try:
+                TaskService.validate_answer(answer)
+            except ValidationError as e:
+                results[index] = {'task_id': task.id, 'error': e.messages[0]}
+                continue
+            graded.append((item.get('client_timestamp'), index, task, answer))
+        
+        if not graded:
+            return results, 0
+        
+        # Ответы без времени - в порядке запроса после ответов со временем
+        now = timezone.now()
+        graded.sort(key=lambda entry: (entry[0] is None, entry[0] or now, entry[1]))
+        answers = [(task, TaskService.check_answer(task, answer)) for _, _, task, answer in graded]
+        answer_events.record_many(user, [
+            (task, answer, is_correct) for (_, _, task, answer), (_, is_correct) in zip(graded, answers)
+        ])
+        
+        states, total_points = TaskService._apply_answers(user, answers)
+        for (_, index, task, _), (_, is_correct), state in zip(graded, answers, states):
+            results[index] = {'task': task, 'is_correct': is_correct, **state}
+        
+        return results, total_points
+    
+    @staticmethod
+    def _apply_answers(user, answers):
+        """
+        Учет проверенных ответов одного пользователя
+        
+        Строки TaskAttempt сначала создаются (ON CONFLICT DO NOTHING) и
+        блокируются, затем все записываются одним upsert; XP, leaderboard
+        и счетчики прогресса обновляются один раз. Должна вызываться
+        внутри транзакции.
+        
+        Args:
+            user: User объект
+            answers: Список (task, is_correct) в порядке ответов; task -
+                Task или TaskRecord (нужны id, difficulty, subject_id, topic_id)
             
-            logger.info(f"User {user.id} solved task {task.id}, earned {points_earned} points")
+        Returns:
+            tuple: (states, total_points) - для каждого ответа dict с
+                is_solved, attempts, points_earned и сумма начисленных очков
+        """
+        task_ids = {task.id for task, _ in answers}
+        TaskAttempt.objects.bulk_create(
+            [TaskAttempt(user=user, task_id=task_id, attempts=0) for task_id in task_ids],
+            ignore_conflicts=True
+        )
+        state = {
+            row[0]: list(row[1:])
+            for row in TaskAttempt.objects.select_for_update().filter(
+                user=user, task_id__in=task_ids
+            ).values_list('task_id', 'attempts', 'is_solved', 'points_earned')
+        }
         
-        attempt.save()
+        states = []
+        solved_tasks = []
+        total_points = 0
+        for task, is_correct in answers:
+            current = state[task.id]
+            points_earned = 0
+            if not current[1]:
+                current[0] += 1
+                if is_correct:
+                    points_earned = TaskService._calculate_points(task, current[0])
+                    current[1] = True
+                    current[2] = points_earned
+                    solved_tasks.append(task)
+                    total_points += points_earned
+            states.append({'is_solved': current[1], 'attempts': current[0], 'points_earned': points_earned})
         
-        return attempt, is_correct, points_earned
+        now = timezone.now()
+        TaskAttempt.objects.bulk_create(
+            [
+                TaskAttempt(user=user, task_id=task_id, attempts=attempts, is_solved=is_solved,
+                            points_earned=points, updated_at=now)
+                for task_id, (attempts, is_solved, points) in state.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['user', 'task'],
+            update_fields=['attempts', 'is_solved', 'points_earned', 'updated_at']
+        )
+        
+        if solved_tasks:
+            progress.record_solves(user, solved_tasks)
+            TaskService._award_points(user, total_points)
+            logger.info(f"User {user.id} solved {len(solved_tasks)} tasks, earned {total_points} points")
+        
+        caching.invalidate_progress(user.id)
+        return states, total_points
+    
+    # Первый ответ вставляет строку, следующие увеличивают счетчик; правильный
+    # ответ сразу отмечает задачу решенной с очками за номер этой попытки.
+    # Решенная задача не меняется (WHERE), и тогда RETURNING ничего не вернет.
+    _ANSWER_UPSERT = (
+        'INSERT INTO {table} (user_id, task_id, attempts, is_solved, points_earned, created_at, updated_at) '
+        'VALUES (%s, %s, 1, %s, %s, %s, %s) '
+        'ON CONFLICT (user_id, task_id) DO UPDATE SET '
+        'attempts = {table}.attempts + 1, '
+        'is_solved = excluded.is_solved, '
+        'points_earned = CASE WHEN NOT excluded.is_solved THEN 0 '
+        'WHEN {table}.attempts = 0 THEN %s WHEN {table}.attempts = 1 THEN %s ELSE %s END, '
+        'updated_at = excluded.updated_at '
+        'WHERE NOT {table}.is_solved '
+        'RETURNING id, attempts, is_solved, points_earned'
+    )
+    
+    @staticmethod
+    def _register_answer(user, task, is_correct):
+        """
+        Учет ответа в TaskAttempt
+        
+        На PostgreSQL и SQLite это один запрос (_ANSWER_UPSERT), на
+        остальных БД - _register_attempt и условный UPDATE. Задача
+        отмечается решенной ровно один раз.
+        
+        Args:
+            user: User объект
+            task: Task объект
+            is_correct: Правильный ли ответ
+            
+        Returns:
+            tuple: (attempt, solved) - актуальная запись о попытках и признак
+                того, что задача решена именно этим ответом
+        """
+        if not db.has_upsert_returning():
+            attempt = TaskService._register_attempt(user, task)
+            if not is_correct or attempt.is_solved:
+                return attempt, False
+            points_earned = TaskService._calculate_points(task, attempt.attempts)
+            solved = TaskAttempt.objects.filter(pk=attempt.pk, is_solved=False).update(
+                is_solved=True,
+                points_earned=points_earned,
+                updated_at=timezone.now()
+            )
+            if solved:
+                attempt.is_solved = True
+                attempt.points_earned = points_earned
+            return attempt, bool(solved)
+        
+        now = timezone.now()
+        points = [TaskService._calculate_points(task, number) for number in (1, 2, 3)]
+        row = db.fetchone(
+            TaskService._ANSWER_UPSERT.format(table=db.table(TaskAttempt)),
+            [user.id, task.id, is_correct, points[0] if is_correct else 0,
+             db.datetime_param(now), db.datetime_param(now), *points]
+        )
+        if row is None:
+            # Задача уже решена
+            return TaskAttempt.objects.get(user=user, task_id=task.id), False
+        
+        attempt_id, attempts, is_solved, points_earned = row
+        attempt = TaskAttempt(id=attempt_id, user=user, task_id=task.id, attempts=attempts,
+                              is_solved=bool(is_solved), points_earned=points_earned, updated_at=now)
+        attempt._state.adding = False
+        return attempt, bool(is_solved)
     
     @staticmethod
-    def _calculate_points(task, attempt):
+    def _register_attempt(user, task):
+        """
+        Увеличение счетчика попыток и чтение актуального состояния (без upsert)
+        
+        UPDATE блокирует строку до конца транзакции, поэтому следующее
+        чтение видит согласованное значение. Для уже решенной задачи
+        счетчик не меняется.
+        
+        Args:
+            user: User объект
+            task: Task объект
+            
+        Returns:
+            TaskAttempt: Актуальная запись о попытках
+        """
+        attempts = TaskAttempt.objects.filter(user=user, task=task, is_solved=False)
+        changes = {'attempts': F('attempts') + 1, 'updated_at': timezone.now()}
+        
+        if not attempts.update(**changes):
+            # Первая попытка: вставляем пустую строку (INSERT ... ON CONFLICT DO NOTHING)
+            # и повторяем инкремент, чтобы не потерять параллельный ответ
+            TaskAttempt.objects.bulk_create(
+                [TaskAttempt(user=user, task=task, attempts=0)],
+                ignore_conflicts=True
+            )
+            attempts.update(**changes)
+        
+        return TaskAttempt.objects.get(user=user, task=task)
+    
+    @staticmethod
+    def _calculate_points(task, attempts):
         """
         Расчет очков за решение задачи
         
         Args:
             task: Task объект
-            attempt: TaskAttempt объект
+            attempts: Номер попытки, с которой задача решена
             
         Returns:
             int: Количество очков
         """
         base_points = task.difficulty * 5
         
-        if attempt.attempts == 1:
+        if attempts == 1:
             return base_points  # 100% за первую попытку
-        elif attempt.attempts == 2:
+        elif attempts == 2:
             return int(base_points * 0.7)  # 70% за вторую
         else:
             return int(base_points * 0.5)  # 50% за остальные
@@ -83,18 +326,46 @@ class TaskService:
         """
         Начисление очков пользователю
         
+        Профиль обновляется атомарным инкрементом (UPDATE ... RETURNING, где
+        он есть); его строка остается заблокированной до коммита, поэтому
+        копирование xp в leaderboard не гоняется с параллельными начислениями.
+        Строка leaderboard пишется одним upsert по уникальному user_profile.
+        
         Args:
             user: User объект
             points: Количество очков
+            
+        Returns:
+            int: Новое количество очков пользователя
         """
-        profile, created = UserProfile.objects.select_for_update().get_or_create(user=user)
-        profile.xp += points
-        profile.save()
+        row = None
+        if db.has_upsert_returning():
+            row = db.fetchone(
+                f'UPDATE {db.table(UserProfile)} SET xp = xp + %s WHERE user_id = %s RETURNING id, xp',
+                [points, user.id]
+            )
+        if row is None:
+            # Нет профиля (или RETURNING): создаем и обновляем через ORM
+            profiles = UserProfile.objects.filter(user=user)
+            if not profiles.update(xp=F('xp') + points):
+                UserProfile.objects.get_or_create(user=user)
+                profiles.update(xp=F('xp') + points)
+            row = profiles.values_list('id', 'xp').get()
+        
+        profile_id, xp = row
         
         # Обновляем leaderboard
-        leaderboard, _ = Leaderboard.objects.get_or_create(user_profile=profile)
-        leaderboard.points = profile.xp
-        leaderboard.save()
+        Leaderboard.objects.bulk_create(
+            [Leaderboard(user_profile_id=profile_id, points=xp)],
+            update_conflicts=True,
+            unique_fields=['user_profile'],
+            update_fields=['points', 'updated']
+        )
+        
+        # Синхронизируем индекс рейтинга после коммита
+        rank_index.schedule_update(profile_id, xp)
+        
+        return xp
     
     @staticmethod
     def get_user_progress(user, subject=None):
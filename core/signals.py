@@ -0,0 +1,49 @@
+"""
+Обработчики сигналов моделей каталога
+"""
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .caching import invalidate_catalog
+from .models import Subject, Task, Topic
+from .navigation import invalidate_topic_navigation
+from .sync import record_deletion
+
+
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+@receiver(post_save, sender=Topic)
+@receiver(post_delete, sender=Topic)
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def catalog_changed(sender, **kwargs):
+    """Любое изменение каталога сбрасывает закэшированные данные каталога (один раз на транзакцию)"""
+    invalidate_catalog()
+
+
+@receiver(post_delete, sender=Subject)
+@receiver(post_delete, sender=Topic)
+@receiver(post_delete, sender=Task)
+def catalog_deleted(sender, instance, **kwargs):
+    """Удаление попадает в ленту изменений для дельта-синхронизации"""
+    record_deletion(sender._meta.model_name, instance.pk)
+
+
+@receiver(post_init, sender=Task)
+def remember_task_position(sender, instance, **kwargs):
+    """Запоминаем тему и порядок, чтобы при сохранении понять, что изменилось"""
+    # Через __dict__, чтобы не догружать отложенные (.only/.defer) поля
+    instance._nav_state = (instance.__dict__.get('topic_id'), instance.__dict__.get('order'))
+
+
+@receiver(post_save, sender=Task)
+def task_saved(sender, instance, created, **kwargs):
+    old_topic_id, old_order = getattr(instance, '_nav_state', (None, None))
+    if created or (old_topic_id, old_order) != (instance.topic_id, instance.order):
+        invalidate_topic_navigation(old_topic_id, instance.topic_id)
+    instance._nav_state = (instance.topic_id, instance.order)
+
+
+@receiver(post_delete, sender=Task)
+def task_deleted(sender, instance, **kwargs):
+    invalidate_topic_navigation(instance.topic_id)
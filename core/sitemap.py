@@ -0,0 +1,319 @@
+"""
+Sitemap: индекс и разделы по 50 000 URL
+
+Разделы содержат статические страницы, предметы и задачи; lastmod -
+реальное время изменения (updated_at из снимка каталога; для предмета -
+самое позднее изменение его самого, тем и задач). Темы отдельных URL не
+получают: /topic/<id>/ только перенаправляет на задачу, а сами темы
+перечислены на странице предмета.
+
+Файлы пишутся потоково сразу в gzip (sitemap-<n>.xml.gz и индекс
+sitemap.xml.gz) в каталог поколения каталога внутри SITEMAP_DIR. Пока
+поколение не изменилось, запросы отдают готовые файлы; при смене
+поколения набор собирается заново во временном каталоге и атомарно
+переименовывается. Предыдущее поколение хранится еще один цикл, чтобы
+воркеры, получившие его набор до смены, успели дочитать файлы; более
+старые удаляются (а если файл все же пропал, представление берет набор
+заново).
+
+Запрос не ждет сборки: пока набор нового поколения не готов, отдается
+последний собранный, а новый собирается в фоновом потоке. Синхронно
+собирается только самый первый набор. Команда build_sitemaps собирает
+набор заранее (например, после импорта задач).
+"""
+import gzip
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import timezone as dt_timezone
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+
+from .catalog import get_snapshot
+
+logger = logging.getLogger(__name__)
+
+MAX_URLS = 50000
+
+# Страницы без содержимого каталога: lastmod не указывается
+STATIC_PAGES = (
+    ('/', 'daily', '1.0'),
+    ('/leaderboard/', 'daily', '0.8'),
+    ('/login/', 'monthly', '0.6'),
+    ('/register/', 'monthly', '0.6'),
+)
+
+INDEX_NAME = 'sitemap.xml.gz'
+
+
+def get_sitemap_dir():
+    return str(getattr(settings, 'SITEMAP_DIR', os.path.join(settings.BASE_DIR, 'var', 'sitemaps')))
+
+
+def get_site_url():
+    return getattr(settings, 'SITE_URL', 'https://hushyor.com').rstrip('/')
+
+
+def section_name(number):
+    return f'sitemap-{number}.xml.gz'
+
+
+def _w3c(moment):
+    return moment.astimezone(dt_timezone.utc).strftime('%Y-%m-%dT%H:%M:%S+00:00') if moment else None
+
+
+def iter_entries(snapshot):
+    """
+    URL сайта в стабильном порядке
+
+    Yields:
+        tuple: (path, lastmod, changefreq, priority); lastmod - datetime или None
+    """
+    for path, changefreq, priority in STATIC_PAGES:
+        yield path, None, changefreq, priority
+
+    task_lastmods = {}
+    for task in snapshot.tasks:
+        current = task_lastmods.get(task.subject_id)
+        if current is None or task.updated_at > current:
+            task_lastmods[task.subject_id] = task.updated_at
+
+    for subject in snapshot.subjects:
+        lastmods = [subject.updated_at] + [topic.updated_at for topic in subject.topics]
+        if subject.id in task_lastmods:
+            lastmods.append(task_lastmods[subject.id])
+        yield f'/subject/{subject.id}/', max(lastmods), 'weekly', '0.9'
+
+    for task in sorted(snapshot.tasks, key=lambda task: task.id):
+        yield f'/task/{task.id}/', task.updated_at, 'monthly', '0.7'
+
+
+@contextmanager
+def _open_gzip(path):
+    # mtime=0 - одинаковое содержимое дает побайтно одинаковый файл
+    with open(path, 'wb') as raw, gzip.GzipFile(filename='', mode='wb', fileobj=raw, compresslevel=9, mtime=0) as out:
+        yield out
+
+
+def _write_section(path, entries, site_url):
+    lastmod = None
+    with _open_gzip(path) as out:
+        out.write(b'<?xml version="1.0" encoding="UTF-8"?>\n')
+        out.write(b'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+        for loc, modified, changefreq, priority in entries:
+            parts = [f'<url><loc>{escape(site_url + loc)}</loc>']
+            if modified:
+                parts.append(f'<lastmod>{_w3c(modified)}</lastmod>')
+                lastmod = modified if lastmod is None else max(lastmod, modified)
+            parts.append(f'<changefreq>{changefreq}</changefreq><priority>{priority}</priority></url>\n')
+            out.write(''.join(parts).encode())
+        out.write(b'</urlset>\n')
+    return lastmod
+
+
+def _write_index(path, sections, site_url):
+    with _open_gzip(path) as out:
+        out.write(b'<?xml version="1.0" encoding="UTF-8"?>\n')
+        out.write(b'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+        for number, lastmod in sections:
+            loc = f'{site_url}/sitemap-{number}.xml'
+            modified = f'<lastmod>{_w3c(lastmod)}</lastmod>' if lastmod else ''
+            out.write(f'<sitemap><loc>{escape(loc)}</loc>{modified}</sitemap>\n'.encode())
+        out.write(b'</sitemapindex>\n')
+
+
+def build(snapshot, target_dir):
+    """
+    Сборка индекса и разделов в каталог target_dir
+
+    Args:
+        snapshot: CatalogSnapshot
+        target_dir: Пустой каталог для файлов
+
+    Returns:
+        int: Количество разделов
+    """
+    site_url = get_site_url()
+    sections = []
+    chunk = []
+
+    def flush():
+        number = len(sections) + 1
+        sections.append((number, _write_section(os.path.join(target_dir, section_name(number)), chunk, site_url)))
+        chunk.clear()
+
+    for entry in iter_entries(snapshot):
+        chunk.append(entry)
+        if len(chunk) >= MAX_URLS:
+            flush()
+    if chunk or not sections:
+        flush()
+
+    _write_index(os.path.join(target_dir, INDEX_NAME), sections, site_url)
+    return len(sections)
+
+
+class SitemapSet:
+    """Собранный набор файлов одного поколения каталога"""
+
+    __slots__ = ('generation', 'directory', 'sections')
+
+    def __init__(self, generation, directory, sections):
+        self.generation = generation
+        self.directory = directory
+        self.sections = sections
+
+    def path(self, number=None):
+        """Путь индекса (number=None) или раздела; None, если раздела нет"""
+        if number is None:
+            return os.path.join(self.directory, INDEX_NAME)
+        if 1 <= number <= self.sections:
+            return os.path.join(self.directory, section_name(number))
+        return None
+
+    def etag(self, number=None):
+        return f'"{self.generation}-{number or 0}"'
+
+
+_current = None
+_current_lock = threading.Lock()
+# Поток, который собирает набор нового поколения
+_builder = None
+
+
+def _generations(base_dir):
+    """
+    Собранные поколения, от самого нового к старому
+
+    Returns:
+        list: [(mtime, name), ...]
+    """
+    found = []
+    try:
+        with os.scandir(base_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    found.append((entry.stat().st_mtime, entry.name))
+                except FileNotFoundError:
+                    # Поколение удалил другой процесс между чтением каталога и stat
+                    continue
+    except FileNotFoundError:
+        return []
+    found.sort(reverse=True)
+    return found
+
+
+def _prune(base_dir, keep):
+    # Кроме keep оставляем самое свежее из прочих поколений (предыдущее)
+    others = [name for _, name in _generations(base_dir) if name != keep]
+    for name in others[1:]:
+        shutil.rmtree(os.path.join(base_dir, name), ignore_errors=True)
+
+
+def _load(generation, directory):
+    """SitemapSet собранного каталога или None, если его уже удалили"""
+    try:
+        sections = sum(1 for name in os.listdir(directory) if name.startswith('sitemap-'))
+    except FileNotFoundError:
+        return None
+    return SitemapSet(generation, directory, sections)
+
+
+def _latest(base_dir):
+    """Последний собранный набор или None"""
+    for _, name in _generations(base_dir):
+        loaded = _load(name, os.path.join(base_dir, name))
+        if loaded is not None:
+            return loaded
+    return None
+
+
+def build_generation(snapshot):
+    """
+    Сборка набора для поколения снимка, если его еще нет, и удаление старых
+
+    Args:
+        snapshot: CatalogSnapshot
+
+    Returns:
+        str: Каталог набора
+    """
+    base_dir = get_sitemap_dir()
+    directory = os.path.join(base_dir, str(snapshot.generation))
+    if not os.path.isdir(directory):
+        os.makedirs(base_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=base_dir, prefix='.build-')
+        try:
+            build(snapshot, tmp_dir)
+            os.rename(tmp_dir, directory)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            # Переименование не удалось, потому что другой процесс уже собрал это поколение
+            if not os.path.isdir(directory):
+                raise
+        _prune(base_dir, str(snapshot.generation))
+    return directory
+
+
+def _build_in_background(snapshot):
+    try:
+        build_generation(snapshot)
+    except Exception as e:
+        logger.error(f"Failed to build sitemaps for generation {snapshot.generation}: {e}", exc_info=True)
+
+
+def _schedule_build(snapshot):
+    global _builder
+    if _builder is not None and _builder.is_alive():
+        # Следующее поколение запросит первый запрос после этой сборки
+        return
+    _builder = threading.Thread(
+        target=_build_in_background, args=(snapshot,), name='sitemap-build', daemon=True,
+    )
+    _builder.start()
+
+
+def get_sitemaps():
+    """
+    Набор sitemap для текущего поколения каталога
+
+    Если он еще не собран, возвращается последний собранный набор, а новый
+    собирается в фоне; без единого собранного набора он собирается сразу.
+
+    Returns:
+        SitemapSet
+    """
+    global _current
+    snapshot = get_snapshot()
+    base_dir = get_sitemap_dir()
+    directory = os.path.join(base_dir, str(snapshot.generation))
+    current = _current
+    if current is not None and current.directory == directory and os.path.isdir(directory):
+        return current
+
+    with _current_lock:
+        current = _current
+        if current is not None and current.directory == directory and os.path.isdir(directory):
+            return current
+
+        if os.path.isdir(directory):
+            loaded = _load(snapshot.generation, directory)
+            if loaded is not None:
+                _current = loaded
+                return _current
+
+        previous = current if current is not None and os.path.isdir(current.directory) else _latest(base_dir)
+        if previous is None:
+            # Ни одного собранного набора: первый собирается в запросе
+            _current = _load(snapshot.generation, build_generation(snapshot))
+            return _current
+
+        _schedule_build(snapshot)
+        _current = previous
+        return _current
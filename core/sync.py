@@ -0,0 +1,253 @@
+"""
+Дельта-синхронизация для мобильного приложения
+
+Клиент хранит токен версии из прошлого ответа и при запуске запрашивает
+только то, что изменилось после него:
+- предметы, темы и задачи с sync_seq больше токена;
+- ID удаленных объектов каталога (CatalogDeletion) с sync_seq больше токена;
+- состояния TaskAttempt пользователя, изменившиеся после токена.
+
+Каталог версионируется счетчиком SyncSequence, а не временем: номер
+изменения берется в транзакции, которая пишет строку, и строка счетчика
+заблокирована до ее коммита. Поэтому все изменения с номером не больше
+прочитанного значения уже закоммичены, и дельта ничего не теряет, сколько
+бы ни шла транзакция.
+
+Попытки пишутся при каждом ответе, и общий счетчик сериализовал бы все
+ответы, поэтому они по-прежнему выбираются по updated_at с запасом
+OVERLAP; повторно пришедшие строки клиент просто перезаписывает.
+
+Записи об удалениях старше SYNC['DELETION_RETENTION_DAYS'] удаляет команда
+prune_catalog_deletions. Токену старше удаленных записей (как и
+невалидному или отсутствующему) отдается полный снимок (full: true).
+"""
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from . import db
+from .catalog import get_snapshot
+from .pagination import decode_key, encode_key
+
+DEFAULT_SYNC = {
+    'DELETION_RETENTION_DAYS': 90,
+}
+
+# Запас по времени для попыток из транзакций, закоммиченных после выдачи токена
+OVERLAP = timedelta(seconds=60)
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+# Удаления, накопленные внутри collecting_deletions() текущего потока
+_local = threading.local()
+
+
+def get_config():
+    """Настройки синхронизации с учетом значений по умолчанию"""
+    return {**DEFAULT_SYNC, **getattr(settings, 'SYNC', {})}
+
+
+def next_sequence():
+    """
+    Следующий номер изменения каталога
+
+    Вызывается внутри транзакции, которая меняет каталог: строка счетчика
+    остается заблокированной до ее коммита.
+
+    Returns:
+        int
+    """
+    from .models import SyncSequence
+
+    if db.has_upsert_returning():
+        table = db.table(SyncSequence)
+        row = db.fetchone(
+            f'INSERT INTO {table} (id, value, pruned_through) VALUES (1, 1, 0) '
+            f'ON CONFLICT (id) DO UPDATE SET value = {table}.value + 1 RETURNING value',
+            []
+        )
+        return row[0]
+
+    with transaction.atomic():
+        sequence, _ = SyncSequence.objects.select_for_update().get_or_create(pk=1)
+        SyncSequence.objects.filter(pk=1).update(value=F('value') + 1)
+        return sequence.value + 1
+
+
+@contextmanager
+def collecting_deletions():
+    """
+    Записи CatalogDeletion об удалениях внутри блока пишутся одной пачкой
+
+    Каскадное удаление предмета шлет post_delete для каждой темы и задачи;
+    записи копятся и в конце блока вставляются одним bulk_create с одним
+    номером изменения - в той же транзакции, что и удаление. Вложенные
+    блоки пишут в пачку внешнего.
+    """
+    from .models import CatalogDeletion
+
+    if getattr(_local, 'deletions', None) is not None:
+        yield
+        return
+    _local.deletions = []
+    try:
+        with transaction.atomic():
+            yield
+            if _local.deletions:
+                sequence = next_sequence()
+                CatalogDeletion.objects.bulk_create(
+                    [CatalogDeletion(model=model, object_id=object_id, sync_seq=sequence)
+                     for model, object_id in _local.deletions],
+                    batch_size=1000,
+                )
+    finally:
+        _local.deletions = None
+
+
+def record_deletion(model, object_id):
+    """
+    Запись об удалении объекта каталога
+
+    Внутри collecting_deletions() запись попадает в пачку блока,
+    иначе вставляется сразу.
+
+    Args:
+        model: Имя модели (subject, topic, task)
+        object_id: ID удаленного объекта
+    """
+    from .models import CatalogDeletion
+
+    deletions = getattr(_local, 'deletions', None)
+    if deletions is not None:
+        deletions.append((model, object_id))
+        return
+    CatalogDeletion.objects.create(model=model, object_id=object_id, sync_seq=next_sequence())
+
+
+def _current_sequence():
+    """(value, pruned_through) счетчика; (0, 0), пока каталог не менялся"""
+    from .models import SyncSequence
+
+    row = SyncSequence.objects.filter(pk=1).values_list('value', 'pruned_through').first()
+    return row or (0, 0)
+
+
+def prune_deletions(max_age_days=None):
+    """
+    Удаление записей CatalogDeletion старше max_age_days
+
+    Args:
+        max_age_days: Срок хранения (None - SYNC['DELETION_RETENTION_DAYS'])
+
+    Returns:
+        int: Количество удаленных записей
+    """
+    from .models import CatalogDeletion, SyncSequence
+
+    if max_age_days is None:
+        max_age_days = get_config()['DELETION_RETENTION_DAYS']
+    cutoff = timezone.now() - timedelta(days=max_age_days)
+
+    with transaction.atomic():
+        through = CatalogDeletion.objects.filter(deleted_at__lt=cutoff).aggregate(seq=Max('sync_seq'))['seq']
+        if through is None:
+            return 0
+        SyncSequence.objects.filter(pk=1).update(pruned_through=Greatest(F('pruned_through'), through))
+        deleted, _ = CatalogDeletion.objects.filter(sync_seq__lte=through).delete()
+    return deleted
+
+
+def encode_token(sequence, moment):
+    """Номер изменения каталога и момент выборки попыток -> токен версии"""
+    delta = moment - _EPOCH
+    return encode_key(sequence, (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds)
+
+
+def decode_token(token):
+    """
+    Токен версии -> номер изменения каталога и момент выборки попыток
+
+    Returns:
+        tuple | None: (sequence, datetime) или None, если токен не задан или невалиден
+    """
+    key = decode_key(token, size=2)
+    if key is None or key[0] < 0 or key[1] < 0:
+        return None
+    return key[0], _EPOCH + timedelta(microseconds=key[1])
+
+
+def _attempts_since(user, since):
+    """Состояния попыток пользователя, изменившиеся после since (None - все)"""
+    from .models import TaskAttempt
+
+    attempts = TaskAttempt.objects.filter(user=user)
+    if since is not None:
+        attempts = attempts.filter(updated_at__gte=since)
+    return [
+        {'task_id': task_id, 'attempts': count, 'is_solved': is_solved, 'points_earned': points}
+        for task_id, count, is_solved, points in attempts.order_by('task_id').values_list(
+            'task_id', 'attempts', 'is_solved', 'points_earned',
+        )
+    ]
+
+
+def get_changes(user, token=None):
+    """
+    Изменения каталога и прогресса после токена
+
+    Args:
+        user: Пользователь (для анонимного попытки не отдаются)
+        token: Токен из прошлого ответа или None для полной синхронизации
+
+    Returns:
+        dict: version, full, subjects, topics, tasks, deleted, attempts
+    """
+    from .models import CatalogDeletion, Subject, Task, Topic
+    from .serializers import SubjectSerializer, TaskSerializer, TopicSerializer
+
+    # Версия фиксируется до выборки: все, что изменится во время нее, попадет в следующую
+    sequence, pruned_through = _current_sequence()
+    version = encode_token(sequence, timezone.now())
+    since = decode_token(token)
+    authenticated = user is not None and user.is_authenticated
+
+    if since is None or since[0] < pruned_through:
+        snapshot = get_snapshot()
+        return {
+            'version': version,
+            'full': True,
+            'subjects': SubjectSerializer(snapshot.subjects, many=True).data,
+            'topics': TopicSerializer(snapshot.topics, many=True).data,
+            'tasks': TaskSerializer(snapshot.tasks, many=True).data,
+            'deleted': {'subject': [], 'topic': [], 'task': []},
+            'attempts': _attempts_since(user, None) if authenticated else [],
+        }
+
+    since_sequence, since_moment = since
+    deleted = {'subject': [], 'topic': [], 'task': []}
+    rows = CatalogDeletion.objects.filter(sync_seq__gt=since_sequence).order_by('id').values_list('model', 'object_id')
+    for model, object_id in rows:
+        if model in deleted:
+            deleted[model].append(object_id)
+
+    return {
+        'version': version,
+        'full': False,
+        'subjects': SubjectSerializer(
+            Subject.objects.filter(sync_seq__gt=since_sequence).order_by('id'), many=True,
+        ).data,
+        'topics': TopicSerializer(
+            Topic.objects.filter(sync_seq__gt=since_sequence).order_by('order', 'id'), many=True,
+        ).data,
+        'tasks': TaskSerializer(
+            Task.objects.filter(sync_seq__gt=since_sequence).order_by('order', 'id'), many=True,
+        ).data,
+        'deleted': deleted,
+        'attempts': _attempts_since(user, since_moment - OVERLAP) if authenticated else [],
+    }
@@ -1,7 +1,45 @@
-from django.test import TestCase
+import gzip
+import importlib.util
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.db import connection
+from django.test import RequestFactory, TestCase, SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone, translation
 
 from django.urls import reverse
-from rest_framework.test import APITestCase
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from . import ai_content, ai_helper, ai_store, answer_events, caching, catalog, conditional, db, font_registry, og_images, page_cache, rank_index, ratelimit, sitemap
+from .ai_executor import AIBusyError, AIExecutor, AITimeoutError
+from .leaderboard import get_leaderboard_page, get_leaderboard_window
+from .models import (
+    AIResponse, AnswerEvent, CatalogDeletion, EventCursor, Leaderboard, Subject, Task, TaskAIContent, TaskAttempt, Topic, UserProfile, UserProgress,
+    UserTopicProgress,
+)
+from .navigation import get_task_position
+from .page_cache import anonymous_page_cache
+from .pagination import encode_key
+from .progress import get_subject_solved_counts, get_topic_solved_counts, reconcile
+from .rank_index import RedisRankIndex, SkipListRankIndex
+from .services import TaskService
+from .throttling import AIRateThrottle
 
 class GminiApiTest(APITestCase):
     def test_gmini_echo(self):
@@ -9,3 +47,1316 @@ class GminiApiTest(APITestCase):
         response = self.client.post(url, {'message': 'hello'}, format='json')
         self.assertEqual(response.status_code, 200)
         self.assertIn('reply', response.data)
+
+
+class SkipListRankIndexTest(SimpleTestCase):
+    def setUp(self):
+        self.index = SkipListRankIndex(max_age=None)
+        self.index.rebuild({1: 50, 2: 100, 3: 50, 4: 10})
+
+    def test_rank_shares_position_on_ties(self):
+        self.assertEqual(self.index.rank(2), 1)
+        self.assertEqual(self.index.rank(1), 2)
+        self.assertEqual(self.index.rank(3), 2)
+        self.assertEqual(self.index.rank(4), 4)
+        self.assertIsNone(self.index.rank(99))
+        self.assertEqual(self.index.rank_for_points(60), 2)
+
+    def test_update_and_top(self):
+        self.index.update(4, 200)
+        self.index.remove(2)
+        self.assertEqual(self.index.top(2), [(4, 200), (1, 50)])
+        self.assertEqual(self.index.top(5, offset=2), [(3, 50)])
+        self.assertEqual(self.index.count(), 3)
+
+    def test_matches_count_query_semantics(self):
+        rng = random.Random(42)
+        expected = {1: 50, 2: 100, 3: 50, 4: 10}
+        for _ in range(500):
+            member = rng.randint(1, 80)
+            if rng.random() < 0.2:
+                self.index.remove(member)
+                expected.pop(member, None)
+            else:
+                points = rng.randint(0, 30)
+                self.index.update(member, points)
+                expected[member] = points
+
+        for member, points in expected.items():
+            greater = sum(1 for p in expected.values() if p > points)
+            self.assertEqual(self.index.rank(member), greater + 1)
+        ordered = sorted(expected.items(), key=lambda item: (-item[1], item[0]))
+        self.assertEqual(self.index.top(len(ordered)), ordered)
+
+    def test_reload_reads_table_outside_the_lock_and_keeps_updates(self):
+        index = SkipListRankIndex(max_age=None)
+
+        def load_entries():
+            # Чтение таблицы не блокирует индекс, а обновление за это время не теряется
+            updater = threading.Thread(target=index.update, args=(5, 500))
+            updater.start()
+            updater.join(timeout=1)
+            self.assertFalse(updater.is_alive())
+            return {1: 10, 5: 20}
+
+        with mock.patch.object(rank_index, 'load_entries', load_entries):
+            self.assertEqual(index.rank(1), 2)
+        self.assertEqual(index.top(2), [(5, 500), (1, 10)])
+
+
+@skipUnless(importlib.util.find_spec('fakeredis'), 'fakeredis не установлен')
+class RedisRankIndexTest(TestCase):
+    def setUp(self):
+        import fakeredis
+
+        server = fakeredis.FakeServer()
+        with mock.patch('redis.Redis.from_url', lambda url: fakeredis.FakeRedis(server=server)):
+            self.index = RedisRankIndex()
+        for i, points in enumerate([50, 100, 50, 10]):
+            profile = UserProfile.objects.create(user=User.objects.create_user(f'redis{i}', password='password123'))
+            Leaderboard.objects.create(user_profile=profile, points=points)
+
+    def test_missing_key_is_loaded_from_table(self):
+        members = list(Leaderboard.objects.order_by('id').values_list('user_profile_id', flat=True))
+        self.assertEqual(self.index.count(), 4)
+        self.assertEqual([self.index.rank(m) for m in members], [2, 1, 2, 4])
+        self.assertEqual(self.index.rank_for_points(60), 2)
+        self.assertIsNone(self.index.rank(0))
+
+    def test_update_remove_and_top(self):
+        self.index.rebuild({1: 50, 2: 100, 3: 50, 4: 10})
+        self.index.update(4, 200)
+        self.index.remove(2)
+        self.assertEqual(self.index.top(2), [(4, 200), (3, 50)])
+        self.assertEqual(self.index.top(5, offset=2), [(1, 50)])
+        self.assertEqual(self.index.count(), 3)
+
+    def test_rebuild_keeps_updates_made_while_reading_table(self):
+        def load_entries():
+            self.index.update(5, 500)
+            self.index.remove(1)
+            return {1: 10, 2: 20, 5: 1}
+
+        self.index.rebuild({})
+        with mock.patch.object(rank_index, 'load_entries', load_entries):
+            self.assertEqual(self.index.reload(), 3)
+        self.assertEqual(self.index.top(5), [(5, 500), (2, 20)])
+
+
+class LeaderboardPaginationTest(TestCase):
+    def setUp(self):
+        rank_index._rank_index = None
+        self.profiles = []
+        for i, points in enumerate([100, 90, 90, 80, 70, 60, 50]):
+            user = User.objects.create_user(f'user{i}', password='password123')
+            profile = UserProfile.objects.create(user=user, xp=points)
+            Leaderboard.objects.create(user_profile=profile, points=points)
+            self.profiles.append(profile)
+
+    def test_cursor_walks_all_rows_once(self):
+        seen = []
+        cursor = None
+        while True:
+            entries, cursor = get_leaderboard_page(cursor, limit=3)
+            seen.extend((entry.user_profile_id, entry.rank) for entry in entries)
+            if cursor is None:
+                break
+        self.assertEqual([member for member, _ in seen], [p.id for p in self.profiles])
+        self.assertEqual([rank for _, rank in seen], [1, 2, 2, 4, 5, 6, 7])
+
+    def test_ranks_fall_back_to_db_when_index_fails(self):
+        broken = mock.Mock(**{f'{name}.side_effect': ConnectionError('refused') for name in ('rank', 'rank_for_points', 'count')})
+        user = self.profiles[3].user
+        self.client.force_login(user)
+        with mock.patch.object(rank_index, 'get_rank_index', return_value=broken), \
+                self.assertLogs('core.rank_index', 'ERROR'):
+            entries, _ = get_leaderboard_page(limit=4)
+            self.assertEqual([entry.rank for entry in entries], [1, 2, 2, 4])
+            self.assertEqual(rank_index.rank(self.profiles[6].id), 7)
+            self.assertIsNone(rank_index.rank(0))
+            self.assertEqual(rank_index.count(), 7)
+            response = self.client.get(reverse('leaderboard'))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['user_rank'], 4)
+            response = self.client.get(reverse('api_leaderboard'))
+            self.assertEqual(response.json()['user_rank'], 4)
+
+    def test_window_around_user(self):
+        entries, next_cursor = get_leaderboard_window(self.profiles[3], size=2)
+        self.assertEqual([e.user_profile_id for e in entries], [p.id for p in self.profiles[1:6]])
+        self.assertIsNotNone(next_cursor)
+        rest, _ = get_leaderboard_page(next_cursor, limit=10)
+        self.assertEqual([e.user_profile_id for e in rest], [self.profiles[6].id])
+
+
+class TaskServiceSubmitTest(TestCase):
+    def setUp(self):
+        rank_index._rank_index = None
+        self.user = User.objects.create_user('student', password='password123')
+        self.profile = UserProfile.objects.create(user=self.user, xp=5)
+        subject = Subject.objects.create(title='Математика')
+        self.task = Task.objects.create(subject=subject, question='2+2', correct_answer='4', difficulty=2)
+
+    def test_points_awarded_once(self):
+        attempt, is_correct, points = TaskService.submit_answer(self.user, self.task, '3')
+        self.assertEqual((attempt.attempts, is_correct, points), (1, False, 0))
+
+        attempt, is_correct, points = TaskService.submit_answer(self.user, self.task, ' 4 ')
+        self.assertEqual((attempt.attempts, is_correct, points), (2, True, 7))
+        self.assertTrue(attempt.is_solved)
+
+        attempt, is_correct, points = TaskService.submit_answer(self.user, self.task, '4')
+        self.assertEqual((attempt.attempts, is_correct, points), (2, True, 0))
+
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.xp, 12)
+        self.assertEqual(Leaderboard.objects.get(user_profile=self.profile).points, 12)
+
+    def test_first_solve_query_count(self):
+        if not db.has_upsert_returning():
+            self.skipTest('нет INSERT ... ON CONFLICT ... RETURNING')
+        # Снимок каталога (total_tasks для прогресса) в работающем процессе уже собран
+        catalog.get_snapshot()
+        # Журнал, upsert попытки, XP, upsert рейтинга, счетчик предмета + SAVEPOINT/RELEASE
+        with self.assertNumQueries(7):
+            attempt, is_correct, points = TaskService.submit_answer(self.user, self.task, '4')
+        self.assertEqual((attempt.attempts, attempt.is_solved, points), (1, True, 10))
+        self.assertEqual(Leaderboard.objects.get(user_profile=self.profile).points, 15)
+        self.assertEqual(get_subject_solved_counts(self.user), {self.task.subject_id: 1})
+
+        # Ответ на решенную задачу: upsert ничего не меняет, запись читается
+        with self.assertNumQueries(5):
+            attempt, _, points = TaskService.submit_answer(self.user, self.task, '4')
+        self.assertEqual((attempt.attempts, points), (1, 0))
+
+    def test_rejects_empty_answer(self):
+        with self.assertRaises(ValidationError):
+            TaskService.submit_answer(self.user, self.task, '  ')
+        self.assertFalse(TaskAttempt.objects.exists())
+
+
+class ProgressCountersTest(TestCase):
+    def setUp(self):
+        rank_index._rank_index = None
+        self.user = User.objects.create_user('student', password='password123')
+        UserProfile.objects.create(user=self.user)
+        self.subject = Subject.objects.create(title='Физика')
+        self.topic = Topic.objects.create(subject=self.subject, title='Механика')
+        self.tasks = [
+            Task.objects.create(subject=self.subject, topic=self.topic, question=f'Q{i}', correct_answer='A')
+            for i in range(3)
+        ]
+
+    def test_first_solve_increments_counters(self):
+        TaskService.submit_answer(self.user, self.tasks[0], 'A')
+        TaskService.submit_answer(self.user, self.tasks[0], 'A')
+        TaskService.submit_answer(self.user, self.tasks[1], 'B')
+
+        self.assertEqual(get_subject_solved_counts(self.user), {self.subject.id: 1})
+        self.assertEqual(get_topic_solved_counts(self.user), {self.topic.id: 1})
+        progress = UserProgress.objects.get(user=self.user, subject=self.subject)
+        self.assertEqual((progress.total_tasks, progress.progress_percentage), (3, 33))
+
+    def test_admin_moves_and_deletes_keep_counters(self):
+        TaskService.submit_answer(self.user, self.tasks[0], 'A')
+        TaskService.submit_answer(self.user, self.tasks[1], 'A')
+        other = Subject.objects.create(title='Химия')
+        other_topic = Topic.objects.create(subject=other, title='Атомы')
+
+        self.client.force_login(User.objects.create_superuser('admin', password='password123'))
+        changelist = reverse('admin:core_task_changelist')
+        self.client.post(changelist, {
+            'action': 'change_subject_action', '_selected_action': [self.tasks[0].id],
+            'apply': '1', 'subject_id': other.id,
+        })
+        self.client.post(changelist, {
+            'action': 'change_topic_action', '_selected_action': [self.tasks[0].id],
+            'apply': '1', 'topic_id': other_topic.id,
+        })
+        self.assertEqual(get_subject_solved_counts(self.user), {self.subject.id: 1, other.id: 1})
+        self.assertEqual(get_topic_solved_counts(self.user), {self.topic.id: 1, other_topic.id: 1})
+
+        self.client.post(changelist, {
+            'action': 'delete_selected', '_selected_action': [self.tasks[1].id], 'post': 'yes',
+        })
+        self.assertFalse(Task.objects.filter(id=self.tasks[1].id).exists())
+        self.assertEqual(get_subject_solved_counts(self.user), {self.subject.id: 0, other.id: 1})
+        self.assertEqual(UserProgress.objects.get(user=self.user, subject=self.subject).total_tasks, 1)
+
+    def test_reconcile_rebuilds_from_attempts(self):
+        TaskAttempt.objects.create(user=self.user, task=self.tasks[0], attempts=1, is_solved=True)
+        TaskAttempt.objects.create(user=self.user, task=self.tasks[2], attempts=2, is_solved=True)
+        UserProgress.objects.create(user=self.user, subject=self.subject, completed_tasks=7)
+
+        reconcile()
+
+        progress = UserProgress.objects.get(user=self.user, subject=self.subject)
+        self.assertEqual((progress.completed_tasks, progress.total_tasks), (2, 3))
+        self.assertEqual(get_topic_solved_counts(self.user, self.subject.id), {self.topic.id: 2})
+
+
+class TopicNavigationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        subject = Subject.objects.create(title='История')
+        self.topic = Topic.objects.create(subject=subject, title='Древний мир')
+        self.tasks = [
+            Task.objects.create(subject=subject, topic=self.topic, question=f'Q{i}', order=i)
+            for i in range(3)
+        ]
+
+    def test_position_is_served_from_cache(self):
+        first, second, third = self.tasks
+        self.assertEqual(get_task_position(second), (2, first.id, third.id, 3))
+        with self.assertNumQueries(0):
+            self.assertEqual(get_task_position(third), (3, second.id, None, 3))
+
+    def test_reorder_invalidates_index(self):
+        first, second, third = self.tasks
+        get_task_position(first)
+        third.order = -1
+        third.save()
+        self.assertEqual(get_task_position(first), (2, third.id, second.id, 3))
+
+
+class CatalogCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_namespace_bump_invalidates_keys(self):
+        calls = []
+        load = lambda: calls.append(1) or len(calls)
+        self.assertEqual(caching.get_or_set('demo', ('a',), load), 1)
+        self.assertEqual(caching.get_or_set('demo', ('a',), load), 1)
+        caching.bump_namespace('demo')
+        self.assertEqual(caching.get_or_set('demo', ('a',), load), 2)
+
+    def test_task_reads_are_cached_until_change(self):
+        subject = Subject.objects.create(title='Химия')
+        task = Task.objects.create(subject=subject, question='2+2?', correct_answer='4')
+        self.assertEqual(caching.get_task(task.id).question, '2+2?')
+        with self.assertNumQueries(0):
+            caching.get_task(task.id)
+        task.question = '3+3?'
+        task.save()
+        self.assertEqual(caching.get_task(task.id).question, '3+3?')
+
+    def test_missing_task_is_cached_briefly(self):
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            self.assertIsNone(caching.get_task(999))
+        self.assertEqual(cache_set.call_args.args[2], caching.MISS_TIMEOUT)
+
+
+class CatalogSnapshotTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.subject = Subject.objects.create(title='Химия')
+        self.topic = Topic.objects.create(subject=self.subject, title='Атомы', order=1)
+        for order in range(3):
+            Task.objects.create(subject=self.subject, topic=self.topic, question=f'q{order}',
+                                correct_answer='1', order=order, options=['1', '2'])
+
+    def test_snapshot_is_reused_and_swapped_on_change(self):
+        snapshot = catalog.get_snapshot()
+        subject = snapshot.get_subject(self.subject.id)
+        self.assertEqual(subject.total_tasks, 3)
+        self.assertEqual([t.title for t in subject.topics], ['Атомы'])
+        self.assertEqual([t.question for t in snapshot.tasks_for_topic(self.topic.id)], ['q0', 'q1', 'q2'])
+
+        with self.assertNumQueries(0):
+            self.assertIs(catalog.get_snapshot(), snapshot)
+
+        Topic.objects.create(subject=self.subject, title='Молекулы', order=2)
+        fresh = catalog.get_snapshot()
+        self.assertIsNot(fresh, snapshot)
+        self.assertEqual([t.title for t in fresh.get_subject(self.subject.id).topics], ['Атомы', 'Молекулы'])
+
+    def test_records_are_read_only(self):
+        task = catalog.get_snapshot().tasks[0]
+        with self.assertRaises(AttributeError):
+            task.question = 'changed'
+        self.assertEqual(task.options, ('1', '2'))
+
+    def test_api_reads_catalog_from_snapshot(self):
+        catalog.get_snapshot()
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/api/v1/topics/{self.topic.id}/tasks/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['topic']['total_tasks'], 3)
+        self.assertEqual([t['question'] for t in response.json()['tasks']], ['q0', 'q1', 'q2'])
+        self.assertEqual(response.json()['tasks'][0]['subject'], self.subject.id)
+
+
+class FakeModel:
+    """Заглушка модели Gemini: отвечает эхом, может ждать событие"""
+    calls = []
+    release = None
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    def generate_content(self, prompt):
+        FakeModel.calls.append(prompt)
+        if FakeModel.release is not None:
+            FakeModel.release.wait(5)
+        return type('Response', (), {'text': f'echo: {prompt}'})()
+
+
+@override_settings(AI_EXECUTOR={'MODEL_FACTORY': 'core.tests.FakeModel'})
+class AIExecutorTest(SimpleTestCase):
+    def setUp(self):
+        FakeModel.calls = []
+        FakeModel.release = threading.Event()
+        self.executor = AIExecutor(max_workers=2, max_pending=2, timeout=5)
+
+    def tearDown(self):
+        FakeModel.release.set()
+        self.executor.shutdown()
+
+    def test_identical_prompts_are_coalesced(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.executor.generate('теория')))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while self.executor.inflight_count() == 0:
+            time.sleep(0.01)
+        FakeModel.release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['echo: теория'] * 5)
+        self.assertEqual(FakeModel.calls, ['теория'])
+        self.assertEqual(self.executor.inflight_count(), 0)
+
+    def test_timeout_and_full_queue(self):
+        with self.assertRaisesRegex(AITimeoutError, 'after 0s'):
+            self.executor.generate('a', timeout=0)
+        with self.assertRaisesRegex(AITimeoutError, 'after 0.05s'):
+            self.executor.generate('a', timeout=0.05)
+        self.executor.submit('b', lambda: FakeModel('m').generate_content('b'))
+        with self.assertRaises(AIBusyError):
+            self.executor.generate('c')
+        # Таймаут не отменяет запрос: следующий вызов присоединяется к нему
+        FakeModel.release.set()
+        self.assertEqual(self.executor.generate('a'), 'echo: a')
+        self.assertEqual(FakeModel.calls.count('a'), 1)
+
+    def test_job_closes_its_db_connections(self):
+        FakeModel.release.set()
+        with mock.patch('core.ai_executor.connections') as connections:
+            self.executor.generate('d', on_result=lambda text: connections.close_all.assert_not_called())
+        connections.close_all.assert_called_once_with()
+
+
+@override_settings(AI_EXECUTOR={'MODEL_FACTORY': 'core.tests.FakeModel'})
+class AIContentPregenerationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        FakeModel.calls = []
+        FakeModel.release = None
+        subject = Subject.objects.create(title='Физика')
+        self.task = Task.objects.create(subject=subject, question='Что такое сила?', correct_answer='F')
+
+    def test_command_is_resumable_and_refreshes_stale_content(self):
+        call_command('pregenerate_ai_content', concurrency=2, stdout=StringIO())
+        self.assertEqual(TaskAIContent.objects.filter(task=self.task).count(), 4)
+        self.assertEqual(len(FakeModel.calls), 4)
+
+        call_command('pregenerate_ai_content', stdout=StringIO())
+        self.assertEqual(len(FakeModel.calls), 4)
+
+        self.task.question = 'Что такое масса?'
+        self.task.save()
+        call_command('pregenerate_ai_content', kind=['theory'], language=['tg'], stdout=StringIO())
+        self.assertEqual(len(FakeModel.calls), 5)
+        self.assertIn('масса', FakeModel.calls[-1])
+
+    def test_task_page_serves_stored_theory_without_model(self):
+        call_command('pregenerate_ai_content', kind=['theory'], language=['ru'], stdout=StringIO())
+        FakeModel.calls = []
+        text = ai_content.get_content(self.task, ai_content.THEORY, 'ru')
+        self.assertIn('Что такое сила?', text)
+        self.assertEqual(FakeModel.calls, [])
+
+
+@override_settings(AI_EXECUTOR={'MODEL_FACTORY': 'core.tests.FakeModel'})
+class AIContentBackgroundTest(TransactionTestCase):
+    # Фоновый поток пула пишет через свое соединение: нужны настоящие коммиты
+    def setUp(self):
+        cache.clear()
+        ai_store.get_memory().clear()
+        FakeModel.calls = []
+        subject = Subject.objects.create(title='Физика')
+        self.task = Task.objects.create(subject=subject, question='Что такое сила?', correct_answer='F')
+
+    def test_missing_content_is_queued_without_waiting(self):
+        FakeModel.release = threading.Event()
+        self.addCleanup(FakeModel.release.set)
+        started = time.monotonic()
+        text = ai_content.get_content(self.task, ai_content.HINT, 'ru')
+        self.assertEqual(text, ai_helper.PREPARING_MESSAGE)
+        self.assertLess(time.monotonic() - started, 1)
+
+        # Ответ модели сохраняется в фоне, следующий запрос берет его из БД
+        FakeModel.release.set()
+        deadline = time.monotonic() + 5
+        while not TaskAIContent.objects.filter(task=self.task, kind=ai_content.HINT).exists():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        self.assertIn('Что такое сила?', ai_content.get_content(self.task, ai_content.HINT, 'ru'))
+
+
+class AIStoreTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        ai_store.get_memory().clear()
+        ai_store.reset_metrics()
+
+    def test_store_survives_memory_loss_and_tracks_metrics(self):
+        key = ai_store.make_key(ai_store.ANSWER, 'model', 'что такое sin?', 'Задача 1')
+        self.assertIsNone(ai_store.get(key))
+        ai_store.put(key, ai_store.ANSWER, 'Синус - это...')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(ai_store.get(key), 'Синус - это...')
+
+        # Перезапуск воркера: память пуста, ответ берется из БД
+        ai_store.get_memory().clear()
+        self.assertEqual(ai_store.get(key), 'Синус - это...')
+
+        stats = ai_store.stats()
+        self.assertEqual((stats['memory_hits'], stats['db_hits'], stats['misses']), (1, 1, 1))
+        self.assertEqual(stats['db_rows'], 1)
+        self.assertEqual(stats['bytes_served'], 2 * len('Синус - это...'.encode()))
+
+    def test_memory_hits_are_batched(self):
+        key = ai_store.make_key(ai_store.HINT, 'model', 'x')
+        ai_store.put(key, ai_store.HINT, 'подсказка')
+
+        with mock.patch.object(cache, 'incr') as incr, mock.patch.object(cache, 'set_many') as set_many:
+            for _ in range(5):
+                ai_store.get(key)
+        incr.assert_not_called()
+        set_many.assert_not_called()
+        self.assertEqual(ai_store.stats()['memory_hits'], 5)
+
+        # Накопленные попадания пишутся в hits одним UPDATE при обновлении last_used_at
+        with mock.patch.object(ai_store.time, 'monotonic', return_value=time.monotonic() + ai_store.TOUCH_INTERVAL + 1):
+            ai_store.get(key)
+        self.assertEqual(AIResponse.objects.get(key=key).hits, 6)
+
+    def test_failed_metrics_flush_is_logged_and_kept(self):
+        ai_store._count('misses', 2)
+        ai_store._count('db_hits')
+        # Первый счетчик добавлен, на втором кэш упал: второй остается в очереди, первый не дублируется
+        with mock.patch.object(ai_store, 'has_atomic_ops', return_value=True), \
+                mock.patch.object(cache, 'incr', side_effect=[None, ConnectionError('cache is down')]), \
+                self.assertLogs('core.ai_store', 'ERROR'):
+            ai_store.flush_metrics()
+        # incr замокан: значение, которое записал бы первый вызов
+        cache.set(ai_store._metric_key('misses'), 2)
+        stats = ai_store.stats()
+        self.assertEqual((stats['misses'], stats['db_hits']), (2, 1))
+
+    def test_response_pruned_elsewhere_leaves_memory_on_touch(self):
+        key = ai_store.make_key(ai_store.THEORY, 'model', 'y')
+        ai_store.put(key, ai_store.THEORY, 'теория')
+        # prune_ai_responses в другом процессе: строки нет, а память этого процесса не очищена
+        AIResponse.objects.filter(key=key).delete()
+        self.assertEqual(ai_store.get(key), 'теория')
+
+        with mock.patch.object(ai_store.time, 'monotonic', return_value=time.monotonic() + ai_store.TOUCH_INTERVAL + 1):
+            self.assertIsNone(ai_store.get(key))
+        self.assertEqual(len(ai_store.get_memory()), 0)
+
+    def test_memory_lru_is_bounded_by_bytes(self):
+        lru = ai_store.MemoryLRU(max_bytes=10)
+        lru.set('a', 'aaaa', 4)
+        lru.set('b', 'bbbb', 4)
+        lru.get('a')
+        lru.set('c', 'cccc', 4)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('a')[0], 'aaaa')
+        self.assertEqual(lru.size, 8)
+
+    def test_prune_by_age_and_size(self):
+        for index in range(4):
+            ai_store.put(f'key{index}', ai_store.THEORY, 'x' * 100)
+        AIResponse.objects.filter(key='key0').update(last_used_at=timezone.now() - timedelta(days=200))
+        AIResponse.objects.filter(key='key1').update(last_used_at=timezone.now() - timedelta(days=1))
+
+        expired, evicted = ai_store.prune(max_age_days=90, max_bytes=200)
+        self.assertEqual((expired, evicted), (1, 1))
+        self.assertEqual(sorted(AIResponse.objects.values_list('key', flat=True)), ['key2', 'key3'])
+
+
+class ProgressSerializerQueriesTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('reader', password='pw12345678')
+        self.client.force_authenticate(self.user)
+        self.subject = Subject.objects.create(title='Алгебра')
+
+    def add_topic(self, order):
+        topic = Topic.objects.create(subject=self.subject, title=f'Тема {order}', order=order)
+        task = Task.objects.create(subject=self.subject, topic=topic, question=f'q{order}', correct_answer='1')
+        TaskService.submit_answer(self.user, task, '1')
+        return topic
+
+    def count_queries(self, url):
+        catalog.get_snapshot()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def test_subject_detail_query_count_is_constant(self):
+        topic = self.add_topic(1)
+        small, data = self.count_queries(f'/api/v1/subjects/{self.subject.id}/')
+        self.assertEqual(data['completed_tasks'], 1)
+        self.assertEqual(data['topics'][0]['progress_percentage'], 100)
+
+        for order in range(2, 7):
+            self.add_topic(order)
+        large, data = self.count_queries(f'/api/v1/subjects/{self.subject.id}/')
+        self.assertEqual(len(data['topics']), 6)
+        self.assertEqual(data['completed_tasks'], 6)
+        self.assertEqual(small, large)
+
+        small, _ = self.count_queries(f'/api/v1/topics/{topic.id}/tasks/')
+        self.assertLessEqual(small, 2)
+
+    def test_progress_is_read_only_for_serialized_objects(self):
+        first = self.add_topic(1)
+        other = self.add_topic(2)
+        task = Task.objects.get(topic=first)
+        catalog.get_snapshot()
+
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(f'/api/v1/tasks/{task.id}/').json()
+        self.assertEqual((data['is_solved'], data['attempts_count']), (True, 1))
+        attempt_queries = [query['sql'] for query in queries if 'core_taskattempt' in query['sql']]
+        self.assertEqual(len(attempt_queries), 1)
+        self.assertIn(f'IN ({task.id})', attempt_queries[0])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f'/api/v1/topics/{first.id}/tasks/')
+        topic_queries = [query['sql'] for query in queries if 'core_usertopicprogress' in query['sql']]
+        self.assertEqual(len(topic_queries), 1)
+        self.assertIn(f'IN ({first.id})', topic_queries[0])
+        self.assertNotIn(str(other.id), topic_queries[0].split('IN')[-1])
+
+
+class ProgressEndpointsQueryCountTest(APITestCase):
+    """Количество запросов не зависит от числа предметов, тем и задач"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('stats', password='pw12345678')
+        UserProfile.objects.create(user=self.user)
+        self.client.force_authenticate(self.user)
+        self.topics = []
+        for index in range(3):
+            subject = Subject.objects.create(title=f'Предмет {index}')
+            topic = Topic.objects.create(subject=subject, title=f'Тема {index}')
+            self.topics.append(topic)
+            for order in range(4):
+                task = Task.objects.create(subject=subject, topic=topic, question=f'q{order}',
+                                           correct_answer='1', order=order)
+                TaskService.submit_answer(self.user, task, '1' if order % 2 else '2')
+
+    def get(self, url, max_queries):
+        self.client.get(url)  # прогрев снимка каталога и индекса рейтинга
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(queries), max_queries, [query['sql'] for query in queries])
+        return response.json()
+
+    def test_user_stats_api(self):
+        data = self.get('/api/v1/stats/', 3)
+        self.assertEqual(data['total_solved'], 6)
+        self.assertEqual(data['total_attempts'], 12)
+
+    def test_user_progress_api(self):
+        data = self.get('/api/v1/progress/', 2)
+        self.assertEqual([row['completed_tasks'] for row in data['progress']], [2, 2, 2])
+
+    def test_topic_progress_api(self):
+        data = self.get(f'/api/v1/progress/topic/{self.topics[0].id}/', 2)
+        self.assertEqual(data['completed_tasks'], 2)
+        self.assertEqual([task['attempts'] for task in data['tasks']], [1, 1, 1, 1])
+        self.assertEqual(data['topic']['completed_tasks'], 2)
+
+
+class CatalogCursorPaginationTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        subject = Subject.objects.create(title='Геометрия')
+        self.topic = Topic.objects.create(subject=subject, title='Углы')
+        # Одинаковый order у нескольких задач: порядок внутри - по id
+        self.tasks = [
+            Task.objects.create(subject=subject, topic=self.topic, question=f'q{index}',
+                                correct_answer='1', order=index // 2, options=['1', '2'])
+            for index in range(7)
+        ]
+
+    def test_cursor_walks_all_tasks_without_gaps(self):
+        pages = []
+        url = '/api/v1/tasks/?limit=3'
+        while url:
+            data = self.client.get(url).json()
+            self.assertEqual(data['count'], 7)
+            pages.append([row['id'] for row in data['results']])
+            url = data['next']
+        self.assertEqual(sum(pages, []), [task.id for task in self.tasks])
+
+        # previous возвращает на предыдущие страницы до первой
+        back = []
+        url = data['previous']
+        while url:
+            data = self.client.get(url).json()
+            back.append([row['id'] for row in data['results']])
+            url = data['previous']
+        self.assertEqual(back, pages[-2::-1])
+
+    def test_cursor_pages_are_served_from_snapshot(self):
+        catalog.get_snapshot()
+        cursor = encode_key(1, self.tasks[3].id)
+        with self.assertNumQueries(0):
+            data = self.client.get(f'/api/v1/tasks/?limit=3&cursor={cursor}').json()
+        self.assertEqual([row['id'] for row in data['results']], [task.id for task in self.tasks[4:7]])
+        self.assertIsNone(data['next_cursor'])
+        self.assertEqual(data['count'], 7)
+        self.assertIn(f"cursor={encode_key(0, self.tasks[0].id)}", data['previous'])
+
+    def test_sparse_fields(self):
+        data = self.client.get('/api/v1/tasks/?fields=question').json()
+        self.assertEqual(set(data['results'][0]), {'id', 'question'})
+
+    def test_bulk_tasks_are_streamed(self):
+        response = self.client.get(f'/api/v1/topics/{self.topic.id}/tasks/?bulk=1&fields=question')
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(data['topic']['id'], self.topic.id)
+        self.assertEqual([row['question'] for row in data['tasks']], [f'q{index}' for index in range(7)])
+        self.assertEqual(set(data['tasks'][0]), {'id', 'question'})
+
+
+class TopicPackTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.pack_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.pack_dir, ignore_errors=True)
+        override = override_settings(TOPIC_PACK_DIR=self.pack_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        subject = Subject.objects.create(title='Информатика')
+        self.topic = Topic.objects.create(subject=subject, title='Циклы')
+        self.task = Task.objects.create(subject=subject, topic=self.topic, question='for?',
+                                        correct_answer='1', options=['1', '2'])
+        self.url = f'/api/v1/topics/{self.topic.id}/pack/'
+
+    def test_pack_is_served_gzipped_with_etag(self):
+        call_command('build_topic_packs', stdout=StringIO())
+        self.assertEqual(len(os.listdir(self.pack_dir)), 1)
+
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        data = json.loads(gzip.decompress(b''.join(response.streaming_content)))
+        self.assertEqual(data['topic']['title'], 'Циклы')
+        self.assertEqual(data['tasks'][0]['options'], ['1', '2'])
+
+        plain = self.client.get(self.url)
+        self.assertEqual(plain.json()['tasks'][0]['question'], 'for?')
+
+        etag = response['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.task.question = 'while?'
+        self.task.save()
+        changed = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+
+        call_command('build_topic_packs', prune=True, stdout=StringIO())
+        self.assertEqual(len(os.listdir(self.pack_dir)), 1)
+
+
+class SyncApiTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('student', password='password123')
+        UserProfile.objects.create(user=self.user)
+        self.subject = Subject.objects.create(title='Биология')
+        self.topic = Topic.objects.create(subject=self.subject, title='Клетка')
+        self.other = Topic.objects.create(subject=self.subject, title='Ткани')
+        self.tasks = [
+            Task.objects.create(subject=self.subject, topic=self.topic, question=f'Q{i}', correct_answer='A')
+            for i in range(3)
+        ]
+        TaskAttempt.objects.create(user=self.user, task=self.tasks[0], attempts=1)
+
+    def test_delta_contains_only_changes_since_version(self):
+        self.client.force_authenticate(self.user)
+        full = self.client.get('/api/v1/sync/').json()
+        self.assertTrue(full['full'])
+        self.assertEqual(len(full['tasks']), 3)
+        self.assertEqual(full['attempts'][0]['task_id'], self.tasks[0].id)
+
+        # Попытки выбираются по времени: все, что было до токена, - старше окна перекрытия
+        TaskAttempt.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+
+        self.tasks[1].question = 'Q1 (new)'
+        self.tasks[1].save()
+        TaskAttempt.objects.create(user=self.user, task=self.tasks[2], attempts=1, is_solved=True)
+        other_id = self.other.id
+        self.other.delete()
+
+        delta = self.client.get('/api/v1/sync/', {'since': full['version']}).json()
+        self.assertFalse(delta['full'])
+        self.assertEqual([t['id'] for t in delta['tasks']], [self.tasks[1].id])
+        self.assertEqual(delta['tasks'][0]['question'], 'Q1 (new)')
+        self.assertEqual(delta['subjects'], [])
+        self.assertEqual(delta['deleted']['topic'], [other_id])
+        self.assertEqual([a['task_id'] for a in delta['attempts']], [self.tasks[2].id])
+
+        self.client.force_authenticate(None)
+        anonymous = self.client.get('/api/v1/sync/', {'since': 'garbage'}).json()
+        self.assertTrue(anonymous['full'])
+        self.assertEqual(anonymous['attempts'], [])
+
+    def test_admin_bulk_move_is_in_delta(self):
+        self.client.force_authenticate(self.user)
+        version = self.client.get('/api/v1/sync/').json()['version']
+
+        admin_user = User.objects.create_superuser('admin', password='password123')
+        self.client.force_login(admin_user)
+        self.client.post(reverse('admin:core_task_changelist'), {
+            'action': 'change_topic_action',
+            '_selected_action': [self.tasks[0].id, self.tasks[1].id],
+            'apply': '1',
+            'topic_id': self.other.id,
+        })
+
+        self.client.force_authenticate(self.user)
+        delta = self.client.get('/api/v1/sync/', {'since': version}).json()
+        self.assertEqual(sorted(t['id'] for t in delta['tasks']), [self.tasks[0].id, self.tasks[1].id])
+        self.assertEqual({t['topic'] for t in delta['tasks']}, {self.other.id})
+
+    def test_cascade_delete_is_recorded_in_one_batch(self):
+        version = self.client.get('/api/v1/sync/').json()['version']
+        deleted = [self.subject.id, self.topic.id, self.other.id, *(task.id for task in self.tasks)]
+
+        with mock.patch.object(caching, 'bump_namespace') as bump, CaptureQueriesContext(connection) as queries:
+            self.subject.delete()
+        inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "core_catalogdeletion"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(len(set(CatalogDeletion.objects.values_list('sync_seq', flat=True))), 1)
+        # Версия каталога сбрасывается один раз - после коммита, а не на каждый объект каскада
+        bump.assert_not_called()
+        self.assertEqual(sum(entry[1] is caching._bump_catalog for entry in connection.run_on_commit), 1)
+
+        delta = self.client.get('/api/v1/sync/', {'since': version}).json()
+        self.assertEqual(sorted(sum(delta['deleted'].values(), [])), sorted(deleted))
+
+    def test_token_older_than_pruned_deletions_gets_full_snapshot(self):
+        old_version = self.client.get('/api/v1/sync/').json()['version']
+        self.other.delete()
+        CatalogDeletion.objects.update(deleted_at=timezone.now() - timedelta(days=100))
+        version = self.client.get('/api/v1/sync/').json()['version']
+
+        call_command('prune_catalog_deletions', max_age_days=30, stdout=StringIO())
+        self.assertFalse(CatalogDeletion.objects.exists())
+
+        stale = self.client.get('/api/v1/sync/', {'since': old_version}).json()
+        self.assertTrue(stale['full'])
+        self.assertEqual([t['id'] for t in stale['topics']], [self.topic.id])
+        fresh = self.client.get('/api/v1/sync/', {'since': version}).json()
+        self.assertFalse(fresh['full'])
+        self.assertEqual(fresh['tasks'], [])
+
+
+class SubmitBatchApiTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        rank_index._rank_index = None
+        self.user = User.objects.create_user('student', password='password123')
+        self.profile = UserProfile.objects.create(user=self.user)
+        self.subject = Subject.objects.create(title='Математика')
+        self.topic = Topic.objects.create(subject=self.subject, title='Дроби')
+        self.tasks = [
+            Task.objects.create(subject=self.subject, topic=self.topic, question=f'Q{i}',
+                                correct_answer='4', difficulty=2)
+            for i in range(3)
+        ]
+        TaskAttempt.objects.create(user=self.user, task=self.tasks[2], attempts=1, is_solved=True, points_earned=10)
+        self.client.force_authenticate(self.user)
+
+    def test_batch_grades_in_client_order_with_single_award(self):
+        first, second, solved = self.tasks
+        answers = [
+            {'task_id': first.id, 'answer': '4', 'client_timestamp': '2026-01-01T10:05:00Z'},
+            {'task_id': first.id, 'answer': '3', 'client_timestamp': '2026-01-01T10:00:00Z'},
+            {'task_id': second.id, 'answer': '4', 'client_timestamp': '2026-01-01T10:01:00Z'},
+            {'task_id': solved.id, 'answer': '4'},
+            {'task_id': 999999, 'answer': '4'},
+        ]
+        response = self.client.post('/api/v1/tasks/submit-batch/', {'answers': answers}, format='json')
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+
+        # Неправильный ответ был раньше по времени, поэтому решено со второй попытки
+        self.assertEqual((results[1]['attempts'], results[1]['is_correct']), (1, False))
+        self.assertEqual((results[0]['attempts'], results[0]['points_earned']), (2, 7))
+        self.assertEqual(results[2]['points_earned'], 10)
+        self.assertEqual((results[3]['attempts'], results[3]['points_earned']), (1, 0))
+        self.assertFalse(results[4]['success'])
+        self.assertEqual(response.json()['points_earned'], 17)
+
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.xp, 17)
+        self.assertEqual(Leaderboard.objects.get(user_profile=self.profile).points, 17)
+        self.assertEqual(UserProgress.objects.get(user=self.user, subject=self.subject).completed_tasks, 2)
+        self.assertEqual(UserTopicProgress.objects.get(user=self.user, topic=self.topic).completed_tasks, 2)
+        self.assertEqual(TaskAttempt.objects.get(user=self.user, task=first).attempts, 2)
+
+    def test_rejects_empty_batch(self):
+        response = self.client.post('/api/v1/tasks/submit-batch/', {'answers': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ConditionalGetTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        rank_index._rank_index = None
+        self.user = User.objects.create_user('student', password='password123')
+        UserProfile.objects.create(user=self.user)
+        self.subject = Subject.objects.create(title='География')
+        self.topic = Topic.objects.create(subject=self.subject, title='Реки')
+        self.task = Task.objects.create(subject=self.subject, topic=self.topic, question='Q', correct_answer='A')
+
+    def assertRevalidates(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        return etag
+
+    def test_catalog_endpoints_return_304_until_catalog_changes(self):
+        for url in ('/api/v1/home/', '/api/v1/subjects/', f'/api/v1/topics/{self.topic.id}/', '/'):
+            etag = self.assertRevalidates(url)
+
+        self.subject.title = 'Физическая география'
+        self.subject.save()
+        self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_main_etag_follows_stats(self):
+        response = self.client.get('/')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        etag = response['ETag']
+
+        User.objects.create_user('newcomer', password='password123')
+        cache.delete(caching.make_key(caching.CATALOG, 'stats'))
+        self.assertNotEqual(self.client.get('/')['ETag'], etag)
+
+    def test_page_with_csrf_token_has_no_shared_etag(self):
+        from django.middleware.csrf import get_token
+
+        @conditional.catalog_condition
+        def view(request):
+            return HttpResponse(get_token(request))
+
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        response = view(request)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_authenticated_etag_follows_progress(self):
+        self.client.force_authenticate(self.user)
+        etag = self.client.get('/api/v1/home/')['ETag']
+        self.assertEqual(self.client.get('/api/v1/home/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        TaskService.submit_answer(self.user, self.task, 'A')
+        response = self.client.get('/api/v1/home/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['subjects'][0]['completed_tasks'], 1)
+
+
+class AnonymousPageCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.subject = Subject.objects.create(title='Литература')
+
+    def _page_is_cached(self, path):
+        with translation.override(settings.LANGUAGE_CODE):
+            key = page_cache._page_key(caching.CATALOG, RequestFactory().get(path))
+        return cache.get(key) is not None
+
+    def test_anonymous_page_is_cached_until_catalog_changes(self):
+        response = self.client.get('/')
+        self.assertContains(response, 'Литература')
+        self.assertNotContains(response, 'csrfmiddlewaretoken')
+        self.assertTrue(self._page_is_cached('/'))
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get('/'), 'Литература')
+
+        self.subject.title = 'Русская литература'
+        self.subject.save()
+        self.assertContains(self.client.get('/'), 'Русская литература')
+
+    def test_language_link_switches_language(self):
+        response = self.client.get('/language/ru/', {'next': f'/subject/{self.subject.id}/'})
+        self.assertRedirects(response, f'/subject/{self.subject.id}/', fetch_redirect_response=False)
+        self.assertEqual(response.cookies[settings.LANGUAGE_COOKIE_NAME].value, 'ru')
+        self.assertRedirects(self.client.get('/language/ru/', {'next': 'https://evil.example/'}), '/', fetch_redirect_response=False)
+        self.assertEqual(self.client.get('/language/xx/').status_code, 404)
+
+    def test_concurrent_misses_render_once(self):
+        calls = []
+
+        @anonymous_page_cache()
+        def view(request):
+            calls.append(1)
+            time.sleep(0.2)
+            return HttpResponse('page')
+
+        def fetch(results):
+            request = RequestFactory().get('/stampede/')
+            request.user = AnonymousUser()
+            results.append(view(request).content)
+
+        results = []
+        threads = [threading.Thread(target=fetch, args=(results,)) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [b'page'] * 5)
+
+
+class LazyAttemptTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('student', password='password123')
+        UserProfile.objects.create(user=self.user)
+        subject = Subject.objects.create(title='Алгебра')
+        self.topic = Topic.objects.create(subject=subject, title='Уравнения')
+        self.tasks = [
+            Task.objects.create(subject=subject, topic=self.topic, question=f'Q{i}', correct_answer='A', order=i)
+            for i in range(3)
+        ]
+        self.client.force_login(self.user)
+
+    def test_viewing_tasks_writes_nothing_and_topic_resumes_last_viewed(self):
+        self.assertEqual(self.client.get(f'/task/{self.tasks[1].id}/').status_code, 200)
+        self.assertFalse(TaskAttempt.objects.exists())
+        self.assertRedirects(self.client.get(f'/topic/{self.topic.id}/'), f'/task/{self.tasks[1].id}/',
+                             fetch_redirect_response=False)
+
+        TaskService.submit_answer(self.user, self.tasks[1], 'A')
+        TaskService.submit_answer(self.user, self.tasks[0], 'A')
+        self.assertRedirects(self.client.get(f'/topic/{self.topic.id}/'), f'/task/{self.tasks[2].id}/',
+                             fetch_redirect_response=False)
+
+    def test_purge_removes_only_empty_attempts(self):
+        TaskAttempt.objects.create(user=self.user, task=self.tasks[0], attempts=0)
+        TaskAttempt.objects.create(user=self.user, task=self.tasks[1], attempts=0)
+        TaskAttempt.objects.create(user=self.user, task=self.tasks[2], attempts=2)
+
+        call_command('purge_empty_attempts', batch_size=1, stdout=StringIO())
+        self.assertEqual(list(TaskAttempt.objects.values_list('task_id', flat=True)), [self.tasks[2].id])
+
+
+class AnswerEventLogTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        rank_index._rank_index = None
+        self.user = User.objects.create_user('student', password='password123')
+        self.profile = UserProfile.objects.create(user=self.user)
+        self.subject = Subject.objects.create(title='Физика')
+        self.task = Task.objects.create(subject=self.subject, question='g?', correct_answer='9.8', difficulty=2)
+
+    def test_sync_submission_is_logged_as_folded(self):
+        TaskService.submit_answer(self.user, self.task, '10')
+        self.assertEqual(list(AnswerEvent.objects.values_list('is_correct', 'folded')), [(False, True)])
+        self.assertEqual(answer_events.fold(), (0, 0))
+
+    @override_settings(ANSWER_EVENTS={'ASYNC': True})
+    def test_async_submission_is_folded_by_worker(self):
+        attempt, is_correct, points = TaskService.submit_answer(self.user, self.task, '10')
+        self.assertEqual((attempt.attempts, is_correct, points), (1, False, 0))
+        attempt, is_correct, points = TaskService.submit_answer(self.user, self.task, '9.8')
+        self.assertEqual((attempt.attempts, attempt.is_solved, points), (2, True, 7))
+        self.assertFalse(TaskAttempt.objects.exists())
+
+        call_command('fold_answer_events', batch_size=1, stdout=StringIO())
+
+        attempt = TaskAttempt.objects.get(user=self.user, task=self.task)
+        self.assertEqual((attempt.attempts, attempt.is_solved, attempt.points_earned), (2, True, 7))
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.xp, 7)
+        self.assertEqual(UserProgress.objects.get(user=self.user, subject=self.subject).completed_tasks, 1)
+        self.assertEqual(EventCursor.objects.get().last_event_id, AnswerEvent.objects.latest('id').id)
+        self.assertEqual(answer_events.fold(), (0, 0))
+
+    def test_event_committed_late_with_lower_id_is_folded(self):
+        other = Task.objects.create(subject=self.subject, question='c?', correct_answer='3e8', difficulty=2)
+        AnswerEvent.objects.create(id=10, user=self.user, task=self.task, answer='9.8', is_correct=True)
+        self.assertEqual(answer_events.fold(), (1, 1))
+
+        # Транзакция получила id раньше, а закоммитилась после прохода обработчика
+        AnswerEvent.objects.create(id=5, user=self.user, task=other, answer='3e8', is_correct=True,
+                                   created_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(answer_events.fold(), (1, 1))
+        self.assertTrue(TaskAttempt.objects.get(user=self.user, task=other).is_solved)
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.xp, 20)
+        self.assertFalse(AnswerEvent.objects.filter(folded=False).exists())
+
+
+class OGImageCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.image_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.image_dir, ignore_errors=True)
+        override = override_settings(OG_IMAGE_DIR=self.image_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        subject = Subject.objects.create(title='Математика')
+        self.task = Task.objects.create(subject=subject, question='2+2?', correct_answer='A',
+                                        options={'A': '4', 'B': '5'})
+        self.url = f'/task/{self.task.id}/og-image.png'
+
+    def test_image_is_rendered_once_per_content(self):
+        digest = og_images.content_hash(self.task)
+        response = self.client.get(self.url, {'v': digest})
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'\x89PNG'))
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['ETag'], f'"{digest}"')
+        self.assertEqual(len(os.listdir(self.image_dir)), 1)
+
+        self.assertNotIn('immutable', self.client.get(self.url)['Cache-Control'])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=f'"{digest}"').status_code, 304)
+        self.assertEqual(len(os.listdir(self.image_dir)), 1)
+
+        self.task.question = '3+3?'
+        self.task.save()
+        self.assertNotEqual(self.client.get(self.url)['ETag'], f'"{digest}"')
+        self.assertEqual(len(os.listdir(self.image_dir)), 2)
+
+    def test_render_command_fills_the_cache_the_view_serves(self):
+        call_command('render_og_images', workers=1, stdout=StringIO())
+        path = og_images.image_path(self.task)
+        self.assertTrue(os.path.exists(path))
+
+        call_command('render_og_images', workers=1, prune=True, stdout=StringIO())
+        self.assertEqual(os.listdir(self.image_dir), [os.path.basename(path)])
+
+        response = self.client.get(self.url)
+        self.assertEqual(response['ETag'], f'"{og_images.content_hash(self.task)}"')
+        self.assertEqual(os.listdir(self.image_dir), [os.path.basename(path)])
+
+    def test_force_rerender_counts_only_growth_against_max_bytes(self):
+        call_command('render_og_images', workers=1, stdout=StringIO())
+        size = os.path.getsize(og_images.image_path(self.task))
+
+        out = StringIO()
+        call_command('render_og_images', workers=1, force=True, max_bytes=size + 1, stdout=out)
+        self.assertIn('Отрендерено: 1', out.getvalue())
+        self.assertNotIn('--max-bytes', out.getvalue())
+
+class SitemapTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.sitemap_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.sitemap_dir, ignore_errors=True)
+        override = override_settings(SITEMAP_DIR=self.sitemap_dir, SITE_URL='https://example.com')
+        override.enable()
+        self.addCleanup(override.disable)
+        sitemap._current = None
+        self.addCleanup(self.wait_for_build)
+
+        self.subject = Subject.objects.create(title='Математика')
+        self.topic = Topic.objects.create(subject=self.subject, title='Алгебра')
+        self.tasks = [
+            Task.objects.create(subject=self.subject, topic=self.topic, question=f'{i}+{i}?', correct_answer='A')
+            for i in range(3)
+        ]
+
+    def wait_for_build(self):
+        if sitemap._builder is not None:
+            sitemap._builder.join(timeout=10)
+
+    def test_index_and_section_list_tasks_with_lastmod(self):
+        response = self.client.get('/sitemap.xml')
+        self.assertEqual(response['Content-Type'], 'application/xml')
+        self.assertIn(b'<loc>https://example.com/sitemap-1.xml</loc>', response.content)
+
+        section = self.client.get('/sitemap-1.xml').content.decode()
+        lastmod = self.tasks[0].updated_at.astimezone(dt_timezone.utc).strftime('%Y-%m-%dT%H:%M:%S+00:00')
+        self.assertIn(f'<loc>https://example.com/task/{self.tasks[0].id}/</loc><lastmod>{lastmod}</lastmod>', section)
+        self.assertIn(f'https://example.com/subject/{self.subject.id}/', section)
+        self.assertNotIn('/topic/', section)
+        self.assertEqual(self.client.get('/sitemap-2.xml').status_code, 404)
+
+    def test_gzip_passthrough_and_not_modified(self):
+        response = self.client.get('/sitemap-1.xml', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        body = gzip.decompress(b''.join(response.streaming_content))
+        self.assertIn(f'/task/{self.tasks[1].id}/'.encode(), body)
+
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/sitemap-1.xml', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Пока новый набор собирается в фоне, отдается прежний
+        task = Task.objects.create(subject=self.subject, topic=self.topic, question='new?', correct_answer='A')
+        self.assertEqual(self.client.get('/sitemap-1.xml', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.wait_for_build()
+        response = self.client.get('/sitemap-1.xml', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'/task/{task.id}/'.encode(), response.content)
+        # Текущее поколение и предыдущее
+        self.assertEqual(len(os.listdir(self.sitemap_dir)), 2)
+
+    def test_stale_set_is_kept_one_cycle_then_replaced(self):
+        first = sitemap.get_sitemaps()
+        Task.objects.create(subject=self.subject, topic=self.topic, question='b?', correct_answer='A')
+        self.assertIs(sitemap.get_sitemaps(), first)
+        self.wait_for_build()
+        second = sitemap.get_sitemaps()
+        self.assertNotEqual(second.directory, first.directory)
+        self.assertTrue(os.path.exists(first.path(1)))
+
+        task = Task.objects.create(subject=self.subject, topic=self.topic, question='c?', correct_answer='A')
+        sitemap.get_sitemaps()
+        self.wait_for_build()
+        current = sitemap.get_sitemaps()
+        self.assertFalse(os.path.isdir(first.directory))
+        self.assertTrue(os.path.isdir(second.directory))
+
+        # Воркер получил набор до того, как его удалили: отдается текущий
+        with mock.patch.object(sitemap, 'get_sitemaps', side_effect=[first, current]):
+            response = self.client.get('/sitemap-1.xml')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'/task/{task.id}/'.encode(), response.content)
+
+    def test_prune_skips_generations_removed_concurrently(self):
+        for mtime, name in enumerate(('1', '2', '3', '4')):
+            os.makedirs(os.path.join(self.sitemap_dir, name))
+            os.utime(os.path.join(self.sitemap_dir, name), (mtime, mtime))
+        real_scandir = os.scandir
+
+        class Entry:
+            def __init__(self, entry):
+                self.name, self.path, self._entry = entry.name, entry.path, entry
+
+            def stat(self):
+                if self.name == '3':
+                    # Другой процесс удалил поколение между scandir и stat
+                    raise FileNotFoundError(self.path)
+                return self._entry.stat()
+
+        @contextmanager
+        def scandir(path):
+            with real_scandir(path) as entries:
+                yield [Entry(entry) for entry in entries]
+
+        with mock.patch.object(sitemap.os, 'scandir', scandir):
+            sitemap._prune(self.sitemap_dir, '4')
+        self.assertEqual(sorted(os.listdir(self.sitemap_dir)), ['2', '3', '4'])
+
+    def test_sections_are_split_by_max_urls(self):
+        with mock.patch.object(sitemap, 'MAX_URLS', 3):
+            response = self.client.get('/sitemap.xml')
+        # 4 статические страницы + предмет + 3 задачи
+        self.assertIn(b'/sitemap-3.xml', response.content)
+        self.assertNotIn(b'/sitemap-4.xml', response.content)
+        self.assertIn(f'/task/{self.tasks[2].id}/'.encode(), self.client.get('/sitemap-3.xml').content)
+
+
+class RateLimitTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.policy = ratelimit.RatePolicy('test', 10, 3600)
+
+    def test_burst_capacity_and_sliding_window(self):
+        start = 3600 * 1000
+        results = [ratelimit.hit(self.policy, 'user-1', now=start) for _ in range(12)]
+        self.assertEqual([result.allowed for result in results], [True] * 10 + [False] * 2)
+        self.assertEqual(results[9].remaining, 0)
+        self.assertEqual(results[10].retry_after, 3600)
+        self.assertTrue(ratelimit.hit(self.policy, 'user-2', now=start).allowed)
+
+        # Половина следующего окна: предыдущее учитывается с весом 0.5
+        middle = start + 3600 + 1800
+        allowed = sum(ratelimit.hit(self.policy, 'user-1', now=middle).allowed for _ in range(10))
+        self.assertEqual(allowed, 5)
+        self.assertGreater(ratelimit.hit(self.policy, 'user-1', now=middle).retry_after, 0)
+
+    def _concurrent_burst(self):
+        barrier = threading.Barrier(8)
+        allowed = []
+
+        def worker():
+            barrier.wait()
+            for _ in range(5):
+                allowed.append(ratelimit.hit(self.policy, 'user-1').allowed)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return allowed.count(True)
+
+    def test_concurrent_burst_is_atomic(self):
+        self.assertEqual(self._concurrent_burst(), 10)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'ratelimit'}})
+    def test_concurrent_burst_is_atomic_with_native_incr(self):
+        self.assertEqual(self._concurrent_burst(), 10)
+
+    def test_task_view_and_api_share_the_ai_limit(self):
+        user = User.objects.create_user(username='limited', password='pass')
+        subject = Subject.objects.create(title='Математика')
+        task = Task.objects.create(subject=subject, question='2+2?', correct_answer='A')
+        for _ in range(10):
+            self.assertTrue(ratelimit.hit(ratelimit.get_policy(ratelimit.AI), f'user-{user.pk}').allowed)
+
+        self.client.force_login(user)
+        response = self.client.post(f'/task/{task.id}/', {'hint': '1'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+        request = APIRequestFactory().post('/api/gmini/')
+        request.user = user
+        throttle = AIRateThrottle()
+        self.assertFalse(throttle.allow_request(request, None))
+        self.assertGreater(throttle.wait(), 0)
+
+
+class FontRegistryTest(SimpleTestCase):
+    def test_fonts_are_shared_and_wrapping_fits_width(self):
+        font = font_registry.get_font(32)
+        self.assertIs(font_registry.get_font(32), font)
+        self.assertIsNot(font_registry.get_font(32, bold=True), font)
+
+        text = 'Ҳисоб кунед: суммаи ду адад ба ҳашт баробар аст, фарқи онҳо ду аст. Ададҳоро ёбед.'
+        lines = font_registry.wrap_text(text, font, 500)
+        self.assertGreater(len(lines), 1)
+        self.assertEqual(' '.join(lines), text)
+        for line in lines:
+            self.assertLessEqual(font.getlength(line), 500 + 2)
+
+        short = font_registry.truncate_text(text, font, 300)
+        self.assertTrue(short.endswith('...'))
+        self.assertLessEqual(font.getlength(short), 300 + 2)
+
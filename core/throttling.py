@@ -1,7 +1,9 @@
 """
 Кастомные throttle классы для rate limiting
 """
-from rest_framework.throttling import UserRateThrottle, AnonRateThrottle
+from rest_framework.throttling import BaseThrottle, UserRateThrottle, AnonRateThrottle
+
+from . import ratelimit
 
 
 class LoginRateThrottle(UserRateThrottle):
@@ -9,18 +11,23 @@ class LoginRateThrottle(UserRateThrottle):
     scope = 'login'
 
 
-class AIRateThrottle(UserRateThrottle):
-    """Ограничение AI запросов - 10 в час на пользователя"""
-    scope = 'ai'
+class SlidingWindowThrottle(BaseThrottle):
+    """
+    Throttle на core.ratelimit: атомарный счетчик со скользящим окном в общем кэше
+
+    Лимит и счетчики общие с HTML-представлениями, которые вызывают
+    ratelimit.hit с тем же scope.
+    """
+    scope = None
+    
+    def allow_request(self, request, view):
+        self.result = ratelimit.hit(ratelimit.get_policy(self.scope), ratelimit.client_ident(request))
+        return self.result.allowed
     
-    def get_cache_key(self, request, view):
-        """Создаем ключ кэша на основе IP для анонимов и user_id для авторизованных"""
-        if request.user and request.user.is_authenticated:
-            ident = request.user.pk
-        else:
-            ident = self.get_ident(request)
-        
-        return self.cache_format % {
-            'scope': self.scope,
-            'ident': ident
-        }
+    def wait(self):
+        return self.result.retry_after
+
+
+class AIRateThrottle(SlidingWindowThrottle):
+    """Ограничение AI запросов - 10 в час на пользователя (IP для анонимов)"""
+    scope = ratelimit.AI
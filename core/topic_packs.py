@@ -0,0 +1,163 @@
+"""
+Офлайн-пакеты тем для мобильного приложения
+
+Пакет - один JSON со всей темой (метаданные, предмет, все задачи с
+вариантами ответов), заранее сжатый gzip и сохраненный на диск под
+именем с хэшем содержимого. Хэш же служит ETag: приложение присылает
+If-None-Match и получает 304, пока тема не изменилась.
+
+Пакет пересобирается только при изменении хэша содержимого темы:
+- команда build_topic_packs собирает пакеты всех тем заранее;
+- endpoint при смене поколения каталога пересчитывает хэш темы из
+  снимка в памяти и, если файла с таким хэшем еще нет, собирает его.
+"""
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+
+from .catalog import get_snapshot
+
+# Увеличить при изменении формата пакета
+PACK_FORMAT = 1
+
+
+def get_pack_dir():
+    return str(getattr(settings, 'TOPIC_PACK_DIR', os.path.join(settings.BASE_DIR, 'var', 'packs')))
+
+
+def build_payload(topic):
+    """
+    Содержимое пакета темы
+
+    Args:
+        topic: TopicRecord из снимка каталога
+
+    Returns:
+        dict: format, topic, subject, tasks
+    """
+    from .serializers import TaskSerializer, TopicSerializer
+
+    tasks = get_snapshot().tasks_for_topic(topic.id)
+    return {
+        'format': PACK_FORMAT,
+        'topic': {**TopicSerializer(topic).data, 'total_tasks': topic.total_tasks},
+        'subject': {
+            'id': topic.subject.id,
+            'title': topic.subject.title,
+            'icon': topic.subject.icon,
+            'color': topic.subject.color,
+        },
+        'tasks': TaskSerializer(tasks, many=True).data,
+    }
+
+
+def encode_payload(payload):
+    """Канонический JSON (стабильный порядок ключей) - одинаковое содержимое дает одинаковый хэш"""
+    return json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode()
+
+
+class Pack:
+    """Собранный пакет на диске"""
+
+    __slots__ = ('topic_id', 'digest', 'path', 'size')
+
+    def __init__(self, topic_id, digest, path, size):
+        self.topic_id = topic_id
+        self.digest = digest
+        self.path = path
+        self.size = size
+
+    @property
+    def etag(self):
+        return f'"{self.digest}"'
+
+
+def _pack_path(topic_id, digest):
+    return os.path.join(get_pack_dir(), f'topic-{topic_id}-{digest}.json.gz')
+
+
+def build_pack(topic):
+    """
+    Сборка пакета темы (если пакета с таким содержимым еще нет)
+
+    Args:
+        topic: TopicRecord
+
+    Returns:
+        tuple: (Pack, created)
+    """
+    raw = encode_payload(build_payload(topic))
+    digest = hashlib.sha256(raw).hexdigest()[:32]
+    path = _pack_path(topic.id, digest)
+    if os.path.exists(path):
+        return Pack(topic.id, digest, path, os.path.getsize(path)), False
+
+    os.makedirs(get_pack_dir(), exist_ok=True)
+    # mtime=0 - одинаковое содержимое дает побайтно одинаковый файл
+    data = gzip.compress(raw, compresslevel=9, mtime=0)
+    fd, tmp_path = tempfile.mkstemp(dir=get_pack_dir(), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return Pack(topic.id, digest, path, len(data)), True
+
+
+def prune_packs(keep):
+    """
+    Удаление файлов пакетов, которых нет в keep
+
+    Args:
+        keep: Множество путей актуальных пакетов
+
+    Returns:
+        int: Количество удаленных файлов
+    """
+    pack_dir = get_pack_dir()
+    if not os.path.isdir(pack_dir):
+        return 0
+    removed = 0
+    for name in os.listdir(pack_dir):
+        path = os.path.join(pack_dir, name)
+        if name.startswith('topic-') and name.endswith('.json.gz') and path not in keep:
+            os.unlink(path)
+            removed += 1
+    return removed
+
+
+_packs = {}
+_packs_lock = threading.Lock()
+
+
+def get_pack(topic_id):
+    """
+    Актуальный пакет темы
+
+    Пока поколение каталога не изменилось, пакет берется из памяти
+    процесса без чтения каталога и диска.
+
+    Returns:
+        Pack | None: None, если темы нет
+    """
+    snapshot = get_snapshot()
+    topic = snapshot.get_topic(topic_id)
+    if topic is None:
+        return None
+
+    cached = _packs.get(topic.id)
+    if cached is not None and cached[0] == snapshot.generation and os.path.exists(cached[1].path):
+        return cached[1]
+
+    pack, _ = build_pack(topic)
+    with _packs_lock:
+        _packs[topic.id] = (snapshot.generation, pack)
+    return pack
@@ -27,6 +27,9 @@ from .api_views import (
     # Leaderboard & Stats
     leaderboard_api,
     user_stats_api,
+    
+    # Sync
+    sync_api,
 )
 
 # Router для ViewSets
@@ -53,6 +56,9 @@ urlpatterns = [
     path('leaderboard/', leaderboard_api, name='api_leaderboard'),
     path('stats/', user_stats_api, name='api_stats'),
     
+    # ==================== Синхронизация ====================
+    path('sync/', sync_api, name='api_sync'),
+    
     # ==================== ViewSets (subjects, topics, tasks) ====================
     path('', include(router.urls)),
 ]
@@ -6,109 +6,92 @@ from django.contrib import messages
 from django.conf import settings
 
 from rest_framework import viewsets, status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, throttle_classes
 from rest_framework.response import Response
 from .models import Subject, Task, UserProfile, Leaderboard
 from django.contrib.auth.models import User
 
+from .conditional import catalog_condition, main_etag
+from .page_cache import LEADERBOARD, LEADERBOARD_TIMEOUT, anonymous_page_cache
 from .serializers import SubjectSerializer, TaskSerializer, UserProfileSerializer, LeaderboardSerializer
+from .throttling import AIRateThrottle
 
 # Django view для главной страницы
 from django.views import View
 from django.shortcuts import render
 
+@catalog_condition(etag_func=main_etag)
+@anonymous_page_cache()
 def main_view(request):
-    from .models import Task, TaskAttempt
-    from django.db.models import Count, Q
+    from .caching import get_catalog_stats
+    from .catalog import get_snapshot
+    from .progress import get_subject_solved_counts
     
-    # Оптимизированный запрос с annotate для устранения N+1
-    if request.user.is_authenticated:
-        subjects = Subject.objects.annotate(
-            total_tasks=Count('tasks', distinct=True),
-            completed_tasks=Count(
-                'tasks',
-                filter=Q(tasks__taskattempt__user=request.user, tasks__taskattempt__is_solved=True),
-                distinct=True
-            )
-        )
-    else:
-        subjects = Subject.objects.annotate(
-            total_tasks=Count('tasks', distinct=True)
-        )
+    # Предметы с количеством задач из снимка каталога в памяти
+    subjects = get_snapshot().subjects
+    
+    # Решенные задачи берем из счетчиков прогресса (один индексный запрос)
+    solved_counts = get_subject_solved_counts(request.user) if request.user.is_authenticated else {}
 
     # Добавляем информацию о прогрессе к каждому предмету
+    # (записи снимка общие для всех запросов, поэтому собираем словари)
     subjects_with_progress = []
     for subject in subjects:
-        total = subject.total_tasks or 0
-        completed = subject.completed_tasks if request.user.is_authenticated else 0
+        total = subject.total_tasks
+        completed = solved_counts.get(subject.id, 0)
         percentage = int((completed / total) * 100) if total > 0 else 0
 
-        subject.completed = completed
-        subject.total = total
-        subject.percentage = percentage
-        subjects_with_progress.append(subject)
+        subjects_with_progress.append(subject.as_dict(
+            completed=completed,
+            total=total,
+            percentage=percentage,
+        ))
     
     # Статистика для главной страницы (кэшируем на 5 минут)
-    from django.core.cache import cache
-    stats = cache.get('main_stats')
-    if stats is None:
-        stats = {
-            'total_users': User.objects.count(),
-            'total_tasks': Task.objects.count(),
-            'total_subjects': Subject.objects.count(),
-        }
-        cache.set('main_stats', stats, 300)  # 5 минут
+    stats = get_catalog_stats()
     
     return render(request, 'main.html', {
         'subjects': subjects_with_progress,
         'stats': stats
     })
 
+@catalog_condition
+@anonymous_page_cache()
 def subject_view(request, subject_id):
-    from .models import Task, Topic, UserProgress, TaskAttempt
-    from django.db.models import Prefetch
+    from django.http import Http404
+    from .catalog import get_snapshot
+    from .progress import get_subject_solved_counts, get_topic_solved_counts
     
-    subject = get_object_or_404(Subject, id=subject_id)
+    subject = get_snapshot().get_subject(subject_id)
+    if subject is None:
+        raise Http404("Subject not found")
     
-    # Оптимизированная загрузка тем с задачами
-    topics = Topic.objects.filter(subject=subject).prefetch_related(
-        Prefetch('tasks', queryset=Task.objects.only('id', 'topic_id', 'order'))
-    )
-    
-    # Получаем все решенные задачи одним запросом
-    solved_task_ids = set()
-    if request.user.is_authenticated:
-        solved_task_ids = set(
-            TaskAttempt.objects.filter(
-                user=request.user,
-                task__subject=subject,
-                is_solved=True
-            ).values_list('task_id', flat=True)
-        )
-    
-    # Calculate progress for each topic
+    # Решенные задачи берем из счетчиков прогресса
+    topic_solved = {}
     total_completed = 0
-    for topic in topics:
-        topic.total_count = topic.tasks.count()
-        
-        # Подсчет решенных задач из предзагруженного набора
-        if request.user.is_authenticated:
-            topic.completed_count = sum(1 for task in topic.tasks.all() if task.id in solved_task_ids)
-            total_completed += topic.completed_count
-        else:
-            topic.completed_count = 0
-        
-        topic.progress_dots = range(min(topic.total_count, 4))  # Show max 4 dots
-        topic.is_completed = (topic.completed_count == topic.total_count and topic.total_count > 0)
+    if request.user.is_authenticated:
+        topic_solved = get_topic_solved_counts(request.user, subject.id)
+        total_completed = get_subject_solved_counts(request.user).get(subject.id, 0)
+    
+    # Calculate progress for each topic (темы и количество задач - из снимка каталога)
+    topics = []
+    for topic in subject.topics:
+        completed_count = topic_solved.get(topic.id, 0)
+        topics.append(topic.as_dict(
+            total_count=topic.total_tasks,
+            completed_count=completed_count,
+            progress_dots=range(min(topic.total_tasks, 4)),  # Show max 4 dots
+            is_completed=(completed_count == topic.total_tasks and topic.total_tasks > 0),
+        ))
     
     # Calculate overall progress
-    total_tasks = Task.objects.filter(subject=subject).count()
+    total_tasks = subject.total_tasks
     progress_percentage = int((total_completed / total_tasks * 100)) if total_tasks > 0 else 0
     
     context = {
         'subject': subject,
         'topics': topics,
-        'total_items': topics.count(),
+        'total_items': len(topics),
         'total_tasks': total_tasks,
         'completed_tasks': total_completed,
         'progress_percentage': progress_percentage,
@@ -116,74 +99,75 @@ def subject_view(request, subject_id):
     return render(request, 'subject.html', context)
 
 def topic_view(request, topic_id):
-    from .models import Task, Topic, TaskAttempt
-    topic = Topic.objects.get(id=topic_id)
-    tasks = Task.objects.filter(topic=topic).order_by('order')
-    
-    # Redirect to first task if tasks exist
-    if tasks.exists():
-        if request.user.is_authenticated:
-            # 1) Продолжаем с последней открытой задачи в этой теме
-            last_attempt = (
-                TaskAttempt.objects
-                .filter(user=request.user, task_id__in=tasks.values_list('id', flat=True))
-                .select_related('task')
-                .order_by('-updated_at')
-                .first()
-            )
-            if last_attempt and not last_attempt.is_solved:
-                return redirect(f'/task/{last_attempt.task.id}/')
-
-            # 2) Если последняя открытая задача решена — переходим на первую нерешённую
-            solved_task_ids = set(
-                TaskAttempt.objects.filter(
-                    user=request.user,
-                    task_id__in=tasks.values_list('id', flat=True),
-                    is_solved=True,
-                ).values_list('task_id', flat=True)
-            )
-            unsolved_tasks = tasks.exclude(id__in=solved_task_ids)
-            if unsolved_tasks.exists():
-                return redirect(f'/task/{unsolved_tasks.first().id}/')
-        first_task = tasks.first()
-        return redirect(f'/task/{first_task.id}/')
-    else:
-        # No tasks, redirect back to subject
+    from django.http import Http404
+    from .catalog import get_snapshot
+    from .navigation import get_last_viewed
+    from .progress import get_attempts_map
+    
+    snapshot = get_snapshot()
+    topic = snapshot.get_topic(topic_id)
+    if topic is None:
+        raise Http404("Topic not found")
+    tasks = snapshot.tasks_for_topic(topic.id)
+    
+    # No tasks, redirect back to subject
+    if not tasks:
         return redirect(f'/subject/{topic.subject.id}/')
+    
+    if request.user.is_authenticated:
+        attempts = get_attempts_map(request.user, [task.id for task in tasks])
+        
+        # 1) Продолжаем с последней открытой задачи в этой теме (указатель в кэше)
+        last_task = snapshot.get_task(get_last_viewed(request.user.id, topic.id))
+        if last_task is not None and last_task.topic_id == topic.id:
+            if not attempts.get(last_task.id, (0, False))[1]:
+                return redirect(f'/task/{last_task.id}/')
+        
+        # 2) Если последняя открытая задача решена — переходим на первую нерешённую
+        for task in tasks:
+            if not attempts.get(task.id, (0, False))[1]:
+                return redirect(f'/task/{task.id}/')
+    
+    return redirect(f'/task/{tasks[0].id}/')
 
 def task_view(request, task_id):
-    from .models import Task, TaskAttempt, UserProfile, Leaderboard
-    from django.http import JsonResponse
+    from .models import Task, TaskAttempt, UserProfile
+    from .services import TaskService
+    from .navigation import get_task_position, remember_last_viewed
+    from .caching import get_task
+    from .og_images import content_hash as og_content_hash
+    from django.http import JsonResponse, Http404
     import logging
     
     # Импортируем AI helper с обработкой ошибок
     try:
-        from .ai_helper import get_theory_lesson, get_hint, get_ai_response
+        from .ai_helper import get_ai_response
+        from .ai_content import HINT, THEORY, get_content as get_ai_content
     except ImportError as e:
         logging.error(f"Failed to import AI helper: {e}")
         # Создаем заглушки если импорт не удался
-        def get_theory_lesson(*args, **kwargs):
-            return "⚠️ AI помощник временно недоступен"
-        def get_hint(*args, **kwargs):
+        THEORY, HINT = 'theory', 'hint'
+        def get_ai_content(*args, **kwargs):
             return "⚠️ AI помощник временно недоступен"
         def get_ai_response(*args, **kwargs):
             return "⚠️ AI помощник временно недоступен"
     
     logger = logging.getLogger(__name__)
     
-    task = get_object_or_404(Task.objects.select_related('subject', 'topic'), id=task_id)
+    task = get_task(task_id)
+    if task is None:
+        raise Http404("Task not found")
     result = None
     ai_reply = None
     points_earned = 0
     attempt_info = None
     
-    # Получаем или создаем запись о попытках для авторизованного пользователя
+    # Запись о попытках только читаем: она создается при первом ответе
+    # (TaskService.submit_answer), а просмотр лишь обновляет указатель в кэше
     if request.user.is_authenticated:
-        attempt, created = TaskAttempt.objects.get_or_create(
-            user=request.user,
-            task=task
-        )
-        attempt_info = attempt
+        attempt_info = TaskAttempt.objects.filter(user=request.user, task_id=task.id).first()
+        if request.method == 'GET':
+            remember_last_viewed(request.user.id, task)
         logger.info(f"User {request.user.id} viewing task {task_id}")
     
     if request.method == 'POST':
@@ -193,23 +177,22 @@ def task_view(request, task_id):
         try:
             # Проверка rate limit для AI запросов
             if 'theory' in request.POST or 'hint' in request.POST or 'ai_message' in request.POST:
-                from django.core.cache import cache
+                import math
+                from .ratelimit import AI, client_ident, get_policy, hit
                 
-                # Создаем ключ для rate limiting
-                user_key = f'ai_limit_{request.user.id if request.user.is_authenticated else request.META.get("REMOTE_ADDR")}'
-                requests_count = cache.get(user_key, 0)
+                # Тот же лимит, что и у AIRateThrottle в API
+                ident = client_ident(request)
+                limit = hit(get_policy(AI), ident)
                 
-                if requests_count >= 10:  # Максимум 10 AI запросов в час
-                    logger.warning(f"AI rate limit exceeded for {user_key}")
+                if not limit.allowed:
+                    logger.warning(f"AI rate limit exceeded for {ident}")
+                    error = f'Превышен лимит AI запросов. Попробуйте через {math.ceil(limit.retry_after / 60)} мин.'
                     if is_ajax:
-                        return JsonResponse({
-                            'error': 'Превышен лимит AI запросов. Попробуйте через час.'
-                        }, status=429)
-                    messages.error(request, 'Превышен лимит AI запросов. Попробуйте через час.')
+                        response = JsonResponse({'error': error}, status=429)
+                        response['Retry-After'] = str(limit.retry_after)
+                        return response
+                    messages.error(request, error)
                     return redirect(f'/task/{task_id}/')
-                
-                # Увеличиваем счетчик
-                cache.set(user_key, requests_count + 1, 3600)  # 1 час
             
             if 'request_theory' in request.POST:
                 # Запрос теории через модальное окно
@@ -219,7 +202,8 @@ def task_view(request, task_id):
                     from django.utils import translation
                     current_language = translation.get_language()
                     
-                    theory_text = get_theory_lesson(task.question, task.subject.title, language=current_language)
+                    # Теория заранее сгенерирована (pregenerate_ai_content) и берется из БД
+                    theory_text = get_ai_content(task, THEORY, current_language)
                     if is_ajax:
                         return JsonResponse({'success': True, 'theory': theory_text})
                 except Exception as e:
@@ -231,13 +215,14 @@ def task_view(request, task_id):
                 logger.info(f"AI theory request for task {task_id} by user {request.user.id if request.user.is_authenticated else 'anonymous'}")
                 from django.utils import translation
                 current_language = translation.get_language()
-                ai_reply = get_theory_lesson(task.question, task.subject.title, language=current_language)
+                ai_reply = get_ai_content(task, THEORY, current_language)
                 if is_ajax:
                     return JsonResponse({'ai_reply': ai_reply})
             elif 'hint' in request.POST:
                 # Запрос подсказки
                 logger.info(f"AI hint request for task {task_id} by user {request.user.id if request.user.is_authenticated else 'anonymous'}")
-                ai_reply = get_hint(task.question, task.subject.title)
+                from django.utils import translation
+                ai_reply = get_ai_content(task, HINT, translation.get_language())
                 if is_ajax:
                     return JsonResponse({'ai_reply': ai_reply})
             elif 'ai_message' in request.POST:
@@ -261,52 +246,18 @@ def task_view(request, task_id):
                     messages.error(request, 'Ответ не может быть пустым')
                     return redirect(f'/task/{task_id}/')
                 
-                if len(answer) > 100:
+                if len(answer) > TaskService.MAX_ANSWER_LENGTH:
                     if is_ajax:
                         return JsonResponse({'error': 'Ответ слишком длинный'}, status=400)
                     messages.error(request, 'Ответ слишком длинный')
                     return redirect(f'/task/{task_id}/')
                 
-                is_correct = (answer == task.correct_answer)
-                result = is_correct
-                
-                logger.info(f"User {request.user.id if request.user.is_authenticated else 'anonymous'} submitted answer for task {task_id}: {'correct' if is_correct else 'incorrect'}")
-                
                 # Обработка попыток и начисление очков для авторизованных пользователей
-                if request.user.is_authenticated and attempt_info:
-                    if not attempt_info.is_solved:
-                        attempt_info.attempts += 1
-                        
-                        if is_correct:
-                            # Задача решена правильно
-                            attempt_info.is_solved = True
-                            
-                            # Начисление очков: 100% за первую попытку, 50% за последующие
-                            base_points = task.difficulty * 5  # 5 очков за уровень сложности
-                            if attempt_info.attempts == 1:
-                                points_earned = base_points
-                            else:
-                                points_earned = base_points // 2  # Половина очков
-                            
-                            attempt_info.points_earned = points_earned
-                            
-                            # Обновляем профиль пользователя
-                            try:
-                                profile, created = UserProfile.objects.get_or_create(user=request.user)
-                                profile.xp += points_earned
-                                profile.save()
-                                
-                                # Обновляем таблицу лидеров
-                                leaderboard, _ = Leaderboard.objects.get_or_create(user_profile=profile)
-                                leaderboard.points = profile.xp
-                                leaderboard.save()
-                                
-                                logger.info(f"Awarded {points_earned} points to user {request.user.id}")
-                            except Exception as e:
-                                logger.error(f"Error awarding points: {e}", exc_info=True)
-                        
-                        attempt_info.save()
+                if request.user.is_authenticated:
+                    attempt_info, is_correct, points_earned = TaskService.submit_answer(request.user, task, answer)
                 else:
+                    is_correct = TaskService.check_answer(task, answer)
+                    
                     # Обработка для незарегистрированных пользователей
                     # Инициализируем сессионные данные если их нет
                     if 'guest_task_attempts' not in request.session:
@@ -326,12 +277,8 @@ def task_view(request, task_id):
                     request.session['guest_task_attempts'] = guest_attempts
                     
                     if is_correct:
-                        # Начисляем очки незарегистрированному пользователю
-                        base_points = task.difficulty * 5
-                        if current_attempts == 1:
-                            points_earned = base_points
-                        else:
-                            points_earned = base_points // 2
+                        # Начисляем очки незарегистрированному пользователю по тем же правилам
+                        points_earned = TaskService._calculate_points(task, current_attempts)
                         
                         # Добавляем очки к общему счету гостя
                         request.session['guest_xp'] = request.session.get('guest_xp', 0) + points_earned
@@ -339,24 +286,18 @@ def task_view(request, task_id):
                         
                         logger.info(f"Awarded {points_earned} points to guest user. Total: {request.session['guest_xp']}")
                 
+                result = is_correct
+                logger.info(f"User {request.user.id if request.user.is_authenticated else 'anonymous'} submitted answer for task {task_id}: {'correct' if is_correct else 'incorrect'}")
+                
                 # Если это AJAX запрос, возвращаем JSON
                 if is_ajax:
-                    # Находим следующую задачу
-                    next_task_id = None
-                    if task.topic:
-                        topic_tasks = Task.objects.filter(topic=task.topic).order_by('order')
-                        task_list = list(topic_tasks)
-                        try:
-                            current_index = task_list.index(task)
-                            if current_index < len(task_list) - 1:
-                                next_task_id = task_list[current_index + 1].id
-                        except ValueError:
-                            pass
+                    # Находим следующую задачу по индексу навигации темы
+                    _, _, next_task_id, _ = get_task_position(task)
                     
                     # Получаем количество попыток
                     if request.user.is_authenticated and attempt_info:
                         attempts_count = attempt_info.attempts
-                        total_xp = UserProfile.objects.get(user=request.user).xp if UserProfile.objects.filter(user=request.user).exists() else 0
+                        total_xp = UserProfile.objects.filter(user=request.user).values_list('xp', flat=True).first() or 0
                     else:
                         # Для незарегистрированных пользователей
                         task_key = str(task_id)
@@ -379,31 +320,10 @@ def task_view(request, task_id):
             messages.error(request, 'Произошла ошибка. Попробуйте позже.')
             return redirect(f'/task/{task_id}/')
     
-    # Получаем все задачи этой темы для навигации и правильного счетчика X из N
+    # Позиция задачи и соседи из индекса навигации темы (без запросов к БД).
     # Важно: счетчик и навигация должны считаться по полному списку задач темы,
     # а продолжение "с места" обеспечивается topic_view (редирект на первую нерешённую).
-    if task.topic:
-        topic_tasks = Task.objects.filter(topic=task.topic).order_by('order')
-        task_list = list(topic_tasks)
-        total_tasks = len(task_list)
-
-        # Находим текущую позицию в ПОЛНОМ списке
-        try:
-            current_index = task_list.index(task)
-            current_number = current_index + 1
-
-            # Предыдущая и следующая задачи
-            prev_task = task_list[current_index - 1] if current_index > 0 else None
-            next_task = task_list[current_index + 1] if current_index < len(task_list) - 1 else None
-        except ValueError:
-            current_number = 1
-            prev_task = None
-            next_task = None
-    else:
-        total_tasks = 1
-        current_number = 1
-        prev_task = None
-        next_task = None
+    current_number, prev_task_id, next_task_id, total_tasks = get_task_position(task)
     
     import json
     
@@ -413,36 +333,61 @@ def task_view(request, task_id):
         'ai_reply': ai_reply,
         'total_tasks': total_tasks,
         'current_number': current_number,
-        'prev_task': prev_task,
-        'next_task': next_task,
+        'prev_task_id': prev_task_id,
+        'next_task_id': next_task_id,
         'points_earned': points_earned,
         'attempt_info': attempt_info,
         'task_options_json': json.dumps(task.options) if task.options else '{}',
+        'og_image_version': og_content_hash(task),
     }
     return render(request, 'task.html', context)
 
+@anonymous_page_cache(LEADERBOARD, timeout=LEADERBOARD_TIMEOUT)
 def leaderboard_view(request):
-    from .models import Leaderboard, UserProfile
-    # Сортируем по очкам в порядке убывания
-    leaderboard = Leaderboard.objects.select_related('user_profile__user').order_by('-points')
+    from .models import UserProfile
+    from . import rank_index
+    from .leaderboard import (
+        get_leaderboard_page, get_leaderboard_window, clamp,
+        DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, DEFAULT_WINDOW, MAX_WINDOW,
+    )
+    cursor = request.GET.get('cursor')
+    limit = clamp(request.GET.get('limit'), DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
     
     # Получаем позицию и очки текущего пользователя
+    user_profile = None
     user_rank = None
     user_points = 0
-    total_users = leaderboard.count()
+    total_users = rank_index.count()
     
     if request.user.is_authenticated:
         try:
             user_profile = UserProfile.objects.get(user=request.user)
             user_points = user_profile.xp
             
-            # Находим позицию пользователя в рейтинге
-            user_rank = Leaderboard.objects.filter(points__gt=user_points).count() + 1
+            # Находим позицию пользователя в рейтинге (O(log n) по индексу)
+            user_rank = rank_index.rank_for_points(user_points)
         except UserProfile.DoesNotExist:
             pass
     
+    # Рендерим только видимое окно, а не всю таблицу
+    around_me = request.GET.get('around') == 'me' and user_profile is not None
+    if around_me:
+        window = clamp(request.GET.get('window'), DEFAULT_WINDOW, MAX_WINDOW)
+        leaderboard, next_cursor = get_leaderboard_window(user_profile, window)
+        podium, _ = get_leaderboard_page(limit=3)
+    elif cursor:
+        leaderboard, next_cursor = get_leaderboard_page(cursor, limit)
+        podium, _ = get_leaderboard_page(limit=3)
+    else:
+        leaderboard, next_cursor = get_leaderboard_page(limit=limit)
+        podium, leaderboard = leaderboard[:3], leaderboard[3:]
+    
     context = {
+        'podium': podium,
         'leaderboard': leaderboard,
+        'next_cursor': next_cursor,
+        'is_first_page': not cursor and not around_me,
+        'around_me': around_me,
         'user_rank': user_rank,
         'user_points': user_points,
         'total_users': total_users,
@@ -540,6 +485,38 @@ def logout_view(request):
     logout(request)
     return redirect('/')
 
+def language_view(request, language):
+    """
+    Переключение языка ссылкой (GET) вместо формы set_language
+
+    Страницы для анонимов кэшируются целиком (core.page_cache), поэтому
+    в base.html не должно быть csrf_token.
+
+    Args:
+        language: Код языка из settings.LANGUAGES
+    """
+    from django.http import Http404
+    from django.utils.http import url_has_allowed_host_and_scheme
+    
+    if language not in dict(settings.LANGUAGES):
+        raise Http404("Unknown language")
+    
+    next_url = request.GET.get('next', '/')
+    if not url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}, require_https=request.is_secure()):
+        next_url = '/'
+    
+    response = redirect(next_url)
+    response.set_cookie(
+        settings.LANGUAGE_COOKIE_NAME, language,
+        max_age=settings.LANGUAGE_COOKIE_AGE,
+        path=settings.LANGUAGE_COOKIE_PATH,
+        domain=settings.LANGUAGE_COOKIE_DOMAIN,
+        secure=settings.LANGUAGE_COOKIE_SECURE,
+        httponly=settings.LANGUAGE_COOKIE_HTTPONLY,
+        samesite=settings.LANGUAGE_COOKIE_SAMESITE,
+    )
+    return response
+
 def password_reset_view(request):
     """Запрос на сброс пароля по номеру телефона"""
     from .models import UserProfile
@@ -660,6 +637,7 @@ def admin_password_reset_view(request):
     return render(request, 'admin_password_reset.html', {'users': users})
 
 @api_view(['POST'])
+@throttle_classes([AIRateThrottle])
 def gmini_api(request):
     """
     Пример AI ассистента: принимает {"message": "..."}, возвращает ответ.
@@ -685,59 +663,58 @@ class LeaderboardViewSet(viewsets.ModelViewSet):
     serializer_class = LeaderboardSerializer
 
 
-def sitemap_view(request):
-    """Генерация XML sitemap для поисковых систем"""
-    from django.http import HttpResponse
-    from django.urls import reverse
-    from datetime import datetime
-    
-    subjects = Subject.objects.all()
-    
-    sitemap_xml = '''<?xml version="1.0" encoding="UTF-8"?>
-<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
-    <url>
-        <loc>https://hushyor.com/</loc>
-        <lastmod>{}</lastmod>
-        <changefreq>daily</changefreq>
-        <priority>1.0</priority>
-    </url>
-    <url>
-        <loc>https://hushyor.com/leaderboard/</loc>
-        <lastmod>{}</lastmod>
-        <changefreq>daily</changefreq>
-        <priority>0.8</priority>
-    </url>
-    <url>
-        <loc>https://hushyor.com/login/</loc>
-        <lastmod>{}</lastmod>
-        <changefreq>monthly</changefreq>
-        <priority>0.6</priority>
-    </url>
-    <url>
-        <loc>https://hushyor.com/register/</loc>
-        <lastmod>{}</lastmod>
-        <changefreq>monthly</changefreq>
-        <priority>0.6</priority>
-    </url>'''.format(
-        datetime.now().strftime('%Y-%m-%d'),
-        datetime.now().strftime('%Y-%m-%d'),
-        datetime.now().strftime('%Y-%m-%d'),
-        datetime.now().strftime('%Y-%m-%d')
-    )
+def _sitemap_file_response(request, path, etag):
+    """Готовый .xml.gz: как есть для клиентов с gzip, иначе распакованный"""
+    import gzip
+    from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+    from django.utils.http import parse_etags
     
-    # Добавляем страницы предметов
-    for subject in subjects:
-        sitemap_xml += '''
-    <url>
-        <loc>https://hushyor.com/subject/{}/</loc>
-        <lastmod>{}</lastmod>
-        <changefreq>weekly</changefreq>
-        <priority>0.9</priority>
-    </url>'''.format(subject.id, datetime.now().strftime('%Y-%m-%d'))
+    if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+    if '*' in if_none_match or etag in if_none_match:
+        response = HttpResponseNotModified()
+    elif 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response = FileResponse(open(path, 'rb'), content_type='application/xml')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        with open(path, 'rb') as packed:
+            response = HttpResponse(gzip.decompress(packed.read()), content_type='application/xml')
     
-    sitemap_xml += '\n</urlset>'
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=3600'
+    response['Vary'] = 'Accept-Encoding'
+    return response
+
+
+def _sitemap_response(request, number=None):
+    """
+    Файл из текущего набора sitemap
     
-    return HttpResponse(sitemap_xml, content_type='application/xml')
+    Набор, полученный до смены поколения каталога, мог быть удален
+    другим процессом; тогда файл берется из набора нового поколения.
+    """
+    from django.http import Http404
+    from .sitemap import get_sitemaps
+    
+    for retry in (False, True):
+        sitemaps = get_sitemaps()
+        path = sitemaps.path(number)
+        if path is None:
+            raise Http404("Sitemap section not found")
+        try:
+            return _sitemap_file_response(request, path, sitemaps.etag(number))
+        except FileNotFoundError:
+            if retry:
+                raise
+
+
+def sitemap_view(request):
+    """Индекс sitemap (core.sitemap): ссылки на разделы по 50 000 URL"""
+    return _sitemap_response(request)
+
+
+def sitemap_section_view(request, number):
+    """Раздел sitemap с предметами и задачами"""
+    return _sitemap_response(request, number)
 
 
 def robots_txt_view(request):
@@ -753,6 +730,7 @@ Disallow: /hushyor-control-panel/
 Disallow: /api/
 Disallow: /profile/
 Disallow: /logout/
+Disallow: /language/
 
 Sitemap: https://hushyor.com/sitemap.xml
 
@@ -770,54 +748,54 @@ def yandex_verification_view(request):
 
 def task_og_image_view(request, task_id):
     """Генерирует Open Graph изображение для задачи с поддержкой таджикского языка"""
-    from django.http import HttpResponse, Http404
-    from .models import Task
-    from .og_image_generator import generate_task_og_image
+    from django.http import FileResponse, HttpResponse, HttpResponseNotModified, Http404
+    from django.utils.http import parse_etags
+    from .catalog import get_snapshot
+    from .og_images import get_image as get_og_image
     import logging
     
     logger = logging.getLogger(__name__)
     
-    try:
-        task = Task.objects.select_related('subject').get(id=task_id)
-    except Task.DoesNotExist:
+    task = get_snapshot().get_task(task_id)
+    if task is None:
         logger.warning(f"Task {task_id} not found for OG image generation")
         raise Http404("Task not found")
     
     try:
-        # Генерируем изображение
-        image_buffer = generate_task_og_image(task)
+        # Готовый файл с диска; рендер только при изменении содержимого задачи
+        image, _ = get_og_image(task)
         
-        # Возвращаем PNG с правильными заголовками для кэширования
-        response = HttpResponse(image_buffer.getvalue(), content_type='image/png')
-        # Важно: no-cache для соцсетей, чтобы они не кэшировали пустые изображения
-        # После исправления можно изменить на: 'public, max-age=86400'
-        response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response['Pragma'] = 'no-cache'
-        response['Expires'] = '0'
-        # Добавляем заголовки для отладки
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if '*' in if_none_match or image.etag in if_none_match:
+            response = HttpResponseNotModified()
+        else:
+            response = FileResponse(open(image.path, 'rb'), content_type='image/png')
+        
+        response['ETag'] = image.etag
+        if request.GET.get('v') == image.digest:
+            # URL с хэшем содержимого (og:image на странице задачи) никогда не меняется
+            response['Cache-Control'] = 'public, max-age=31536000, immutable'
+        else:
+            response['Cache-Control'] = 'public, max-age=3600'
         response['X-Content-Type-Options'] = 'nosniff'
         return response
         
+
     except Exception as e:
         logger.error(f"Error generating OG image for task {task_id}: {str(e)}", exc_info=True)
         # Возвращаем простое изображение-заглушку в случае ошибки
-        from PIL import Image, ImageDraw, ImageFont
+        from PIL import Image, ImageDraw
         from io import BytesIO
-        import os
+        from .font_registry import get_font
         
         # Создаем простую заглушку
         img = Image.new('RGB', (1200, 630), color='#4F6DF5')
         draw = ImageDraw.Draw(img)
         
-        # Пытаемся загрузить шрифт для заглушки
+        # Шрифт для заглушки - из реестра шрифтов процесса
         try:
-            font_path = os.path.join(settings.BASE_DIR, 'core', 'fonts', 'DejaVuSans-Bold.ttf')
-            if os.path.exists(font_path):
-                font = ImageFont.truetype(font_path, 48)
-                draw.text((60, 280), "hushyor.com", fill='white', font=font)
-                draw.text((60, 340), "Ошибка загрузки изображения", fill='white', font=ImageFont.truetype(font_path, 32))
-            else:
-                draw.text((60, 300), "hushyor.com", fill='white')
+            draw.text((60, 280), "hushyor.com", fill='white', font=get_font(48, bold=True))
+            draw.text((60, 340), "Ошибка загрузки изображения", fill='white', font=get_font(32, bold=True))
         except Exception as font_error:
             logger.error(f"Error loading font for fallback image: {str(font_error)}")
             # Последний fallback без шрифтов